@@ -0,0 +1,74 @@
+"""
+Session lookups and stores against an axolotl.db, and an axolotl.log, holding many sessions.
+
+Usage: python benchmarks/axolotl_db_benchmark.py [sessions]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from axolotl.state.sessionrecord import SessionRecord
+from axolotl.state.sessionstate import SessionState
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.axolotl.store.log.logaxolotlstore import LogAxolotlStore
+
+
+def session_record():
+    state = SessionState()
+    state.setSessionVersion(3)
+    state.setRemoteRegistrationId(random.randint(1, 16380))
+    state.setLocalRegistrationId(random.randint(1, 16380))
+    return SessionRecord(sessionState=state)
+
+
+def bench(sessions, backend, lookups=20000, stores=2000):
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        if backend == "log":
+            store = LogAxolotlStore(os.path.join(directory, "axolotl.log"))
+            record = session_record()
+            store.storeSessions([(str(100000000 + i), 1, record) for i in range(0, sessions)])
+        else:
+            db = os.path.join(directory, "axolotl.db")
+            store = LiteAxolotlStore(db, wal=True) if backend == "wal" else LiteAxolotlStore(db)
+            conn = store.sessionStore.dbConn
+            record = session_record().serialize()
+            with conn:
+                conn.executemany("INSERT INTO sessions(recipient_id, device_id, record) VALUES(?,?,?)",
+                                 ((str(100000000 + i), 1, record) for i in range(0, sessions)))
+        populate = time.time() - start
+
+        recipients = [str(100000000 + random.randrange(0, sessions)) for _ in range(0, lookups)]
+        start = time.time()
+        for recipient in recipients:
+            store.loadSession(recipient, 1)
+        load = lookups / (time.time() - start)
+
+        start = time.time()
+        for recipient in recipients[:lookups // 2]:
+            store.containsSession(recipient, 1)
+        contains = lookups // 2 / (time.time() - start)
+
+        records = [session_record() for _ in range(0, stores)]
+        start = time.time()
+        for recipient, record in zip(recipients, records):
+            store.storeSession(recipient, 1, record)
+        store_rate = stores / (time.time() - start)
+
+        print("%-8s %d sessions: populate %5.2fs, loadSession %7.0f/s, containsSession %7.0f/s, "
+              "storeSession %6.0f/s" % (backend, sessions, populate, load, contains, store_rate))
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for backend in ("default", "wal", "log"):
+        bench(sessions, backend)
@@ -0,0 +1,78 @@
+"""
+Decrypt throughput of 1:1 and group messages against an on-disk LiteAxolotlStore, with and without
+CachedAxolotlStore in front of it.
+
+Usage: python benchmarks/axolotl_store_benchmark.py [messages]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from axolotl.state.prekeybundle import PreKeyBundle
+from yowsup.axolotl.manager import AxolotlManager
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+try:
+    from yowsup.axolotl.store.cachedaxolotlstore import CachedAxolotlStore
+except ImportError:
+    CachedAxolotlStore = None
+
+
+def create_manager(store, username):
+    manager = AxolotlManager(store, username)
+    # python-axolotl fails to decrypt block-aligned plaintexts, keep the padding fixed
+    manager._generate_random_padding = lambda: b"\x01"
+    return manager
+
+
+def setup(store):
+    bob = create_manager(store, "2")
+    alice = create_manager(LiteAxolotlStore(":memory:"), "1")
+    prekey = bob.level_prekeys()[0]
+    signed_prekey = bob.generate_signed_prekey()
+    alice.create_session("2", PreKeyBundle(
+        bob.registration_id, 1, prekey.getId(), prekey.getKeyPair().getPublicKey(),
+        signed_prekey.getId(), signed_prekey.getKeyPair().getPublicKey(), signed_prekey.getSignature(),
+        bob.identity.getPublicKey()
+    ), autotrust=True)
+    bob.decrypt_pkmsg("1", alice.encrypt("2", b"hello").serialize(), True)
+    alice.decrypt_msg("2", bob.encrypt("1", b"hi").serialize(), True)
+    bob.group_create_session("group", "1", alice.group_create_skmsg("group").serialize())
+    return alice, bob
+
+
+def bench(cached, count):
+    directory = tempfile.mkdtemp()
+    try:
+        store = LiteAxolotlStore(os.path.join(directory, "axolotl.db"))
+        if cached:
+            store = CachedAxolotlStore(store)
+        alice, bob = setup(store)
+        messages = [alice.encrypt("2", b"message").serialize() for _ in range(0, count)]
+        start = time.time()
+        for message in messages:
+            bob.decrypt_msg("1", message, True)
+        bob.flush()
+        direct = count / (time.time() - start)
+
+        messages = [alice.group_encrypt("group", b"message") for _ in range(0, count)]
+        start = time.time()
+        for message in messages:
+            bob.group_decrypt("group", "1", message)
+        bob.flush()
+        group = count / (time.time() - start)
+        print("%-20s 1:1 %8.0f msg/s   group %8.0f msg/s" % (
+            "CachedAxolotlStore" if cached else "LiteAxolotlStore", direct, group
+        ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bench(False, count)
+    if CachedAxolotlStore is not None:
+        bench(True, count)
@@ -0,0 +1,114 @@
+"""
+Benchmarks for the binary stanza coder (yowsup.layers.coder).
+
+Runs against the pure python coder, and the compiled one when it is built.
+
+Usage: python benchmarks/coder_benchmark.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.structs import ProtocolTreeNode
+from yowsup.layers.coder import encoder as pyencoder, decoder as pydecoder
+from yowsup.layers.coder.tokendictionary import TokenDictionary
+try:
+    from yowsup.layers.coder import _coder
+except ImportError:
+    _coder = None
+
+IMPLEMENTATIONS = [("python", pydecoder.ReadDecoder, pyencoder.WriteEncoder)]
+if _coder is not None:
+    IMPLEMENTATIONS.append(("compiled", _coder.ReadDecoder, _coder.WriteEncoder))
+
+
+def message_stanza():
+    return ProtocolTreeNode("message", {
+        "id": "3EB0C127D7BACC83D6A1", "type": "text", "t": "1557226221",
+        "from": "491234567890@s.whatsapp.net", "notify": "Someone"
+    }, [ProtocolTreeNode("enc", {"v": "2", "type": "msg"}, data=os.urandom(180))])
+
+
+def group_info_stanza(participants=256):
+    return ProtocolTreeNode("iq", {"from": "g.us", "id": "1", "type": "result"}, [
+        ProtocolTreeNode("group", {
+            "id": "491234567890-1557226221", "creator": "491234567890@s.whatsapp.net",
+            "creation": "1557226221", "subject": "A group"
+        }, [
+            ProtocolTreeNode("participant", {"jid": "49%010d@s.whatsapp.net" % i, "type": "admin" if i == 0 else "none"})
+            for i in range(0, participants)
+        ])
+    ])
+
+
+def media_stanza(size=100 * 1024):
+    return ProtocolTreeNode("message", {
+        "id": "3EB0C127D7BACC83D6A2", "type": "media", "t": "1557226221",
+        "from": "491234567890@s.whatsapp.net"
+    }, [ProtocolTreeNode("enc", {"v": "2", "type": "msg", "mediatype": "image"}, data=os.urandom(size))])
+
+
+def receipt_list_stanza(jids=128):
+    return ProtocolTreeNode("receipt", {"id": "3EB0C127D7BACC83D6A3", "from": "491234567890-1557226221@g.us"}, [
+        ProtocolTreeNode("list", {}, [
+            ProtocolTreeNode("item", {"jid": "49%010d@s.whatsapp.net" % i, "t": "%d" % (1557226221 + i)})
+            for i in range(0, jids)
+        ])
+    ])
+
+
+STANZAS = (
+    ("message", message_stanza()),
+    ("group-info/256", group_info_stanza(256)),
+    ("group-info/1024", group_info_stanza(1024)),
+    ("media/100KB", media_stanza()),
+    ("receipts/128", receipt_list_stanza(128)),
+)
+
+
+def bench_packed(iterations, ReadDecoder, WriteEncoder):
+    """
+    Micro-benchmark of the nibble/hex packed paths, which every phone number JID goes through
+    """
+    tokenDictionary = TokenDictionary()
+    encoder = WriteEncoder(tokenDictionary)
+    decoder = ReadDecoder(tokenDictionary)
+    jids = ["49%010d@s.whatsapp.net" % i for i in range(0, 1000)]
+    nodes = [ProtocolTreeNode("item", {"jid": jid}) for jid in jids]
+    encoded = [bytes(bytearray(encoder.protocolTreeNodeToBytes(node))) for node in nodes]
+
+    elapsed = timeit.timeit(lambda: [encoder.protocolTreeNodeToBytes(node) for node in nodes], number=iterations)
+    print("pack   %-16s %8d jids  %10.2f us/jid" % ("nibble", len(jids), elapsed / iterations / len(jids) * 1e6))
+    elapsed = timeit.timeit(lambda: [decoder.getProtocolTreeNode(bytearray(data)) for data in encoded],
+                            number=iterations)
+    print("unpack %-16s %8d jids  %10.2f us/jid" % ("nibble", len(jids), elapsed / iterations / len(jids) * 1e6))
+
+
+def bench_decode(iterations, ReadDecoder, WriteEncoder):
+    tokenDictionary = TokenDictionary()
+    encoder = WriteEncoder(tokenDictionary)
+    decoder = ReadDecoder(tokenDictionary)
+    for name, node in STANZAS:
+        data = bytes(bytearray(encoder.protocolTreeNodeToBytes(node)))
+        assert decoder.getProtocolTreeNode(bytearray(data)) == node
+        elapsed = timeit.timeit(lambda: decoder.getProtocolTreeNode(bytearray(data)), number=iterations)
+        print("decode %-16s %8d bytes %10.1f us/stanza" % (name, len(data), elapsed / iterations * 1e6))
+
+
+def bench_encode(iterations, ReadDecoder, WriteEncoder):
+    encoder = WriteEncoder(TokenDictionary())
+    for name, node in STANZAS:
+        size = len(encoder.protocolTreeNodeToBytes(node))
+        elapsed = timeit.timeit(lambda: encoder.protocolTreeNodeToBytes(node), number=iterations)
+        print("encode %-16s %8d bytes %10.1f us/stanza" % (name, size, elapsed / iterations * 1e6))
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, ReadDecoder, WriteEncoder in IMPLEMENTATIONS:
+        print("[%s]" % name)
+        bench_encode(iterations, ReadDecoder, WriteEncoder)
+        bench_decode(iterations, ReadDecoder, WriteEncoder)
+        bench_packed(iterations, ReadDecoder, WriteEncoder)
@@ -0,0 +1,99 @@
+"""
+Stanzas per second through the core layers (logger, coder, noise, noise segments) after a noise handshake with a
+local responder stand-in. Received stanzas are encrypted and framed by the stand-in and handed to the stack in 64 KiB
+reads, like a dispatcher would. Sent stanzas are encoded and encrypted down to the bottom of the stack.
+
+Usage: python benchmarks/core_layers_benchmark.py [stanzas]
+"""
+import logging
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from consonance.structs.keypair import KeyPair
+from dissononce.dh.x25519.x25519 import X25519DH
+from yowsup.config.v1.config import Config
+from yowsup.layers import YowLayer, YowLayerEvent
+from yowsup.layers.auth.layer_authentication import YowAuthenticationProtocolLayer
+from yowsup.layers.coder import YowCoderLayer
+from yowsup.layers.coder.encoder import WriteEncoder
+from yowsup.layers.coder.tokendictionary import TokenDictionary
+from yowsup.layers.logger import YowLoggerLayer
+from yowsup.layers.noise.layer import YowNoiseLayer
+from yowsup.layers.noise.layer_noise_segments import YowNoiseSegmentsLayer
+from yowsup.layers.noise.test_layer_noise import NoiseResponder, NoiseResponderLinkLayer, ProfileStub
+from yowsup.stacks import YowStack
+from yowsup.structs import ProtocolTreeNode
+
+READ_SIZE = 64 * 1024
+
+
+class CountingLayer(YowLayer):
+    def __init__(self):
+        super(CountingLayer, self).__init__()
+        self.count = 0
+
+    def receive(self, data):
+        self.count += 1
+
+
+def message(i):
+    return ProtocolTreeNode("message", {
+        "to": "491234567890@s.whatsapp.net", "type": "text", "id": "3EB0%016X" % i, "t": "1500000000"
+    }, [ProtocolTreeNode("enc", {"v": "2", "type": "msg"}, data=os.urandom(160))])
+
+
+def bench(mode_name, mode, single_threaded, stanzas):
+    stack = YowStack((CountingLayer, YowLoggerLayer, YowCoderLayer, YowNoiseLayer, YowNoiseSegmentsLayer,
+                      NoiseResponderLinkLayer))
+    stack.setProp(YowNoiseLayer.PROP_HANDSHAKE_MODE, mode)
+    stack.setProfile(ProfileStub(Config(phone="123", client_static_keypair=KeyPair.generate())))
+    responder = NoiseResponder(X25519DH().generate_keypair())
+    link = stack.getLayer(0)
+    link.connect(responder)
+    stack.broadcastEvent(YowLayerEvent(YowAuthenticationProtocolLayer.EVENT_AUTH, passive=False))
+    link.pump()
+    while stack.getLayer(2)._in_handshake():
+        time.sleep(0)
+    if single_threaded:
+        if not hasattr(stack, "setSingleThreaded"):
+            return
+        stack.setSingleThreaded(True)
+
+    writer = WriteEncoder(TokenDictionary())
+    nodes = [message(i) for i in range(0, stanzas)]
+    stream = bytearray()
+    for node in nodes:
+        segment = responder._send_cipherstate.encrypt_with_ad(b'', bytes(writer.protocolTreeNodeToBytes(node)))
+        stream.extend(struct.pack('>I', len(segment))[1:] + segment)
+
+    counter = stack.getLayer(5)
+    start = time.time()
+    for offset in range(0, len(stream), READ_SIZE):
+        link.toUpper(bytes(stream[offset:offset + READ_SIZE]))
+    receive_time = time.time() - start
+    assert counter.count == stanzas, counter.count
+
+    link.send = lambda data: None
+    start = time.time()
+    for node in nodes:
+        stack.send(node)
+    send_time = time.time() - start
+
+    print("%-6s %-15s receive %7.0f stanzas/s, send %7.0f stanzas/s" % (
+        mode_name, "single-threaded" if single_threaded else "locking", stanzas / receive_time, stanzas / send_time
+    ))
+
+
+if __name__ == "__main__":
+    stanzas = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # unsigned certificate of the stand-in
+    logging.getLogger("consonance").setLevel(logging.CRITICAL)
+    logging.getLogger("yowsup.layers.noise.handshake").setLevel(logging.CRITICAL)
+    modes = [("worker", YowNoiseLayer.HANDSHAKE_MODE_WORKER), ("inline", YowNoiseLayer.HANDSHAKE_MODE_INLINE)]
+    for mode_name, mode in modes:
+        for single_threaded in (False, True):
+            bench(mode_name, mode, single_threaded, stanzas)
@@ -0,0 +1,82 @@
+"""
+Hashing media files for sending: the former whole-file read of WATools.getFileHashForUpload, the memory mapped single
+pass of WATools.getFileDigests without and with the encrypted hash, separate passes for the plaintext hash and for
+the encrypted hash, and a memoized repeat. Reports time and peak python memory.
+
+Usage: python benchmarks/file_hash_benchmark.py [size in MB...]
+"""
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.common.tools import WATools, FileMemo
+from yowsup.layers.protocol_media.mediacipher import MediaCipher
+
+MB = 1024 * 1024
+KEY = os.urandom(32)
+
+
+def whole_file(path):
+    with open(path, "rb") as f:
+        hashlib.sha256(f.read()).digest()
+
+
+def single_pass(path):
+    WATools.fileMemo.clear()
+    WATools.getFileDigests(path)
+
+
+def single_pass_encrypted(path):
+    WATools.fileMemo.clear()
+    WATools.getFileDigests(path, mediaKey=KEY, mediaInfo=MediaCipher.INFO_VIDEO)
+
+
+def two_passes_encrypted(path):
+    with open(path, "rb") as f:
+        hashlib.sha256(f.read()).digest()
+    encHasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in MediaCipher().encrypt_stream(f, KEY, MediaCipher.INFO_VIDEO):
+            encHasher.update(chunk)
+
+
+def memoized(path):
+    WATools.getFileDigests(path, mediaKey=KEY, mediaInfo=MediaCipher.INFO_VIDEO)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) * MB for arg in sys.argv[1:]] or [16 * MB, 256 * MB]
+    WATools.fileMemo = FileMemo()
+    directory = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            path = os.path.join(directory, "video.mp4")
+            with open(path, "wb") as f:
+                for offset in range(0, size, MB):
+                    f.write(os.urandom(min(MB, size - offset)))
+            for name, fn in (("whole file sha256", whole_file), ("mmap sha256", single_pass),
+                             ("two passes sha256+enc", two_passes_encrypted),
+                             ("mmap sha256+enc", single_pass_encrypted), ("memoized sha256+enc", memoized)):
+                elapsed, peak = measure(lambda: fn(path))
+                print("%5d MB %-22s %9.4f s, peak python memory %7.1f MB" % (
+                    size // MB, name, elapsed, peak / float(MB)
+                ))
+            os.remove(path)
+    finally:
+        shutil.rmtree(directory)
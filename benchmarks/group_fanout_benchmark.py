@@ -0,0 +1,93 @@
+"""
+First send to a synthetic group: session lookups, session creation from fetched prekey bundles and the sender key
+distribution message encrypted for every participant, run through AxolotlSendLayer.
+
+Usage: python benchmarks/group_fanout_benchmark.py [participants...]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from axolotl.state.prekeybundle import PreKeyBundle
+from axolotl.util.keyhelper import KeyHelper
+from yowsup.axolotl.manager import AxolotlManager
+from yowsup.axolotl.store.cachedaxolotlstore import CachedAxolotlStore
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.layers.axolotl.layer_send import AxolotlSendLayer
+from yowsup.structs import ProtocolTreeNode
+try:
+    from yowsup.layers.axolotl.props import PROP_GROUP_ENCRYPT_WORKERS
+except ImportError:
+    PROP_GROUP_ENCRYPT_WORKERS = None
+
+
+def prekey_bundle():
+    identity = KeyHelper.generateIdentityKeyPair()
+    prekey = KeyHelper.generatePreKeys(1, 1)[0]
+    signed_prekey = KeyHelper.generateSignedPreKey(identity, 1)
+    return PreKeyBundle(
+        KeyHelper.generateRegistrationId(), 1, prekey.getId(), prekey.getKeyPair().getPublicKey(),
+        signed_prekey.getId(), signed_prekey.getKeyPair().getPublicKey(), signed_prekey.getSignature(),
+        identity.getPublicKey()
+    )
+
+
+class BenchSendLayer(AxolotlSendLayer):
+    """
+    Answers key requests from pregenerated bundles and collects what would go to the network
+    """
+    def __init__(self, manager, bundles, props):
+        super(BenchSendLayer, self).__init__()
+        self._manager = manager
+        self.bundles = bundles
+        self.props = props
+        self.sent = []
+        self.timings = {}
+
+    def getProp(self, key, default=None):
+        return self.props.get(key, default)
+
+    def toLower(self, data):
+        self.sent.append(data)
+
+    def getKeysFor(self, jids, resultClbk, errorClbk=None, reason=None):
+        start = time.time()
+        for jid in jids:
+            self.manager.create_session(jid.split('@')[0], self.bundles[jid], autotrust=True)
+        self.timings["sessions"] = time.time() - start
+        resultClbk(jids, {})
+
+
+def bench(participants, workers, bundles):
+    directory = tempfile.mkdtemp()
+    try:
+        store = CachedAxolotlStore(LiteAxolotlStore(os.path.join(directory, "axolotl.db"), wal=True))
+        manager = AxolotlManager(store, "1000")
+        props = {PROP_GROUP_ENCRYPT_WORKERS: workers} if PROP_GROUP_ENCRYPT_WORKERS and workers else {}
+        layer = BenchSendLayer(manager, bundles, props)
+        node = ProtocolTreeNode("message", {"to": "1000-1500000000@g.us", "type": "text", "id": "1"}, [
+            ProtocolTreeNode("proto", {"mediatype": None}, data=b"\x0a\x05hello")
+        ])
+        start = time.time()
+        layer.ensureSessionsAndSendToGroup(node, list(bundles.keys()))
+        total = time.time() - start
+        enc = layer.sent[0].getChild("enc") or layer.sent[0].getChild("participants")
+        assert enc is not None
+        print("%4d participants, %d workers: first send %6.0f ms (sessions %6.0f ms, rest %6.0f ms)" % (
+            participants, workers, total * 1000, layer.timings["sessions"] * 1000,
+            (total - layer.timings["sessions"]) * 1000
+        ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [256, 1024]
+    for size in sizes:
+        bundles = dict(("%d@s.whatsapp.net" % (100000000 + i), prekey_bundle()) for i in range(0, size))
+        for workers in (0, 4) if PROP_GROUP_ENCRYPT_WORKERS else (0,):
+            bench(size, workers, bundles)
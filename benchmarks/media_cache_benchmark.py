@@ -0,0 +1,54 @@
+"""
+Cost of preparing repeated sends of the same media file: hashing it for every request upload iq, as before the media
+cache, versus looking up its hash and upload in a MediaUploadCache kept in a sqlite database.
+
+Usage: python benchmarks/media_cache_benchmark.py [size in MB] [sends]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.common.tools import WATools
+from yowsup.layers.protocol_media.mediacache import MediaUploadCache
+
+MB = 1024 * 1024
+
+
+def without_cache(path, sends):
+    for _ in range(sends):
+        WATools.getFileHashForUpload(path)
+
+
+def with_cache(cache, path, sends):
+    for _ in range(sends):
+        file_hash = cache.get_file_hash(path)
+        if cache.get(file_hash, "video") is None:
+            cache.put(file_hash, "video", "https://mmg.whatsapp.net/d/f/1.enc", media_key=os.urandom(32))
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) * MB if len(sys.argv) > 1 else 16 * MB
+    sends = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "video.mp4")
+        with open(path, "wb") as f:
+            for offset in range(0, size, MB):
+                f.write(os.urandom(min(MB, size - offset)))
+        cache = MediaUploadCache(os.path.join(directory, "media.db"))
+        for name, fn in (("no cache", lambda: without_cache(path, sends)),
+                         ("media cache", lambda: with_cache(cache, path, sends))):
+            start = time.time()
+            fn()
+            elapsed = time.time() - start
+            print("%d sends of %d MB, %-11s %8.3f s, %8.2f ms per send" % (
+                sends, size // MB, name, elapsed, elapsed * 1000 / sends
+            ))
+        print(cache.get_metrics())
+        cache.close()
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,94 @@
+"""
+MediaCipher throughput and peak python memory, file to file, for the whole-buffer encrypt/decrypt and for
+encrypt_stream/decrypt_stream. Whole-buffer runs are skipped above 256 MB.
+
+Usage: python benchmarks/mediacipher_benchmark.py [size in MB...]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.layers.protocol_media.mediacipher import MediaCipher
+
+MB = 1024 * 1024
+WHOLE_BUFFER_MAX = 256 * MB
+
+
+def create_file(path, size):
+    block = os.urandom(MB)
+    with open(path, "wb") as f:
+        for offset in range(0, size, MB):
+            f.write(block[:min(MB, size - offset)])
+        # not block aligned, so that the plaintext is padded
+        f.write(b"\x01")
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def whole_encrypt(cipher, key, src, dst):
+    with open(src, "rb") as f:
+        data = f.read()
+    with open(dst, "wb") as f:
+        f.write(cipher.encrypt(data, key, MediaCipher.INFO_VIDEO))
+
+
+def whole_decrypt(cipher, key, src, dst):
+    with open(src, "rb") as f:
+        data = f.read()
+    with open(dst, "wb") as f:
+        f.write(cipher.decrypt(data, key, MediaCipher.INFO_VIDEO))
+
+
+def stream_encrypt(cipher, key, src, dst):
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for chunk in cipher.encrypt_stream(fin, key, MediaCipher.INFO_VIDEO):
+            fout.write(chunk)
+
+
+def stream_decrypt(cipher, key, src, dst):
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for chunk in cipher.decrypt_stream(fin, key, MediaCipher.INFO_VIDEO):
+            fout.write(chunk)
+
+
+def bench(directory, size):
+    cipher = MediaCipher()
+    key = os.urandom(32)
+    plain, enc, dec = (os.path.join(directory, name) for name in ("plain", "enc", "dec"))
+    create_file(plain, size)
+    runs = []
+    if size <= WHOLE_BUFFER_MAX:
+        runs += [("encrypt", whole_encrypt, plain, enc), ("decrypt", whole_decrypt, enc, dec)]
+    if hasattr(cipher, "encrypt_stream"):
+        runs += [("encrypt_stream", stream_encrypt, plain, enc), ("decrypt_stream", stream_decrypt, enc, dec)]
+    for name, fn, src, dst in runs:
+        elapsed, peak = measure(lambda: fn(cipher, key, src, dst))
+        print("%5d MB %-15s %7.1f MB/s, peak python memory %8.1f MB" % (
+            size // MB, name, size / MB / elapsed, peak / float(MB)
+        ))
+    assert os.path.getsize(dec) == os.path.getsize(plain)
+    for path in (plain, enc, dec):
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) * MB for arg in sys.argv[1:]] or [MB, 100 * MB, 1024 * MB]
+    directory = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            bench(directory, size)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,96 @@
+"""
+MediaUploader against a local HTTPS stand-in for the upload host: time per upload, throughput and peak python memory.
+The transfer loop MediaUploader used before streaming (whole file read, 1024 byte slices, sleep and blind reads) is
+replayed for comparison on the smaller sizes, it is quadratic in file size.
+
+Usage: python benchmarks/mediauploader_benchmark.py [size in MB...]
+"""
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.layers.protocol_media.mediauploader import MediaUploader
+from yowsup.layers.protocol_media.test_mediauploader import UploadServer
+
+MB = 1024 * 1024
+LEGACY_MAX = 4 * MB
+
+
+def legacy_upload(server, path):
+    """
+    The former MediaUploader.run transfer, minus its multipart framing
+    """
+    sock = server.client_context().wrap_socket(socket.create_connection(server.server_address),
+                                               server_hostname="localhost")
+    filesize = os.path.getsize(path)
+    sock.write(("POST /upload HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n" % filesize).encode())
+    with open(path, "rb") as f:
+        stream = f.read()
+    totalsent = 0
+    buf = 1024
+    while totalsent < filesize:
+        sock.write(stream[:buf])
+        stream = stream[buf:]
+        totalsent = totalsent + buf
+    time.sleep(1)
+    sock.settimeout(0.1)
+    data = b""
+    for _ in range(0, 7):
+        try:
+            data += sock.recv(8192)
+        except socket.timeout:
+            pass
+    sock.close()
+    assert b"url" in data
+
+
+def streaming_upload(server, path):
+    results = []
+    uploader = MediaUploader("1@s.whatsapp.net", "2@s.whatsapp.net", path, server.url("/upload"),
+                             successClbk=lambda path, jid, url: results.append(url), asynchronous=False,
+                             sslContext=server.client_context())
+    uploader.start()
+    assert results
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) * MB for arg in sys.argv[1:]] or [1 * MB, 4 * MB, 100 * MB]
+    logging.getLogger("yowsup").setLevel(logging.CRITICAL)
+    directory = tempfile.mkdtemp()
+    server = UploadServer(directory, keep_bodies=False)
+    server.start()
+    try:
+        for size in sizes:
+            path = os.path.join(directory, "media.mp4")
+            with open(path, "wb") as f:
+                for offset in range(0, size, MB):
+                    f.write(os.urandom(min(MB, size - offset)))
+            runs = [("streaming", streaming_upload)]
+            if size <= LEGACY_MAX:
+                runs.insert(0, ("legacy", legacy_upload))
+            for name, fn in runs:
+                elapsed, peak = measure(lambda: fn(server, path))
+                print("%5d MB %-9s %7.2f s, %7.1f MB/s, peak python memory %7.1f MB" % (
+                    size // MB, name, elapsed, size / float(MB) / elapsed, peak / float(MB)
+                ))
+            os.remove(path)
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
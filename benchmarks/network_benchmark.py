@@ -0,0 +1,122 @@
+"""
+Throughput of the connection dispatchers against a loopback stand-in server.
+
+Usage: python benchmarks/network_benchmark.py [megabytes]
+"""
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.layers.network.dispatcher.dispatcher import ConnectionCallbacks
+from yowsup.layers.network.dispatcher.dispatcher_socket import SocketConnectionDispatcher
+from yowsup.layers.network.dispatcher.dispatcher_asyncore import AsyncoreConnectionDispatcher
+from yowsup.layers.network.dispatcher.dispatcher_asyncio import AsyncioConnectionDispatcher
+
+
+class Callbacks(ConnectionCallbacks):
+    def __init__(self):
+        self.received = 0
+        self.connected = threading.Event()
+        self.disconnected = threading.Event()
+
+    def onConnected(self):
+        self.connected.set()
+
+    def onDisconnected(self):
+        self.disconnected.set()
+
+    def onConnectionError(self, error):
+        self.disconnected.set()
+
+    def onRecvData(self, data):
+        self.received += len(data)
+
+
+def serve_once(handler):
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def accept():
+        conn, _ = server.accept()
+        try:
+            handler(conn)
+        finally:
+            conn.close()
+            server.close()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    return server.getsockname(), thread
+
+
+def bench_receive(dispatcher_class, read_size, total):
+    chunk = os.urandom(256 * 1024)
+
+    def handler(conn):
+        sent = 0
+        while sent < total:
+            conn.sendall(chunk)
+            sent += len(chunk)
+
+    endpoint, _ = serve_once(handler)
+    callbacks = Callbacks()
+    dispatcher = dispatcher_class(callbacks, read_size)
+    start = time.time()
+    dispatcher.connect(endpoint)
+    elapsed = time.time() - start
+    print("recv %-12s readSize=%-6s %8.1f MB/s" % (
+        dispatcher_class.__name__[:-len("ConnectionDispatcher")], read_size or "loop",
+        callbacks.received / elapsed / 1e6
+    ))
+
+
+def bench_send(dispatcher_class, total, frame_size=100):
+    received = [0]
+
+    def handler(conn):
+        while received[0] < total:
+            data = conn.recv(1024 * 1024)
+            if not data:
+                break
+            received[0] += len(data)
+
+    endpoint, server_thread = serve_once(handler)
+    callbacks = Callbacks()
+    dispatcher = dispatcher_class(callbacks)
+    loop = threading.Thread(target=dispatcher.connect, args=(endpoint,))
+    loop.daemon = True
+    loop.start()
+    callbacks.connected.wait()
+
+    header, frame = struct.pack('>I', frame_size - 3)[1:], os.urandom(frame_size - 3)
+    start = time.time()
+    sent = 0
+    while sent < total:
+        # the segments layer writes header and payload of a frame as two separate sends
+        dispatcher.sendData(header)
+        dispatcher.sendData(frame)
+        sent += frame_size
+    server_thread.join()
+    elapsed = time.time() - start
+    print("send %-12s %4d byte frames %8.1f MB/s" % (
+        dispatcher_class.__name__[:-len("ConnectionDispatcher")], frame_size, received[0] / elapsed / 1e6
+    ))
+
+
+if __name__ == "__main__":
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    for dispatcher_class in (SocketConnectionDispatcher, AsyncoreConnectionDispatcher):
+        for read_size in (1024, dispatcher_class.DEFAULT_READ_SIZE):
+            bench_receive(dispatcher_class, read_size, megabytes * 1024 * 1024)
+    bench_receive(AsyncioConnectionDispatcher, None, megabytes * 1024 * 1024)
+    for dispatcher_class in (SocketConnectionDispatcher, AsyncoreConnectionDispatcher, AsyncioConnectionDispatcher):
+        for frame_size in (100, 16 * 1024):
+            bench_send(dispatcher_class, megabytes * 1024 * 1024 // 8, frame_size)
@@ -0,0 +1,70 @@
+"""
+Noise connection setup against a local responder stand-in, for each YowNoiseLayer handshake mode: time from the auth
+event to the first transport round trip, for first (XX) and later (IK) logins, and the threads alive while many
+accounts are in the middle of their handshakes.
+
+Usage: python benchmarks/noise_handshake_benchmark.py [connections] [accounts]
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from consonance.structs.keypair import KeyPair
+from dissononce.dh.x25519.x25519 import X25519DH
+from yowsup.config.v1.config import Config
+from yowsup.layers import YowLayerEvent
+from yowsup.layers.auth.layer_authentication import YowAuthenticationProtocolLayer
+from yowsup.layers.noise.layer import YowNoiseLayer
+from yowsup.layers.noise.test_layer_noise import NoiseResponder, noise_stack, connect, disconnect
+
+MODES = [("worker", YowNoiseLayer.HANDSHAKE_MODE_WORKER)]
+if hasattr(YowNoiseLayer, "HANDSHAKE_MODE_INLINE"):
+    MODES.append(("inline", YowNoiseLayer.HANDSHAKE_MODE_INLINE))
+
+
+def bench_setup(mode_name, mode, connections, server_static):
+    config = Config(phone="123", client_static_keypair=KeyPair.generate())
+    stack = noise_stack(mode, config)
+    timings = {"XX": [], "IK": []}
+    for i in range(0, connections):
+        if i % 2 == 0:
+            config.server_static_public = None
+        responder = NoiseResponder(server_static)
+        start = time.time()
+        assert connect(stack, responder) == b"ping"
+        timings[responder.pattern].append(time.time() - start)
+        disconnect(stack)
+    print("%-6s setup: XX %6.3f ms, IK %6.3f ms (mean of %d each)" % (
+        mode_name, sum(timings["XX"]) * 1000 / len(timings["XX"]), sum(timings["IK"]) * 1000 / len(timings["IK"]),
+        len(timings["IK"])
+    ))
+
+
+def bench_threads(mode_name, mode, accounts, server_static):
+    baseline = threading.active_count()
+    stacks = [noise_stack(mode, Config(phone="123", client_static_keypair=KeyPair.generate()))
+              for _ in range(0, accounts)]
+    for stack in stacks:
+        stack.getLayer(0).connect(NoiseResponder(server_static))
+        stack.broadcastEvent(YowLayerEvent(YowAuthenticationProtocolLayer.EVENT_AUTH, passive=False))
+    peak = threading.active_count() - baseline
+    for stack in stacks:
+        stack.getLayer(0).pump()
+    print("%-6s threads: %d accounts awaiting server hello, %d extra threads (%.2f per account)" % (
+        mode_name, accounts, peak, float(peak) / accounts
+    ))
+
+
+if __name__ == "__main__":
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    accounts = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    server_static = X25519DH().generate_keypair()
+    # the stand-in's certificate is not signed, keep its log lines out of the timings
+    logging.disable(logging.CRITICAL)
+    for mode_name, mode in MODES:
+        bench_setup(mode_name, mode, connections, server_static)
+        bench_threads(mode_name, mode, accounts, server_static)
@@ -0,0 +1,60 @@
+"""
+Cold first-connect prekey work: generating, storing and marking as sent COUNT_GEN_PREKEYS prekeys in a fresh
+on-disk axolotl store, and how much of it blocks the thread running the stack.
+
+Usage: python benchmarks/prekeys_benchmark.py [rounds]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.axolotl.manager import AxolotlManager
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+
+
+def first_connect(directory, use_async):
+    start = time.time()
+    manager = AxolotlManager(LiteAxolotlStore(os.path.join(directory, "axolotl.db")), "123456789")
+    if use_async:
+        # on_connected
+        unsent = manager.load_unsent_prekeys()
+        future = manager.level_prekeys_async()
+        blocked = time.time() - start
+        # onAuthed, after the handshake
+        prekeys = unsent + future.result()
+        blocked_auth = time.time()
+    else:
+        manager.level_prekeys()
+        prekeys = manager.load_unsent_prekeys()
+        blocked = time.time() - start
+        blocked_auth = time.time()
+    manager.set_prekeys_as_sent(prekeys)
+    blocked += time.time() - blocked_auth
+    return time.time() - start, blocked
+
+
+def bench(use_async, rounds):
+    totals, blocked = [], []
+    for _ in range(0, rounds):
+        directory = tempfile.mkdtemp()
+        try:
+            total, block = first_connect(directory, use_async)
+            totals.append(total)
+            blocked.append(block)
+        finally:
+            shutil.rmtree(directory)
+    print("%-22s total %7.1f ms, blocking the stack %7.1f ms" % (
+        "level_prekeys_async" if use_async else "level_prekeys",
+        min(totals) * 1000, min(blocked) * 1000
+    ))
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    bench(False, rounds)
+    if hasattr(AxolotlManager, "level_prekeys_async"):
+        bench(True, rounds)
@@ -0,0 +1,141 @@
+"""
+SinkWorker storing encrypted media from a local HTTP stand-in for the media host: time, throughput and peak python
+memory for a batch of concurrent downloads. The former serial download (1 KB blocks concatenated), whole-buffer decrypt
+and write are replayed for comparison on the smaller sizes, the download is quadratic in file size.
+Needs the mediasink demo's requirements, tqdm and requests.
+
+Usage: python benchmarks/sink_worker_benchmark.py [downloads] [size in MB...]
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tqdm import tqdm
+import requests
+
+from yowsup.demos.common.sink_worker import SinkWorker
+from yowsup.layers.protocol_media.mediacipher import MediaCipher
+from yowsup.layers.protocol_media.protocolentities import VideoDownloadableMediaMessageProtocolEntity
+from yowsup.layers.protocol_messages.protocolentities.attributes.attributes_downloadablemedia import \
+    DownloadableMediaMessageAttributes
+from yowsup.layers.protocol_messages.protocolentities.attributes.attributes_message_meta import \
+    MessageMetaAttributes
+from yowsup.layers.protocol_messages.protocolentities.attributes.attributes_video import VideoAttributes
+
+from http.server import SimpleHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+MB = 1024 * 1024
+LEGACY_MAX = 2 * MB
+
+
+class MediaRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def translate_path(self, path):
+        return os.path.join(self.server.directory, path.lstrip("/"))
+
+
+class MediaServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory):
+        HTTPServer.__init__(self, ("localhost", 0), MediaRequestHandler)
+        self.directory = directory
+
+
+class QuietSinkWorker(SinkWorker):
+    def _create_progress(self, total, desc, position):
+        return tqdm(total=total, disable=True)
+
+
+def legacy_store(entity, storage_dir):
+    """
+    The former SinkWorker._download, _decrypt and _write
+    """
+    response = requests.get(entity.url, stream=True)
+    enc_data = b""
+    for data in response.iter_content(1024):
+        enc_data = enc_data + data
+    filedata = MediaCipher().decrypt(enc_data, entity.media_key, MediaCipher.INFO_VIDEO)
+    with open(os.path.join(storage_dir, "video.mp4"), "wb") as f:
+        f.write(filedata)
+
+
+def sink_worker_store(entities, storage_dir):
+    worker = QuietSinkWorker(storage_dir)
+    worker.start()
+    for entity in entities:
+        worker.enqueue(entity)
+    worker.enqueue(None)
+    worker.join()
+
+
+def create_entities(server, directory, count, size):
+    cipher = MediaCipher()
+    entities = []
+    # not block aligned, MediaCipher.encrypt only pads then
+    plaintext = os.urandom(size + 1)
+    for i in range(count):
+        media_key = os.urandom(32)
+        with open(os.path.join(directory, "%d.enc" % i), "wb") as f:
+            f.write(cipher.encrypt(plaintext, media_key, MediaCipher.INFO_VIDEO))
+        url = "http://localhost:%d/%d.enc" % (server.server_address[1], i)
+        entities.append(VideoDownloadableMediaMessageProtocolEntity(
+            VideoAttributes(DownloadableMediaMessageAttributes("video/mp4", size + 1, b"", url, media_key), 1, 1, 1),
+            MessageMetaAttributes(id=str(i), sender="1@s.whatsapp.net", timestamp=1)
+        ))
+    return entities
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    sizes = [int(arg) * MB for arg in sys.argv[2:]] or [2 * MB, 50 * MB]
+    logging.getLogger("yowsup").setLevel(logging.CRITICAL)
+    media_dir = tempfile.mkdtemp()
+    server = MediaServer(media_dir)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        for size in sizes:
+            entities = create_entities(server, media_dir, count, size)
+            runs = [("sink worker", lambda storage_dir: sink_worker_store(entities, storage_dir))]
+            if size <= LEGACY_MAX:
+                runs.insert(0, ("legacy", lambda storage_dir: [legacy_store(entity, storage_dir)
+                                                              for entity in entities]))
+            for name, fn in runs:
+                storage_dir = tempfile.mkdtemp()
+                try:
+                    elapsed, peak = measure(lambda: fn(storage_dir))
+                    assert sum(os.path.getsize(os.path.join(storage_dir, filename)) for filename in os.listdir(storage_dir)) \
+                        == (count if name != "legacy" else 1) * (size + 1)
+                finally:
+                    shutil.rmtree(storage_dir)
+                print("%d x %3d MB %-11s %7.2f s, %7.1f MB/s, peak python memory %7.1f MB" % (
+                    count, size // MB, name, elapsed, count * size / float(MB) / elapsed, peak / float(MB)
+                ))
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(media_dir)
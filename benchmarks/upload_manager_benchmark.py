@@ -0,0 +1,101 @@
+"""
+Bulk media uploads against a local HTTPS stand-in for the upload host, one MediaUploader thread per upload (as
+YowInterfaceLayer used to start them) versus a MediaUploadManager: time, throughput, peak thread count, peak python
+memory and TLS handshakes (connections accepted by the server).
+
+Usage: python benchmarks/upload_manager_benchmark.py [uploads] [size in KB] [workers]
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from yowsup.layers.protocol_media.mediauploader import MediaUploader
+from yowsup.layers.protocol_media.test_mediauploader import UploadServer
+from yowsup.layers.protocol_media.uploadmanager import MediaUploadManager
+
+KB = 1024
+
+
+def uploaders(server, path, count, done):
+    for _ in range(count):
+        yield MediaUploader("1@s.whatsapp.net", "2@s.whatsapp.net", path, server.url("/upload"),
+                            successClbk=lambda *args: done.release(), errorClbk=lambda *args: done.release(),
+                            sslContext=server.client_context())
+
+
+def thread_per_upload(server, path, count, workers, done):
+    for uploader in uploaders(server, path, count, done):
+        uploader.start()
+
+
+def upload_manager(server, path, count, workers, done):
+    manager = MediaUploadManager(workers, ssl_context=server.client_context())
+    for uploader in uploaders(server, path, count, done):
+        manager.reserve()
+        manager.submit(uploader)
+    return manager
+
+
+def upload_threads():
+    return [thread for thread in threading.enumerate()
+            if isinstance(thread, MediaUploader) or thread.name.startswith("MediaUploadWorker")]
+
+
+def measure(server, fn, path, count, workers):
+    done = threading.Semaphore(0)
+    connections = server.connections
+    peak_threads = [0]
+
+    def sample():
+        while not finished.is_set():
+            peak_threads[0] = max(peak_threads[0], len(upload_threads()))
+            time.sleep(0.005)
+
+    finished = threading.Event()
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    tracemalloc.start()
+    start = time.time()
+    manager = fn(server, path, count, workers, done)
+    for _ in range(count):
+        done.acquire()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    finished.set()
+    sampler.join()
+    if manager:
+        manager.shutdown()
+    return elapsed, peak_threads[0], peak, server.connections - connections
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) * KB if len(sys.argv) > 2 else 256 * KB
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else MediaUploadManager.DEFAULT_WORKERS
+    logging.getLogger("yowsup").setLevel(logging.CRITICAL)
+    directory = tempfile.mkdtemp()
+    server = UploadServer(directory, keep_bodies=False)
+    server.start()
+    try:
+        path = os.path.join(directory, "media.jpg")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        print("%d uploads of %d KB, %d workers" % (count, size // KB, workers))
+        for name, fn in (("thread per upload", thread_per_upload), ("upload manager", upload_manager)):
+            elapsed, threads, peak, handshakes = measure(server, fn, path, count, workers)
+            print("%-17s %6.2f s, %6.1f uploads/s, %6.1f MB/s, peak threads %4d, "
+                  "peak python memory %6.1f MB, TLS handshakes %4d" % (
+                      name, elapsed, count / elapsed, count * size / float(KB * KB) / elapsed, threads,
+                      peak / float(KB * KB), handshakes
+                  ))
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
@@ -1,14 +1,9 @@
 #!/usr/bin/env python
-from __future__ import print_function
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
 import yowsup
 import platform
-import sys
 
-deps = ['consonance==0.1.3-1', 'argparse', 'python-axolotl==0.2.2', 'six==1.10', 'appdirs', 'protobuf>=3.6.0']
-
-if sys.version_info < (2, 7):
-    deps.append('importlib')
+deps = ['consonance==0.1.3-1', 'python-axolotl==0.2.2', 'appdirs', 'protobuf>=3.6.0']
 
 if platform.system().lower() == "windows":
     deps.append('pyreadline')
@@ -18,6 +13,16 @@ else:
     except ImportError:
         deps.append('readline')
 
+# optional compiled coder, yowsup.layers.coder falls back to the pure python one when it is not built
+ext_modules = []
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize(
+        [Extension("yowsup.layers.coder._coder", ["yowsup/layers/coder/_coder.pyx"], optional=True)]
+    )
+except ImportError:
+    pass
+
 setup(
     name='yowsup',
     version=yowsup.__version__,
@@ -26,18 +31,22 @@ setup(
     author='Tarek Galal',
     tests_require=[],
     install_requires = deps,
+    python_requires='>=3.7',
     scripts = ['yowsup-cli'],
     #cmdclass={'test': PyTest},
     author_email='tare2.galal@gmail.com',
     description='The WhatsApp lib',
     #long_description=long_description,
     packages= find_packages(),
+    ext_modules=ext_modules,
     include_package_data=True,
     data_files = [('yowsup/common', ['yowsup/common/mime.types'])],
     platforms='any',
     #test_suite='',
     classifiers = [
         'Programming Language :: Python',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Development Status :: 4 - Beta',
         'Natural Language :: English',
         #'Environment :: Web Environment',
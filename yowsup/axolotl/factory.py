@@ -1,16 +1,73 @@
 from yowsup.axolotl.manager import AxolotlManager
 from yowsup.common.tools import StorageTools
 from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.axolotl.store.log.logaxolotlstore import LogAxolotlStore
+from yowsup.axolotl.store.cachedaxolotlstore import CachedAxolotlStore
+import atexit
 import logging
+import weakref
 
 logger = logging.getLogger(__name__)
 
 
 class AxolotlManagerFactory(object):
     DB = "axolotl.db"
+    LOG = "axolotl.log"
+    # Put a CachedAxolotlStore in front of the store. Faster, but session updates made since the last flush are lost
+    # if the process is killed, see CachedAxolotlStore. Pending updates are flushed on disconnect and at exit.
+    CACHE_RECORDS = False
+    DEFAULT_STORE = "sqlite"
 
-    def get_manager(self, profile_name, username):
-        logger.debug("get_manager(profile_name=%s, username=%s)" % (profile_name, username))
-        dbpath = StorageTools.constructPath(profile_name, self.DB)
-        store = LiteAxolotlStore(dbpath)
+    _stores = {}
+
+    @classmethod
+    def register_store(cls, name, create_store):
+        """
+        Makes a storage backend selectable by name, e.g. through the axolotl_store config option
+        :param name:
+        :type name: str
+        :param create_store: called with the profile name, returns the store of that profile
+        :type create_store: (str) -> yowsup.axolotl.store.base.YowAxolotlStore
+        """
+        cls._stores[name] = create_store
+
+    @classmethod
+    def get_store_names(cls):
+        return sorted(cls._stores.keys())
+
+    def get_manager(self, profile_name, username, store_name=None):
+        logger.debug("get_manager(profile_name=%s, username=%s, store_name=%s)" % (profile_name, username, store_name))
+        store_name = store_name or self.DEFAULT_STORE
+        if store_name not in self._stores:
+            raise ValueError("Unknown axolotl store %s, available: %s" % (
+                store_name, ", ".join(self.get_store_names())
+            ))
+        store = self._stores[store_name](profile_name)
+        if self.CACHE_RECORDS:
+            store = CachedAxolotlStore(store)
+            atexit.register(self._flush_at_exit, weakref.ref(store))
         return AxolotlManager(store, username)
+
+    @staticmethod
+    def _flush_at_exit(store_ref):
+        """
+        :param store_ref:
+        :type store_ref: weakref.ReferenceType[CachedAxolotlStore]
+        """
+        store = store_ref()
+        if store is None:
+            return
+        try:
+            store.flush()
+        except Exception:
+            logger.exception("Failed to flush %s at exit" % store)
+
+
+AxolotlManagerFactory.register_store(
+    "sqlite",
+    lambda profile_name: LiteAxolotlStore(StorageTools.constructPath(profile_name, AxolotlManagerFactory.DB), wal=True)
+)
+AxolotlManagerFactory.register_store(
+    "log",
+    lambda profile_name: LogAxolotlStore(StorageTools.constructPath(profile_name, AxolotlManagerFactory.LOG))
+)
@@ -15,15 +15,32 @@ from axolotl.duplicatemessagexception import DuplicateMessageException
 from axolotl.invalidkeyidexception import InvalidKeyIdException
 from axolotl.nosessionexception import NoSessionException
 from axolotl.protocol.senderkeydistributionmessage import SenderKeyDistributionMessage
-from axolotl.state.axolotlstore import AxolotlStore
-from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.axolotl.store.base import YowAxolotlStore
+from yowsup.axolotl.store.cachedaxolotlstore import CachedAxolotlStore
 from yowsup.axolotl import exceptions
+from concurrent.futures import ThreadPoolExecutor
 import random
 import logging
-import sys
+import threading
 
 logger = logging.getLogger(__name__)
 
+_prekeys_executor = None
+_prekeys_executor_lock = threading.Lock()
+
+
+def _get_prekeys_executor():
+    """
+    Worker shared by all managers in the process. Key generation holds the GIL, more workers would not make it faster,
+    the point is to keep it off the thread running the stack.
+    :rtype: ThreadPoolExecutor
+    """
+    global _prekeys_executor
+    with _prekeys_executor_lock:
+        if _prekeys_executor is None:
+            _prekeys_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prekeys")
+        return _prekeys_executor
+
 
 class AxolotlManager(object):
 
@@ -34,12 +51,13 @@ class AxolotlManager(object):
     def __init__(self, store, username):
         """
         :param store:
-        :type store: AxolotlStore
+        :type store: YowAxolotlStore
         :param username:
         :type username: str
         """
         self._username = username # type: str
-        self._store = store # type: LiteAxolotlStore
+        self._store = store # type: YowAxolotlStore
+        self._cache = store if isinstance(store, CachedAxolotlStore) else None # type: CachedAxolotlStore | None
         self._identity = self._store.getIdentityKeyPair() # type: IdentityKeyPair
         self._registration_id = self._store.getLocalRegistrationId() # type: int | None
 
@@ -59,28 +77,50 @@ class AxolotlManager(object):
     def identity(self):
         return self._identity
 
+    @property
+    def is_cached(self):
+        """
+        :return: whether session and sender key updates are held back until flush
+        :rtype: bool
+        """
+        return self._cache is not None
+
     def level_prekeys(self, force=False):
         logger.debug("level_prekeys(force=%s)" % force)
-        len_pending_prekeys = len(self._store.loadPreKeys())
-        logger.debug("len(pending_prekeys) = %d" % len_pending_prekeys)
-        if force or len_pending_prekeys < self.THRESHOLD_REGEN:
-            count_gen = self.COUNT_GEN_PREKEYS
-            max_prekey_id = self._store.preKeyStore.loadMaxPreKeyId()
-            logger.info("Generating %d prekeys, current max_prekey_id=%d" % (count_gen, max_prekey_id))
-            prekeys = KeyHelper.generatePreKeys(max_prekey_id + 1, count_gen)
-            logger.info("Storing %d prekeys" % len(prekeys))
-            for i in range(0, len(prekeys)):
-                key = prekeys[i]
-                if logger.level <= logging.DEBUG:
-                    sys.stdout.write("Storing prekey %d/%d \r" % (i + 1, len(prekeys)))
-                    sys.stdout.flush()
-                self._store.storePreKey(key.getId(), key)
-            return prekeys
+        if force or self._should_level_prekeys():
+            return self._generate_prekeys()
         return []
 
+    def level_prekeys_async(self, force=False):
+        """
+        Same as level_prekeys, but prekeys are generated and stored on a worker thread
+        :param force:
+        :type force: bool
+        :return: future resolving to the generated prekeys, None if there was no need to generate any
+        :rtype: concurrent.futures.Future | None
+        """
+        logger.debug("level_prekeys_async(force=%s)" % force)
+        if force or self._should_level_prekeys():
+            return _get_prekeys_executor().submit(self._generate_prekeys)
+        return None
+
+    def _should_level_prekeys(self):
+        len_pending_prekeys = self._store.countPreKeys()
+        logger.debug("len(pending_prekeys) = %d" % len_pending_prekeys)
+        return len_pending_prekeys < self.THRESHOLD_REGEN
+
+    def _generate_prekeys(self):
+        count_gen = self.COUNT_GEN_PREKEYS
+        max_prekey_id = self._store.loadMaxPreKeyId()
+        logger.info("Generating %d prekeys, current max_prekey_id=%d" % (count_gen, max_prekey_id))
+        prekeys = KeyHelper.generatePreKeys(max_prekey_id + 1, count_gen)
+        logger.info("Storing %d prekeys" % len(prekeys))
+        self._store.storePreKeys(prekeys)
+        return prekeys
+
     def load_unsent_prekeys(self):
         logger.debug("load_unsent_prekeys")
-        unsent = self._store.preKeyStore.loadUnsentPendingPreKeys()
+        unsent = self._store.loadUnsentPreKeys()
         if len(unsent) > 0:
             logger.info("Loaded %d unsent prekeys" % len(unsent))
         return unsent
@@ -93,7 +133,7 @@ class AxolotlManager(object):
         :rtype:
         """
         logger.debug("set_prekeys_as_sent(prekeyIds=[%d prekeyIds])" % len(prekeyIds))
-        self._store.preKeyStore.setAsSent([prekey.getId() for prekey in prekeyIds])
+        self._store.setPreKeysAsSent([prekey.getId() for prekey in prekeyIds])
 
     def generate_signed_prekey(self):
         logger.debug("generate_signed_prekey")
@@ -117,6 +157,13 @@ class AxolotlManager(object):
 
         return self.generate_signed_prekey() if generate else None
 
+    def flush(self):
+        """
+        Persists session and sender key updates held back by a caching store
+        """
+        if self._cache is not None:
+            self._cache.flush()
+
     def _get_session_cipher(self, recipientid):
         logger.debug("get_session_cipher(recipientid=%s)" % recipientid)
         if recipientid in self._session_ciphers:
@@ -132,10 +179,22 @@ class AxolotlManager(object):
         if senderkeyname in self._group_ciphers:
             group_cipher = self._group_ciphers[senderkeyname]
         else:
-            group_cipher = GroupCipher(self._store.senderKeyStore, senderkeyname)
+            group_cipher = GroupCipher(self._store, senderkeyname)
             self._group_ciphers[senderkeyname] = group_cipher
         return group_cipher
 
+    def _revert_on_error(self, revert, decrypt, message):
+        """
+        Decryption may have modified the loaded record in place before failing, make sure a cached record does not
+        keep those modifications
+        """
+        try:
+            return decrypt(message)
+        except Exception:
+            if self._cache is not None:
+                revert(self._cache)
+            raise
+
     def _generate_random_padding(self):
         logger.debug("generate_random_padding")
         num = random.randint(1,255)
@@ -162,11 +221,33 @@ class AxolotlManager(object):
         cipher = self._get_session_cipher(recipient_id)
         return cipher.encrypt(message + self._generate_random_padding())
 
+    def encrypt_many(self, recipient_ids, message, executor=None):
+        """
+        Encrypts the same message for each of the recipients, each with its own session
+        :param recipient_ids:
+        :type recipient_ids: list[str]
+        :param message:
+        :type message: bytes
+        :param executor: encrypts for several recipients at a time when given
+        :type executor: concurrent.futures.Executor | None
+        :return: ciphertexts in the order of recipient_ids
+        :rtype: list[WhisperMessage | PreKeyWhisperMessage]
+        """
+        logger.debug("encrypt_many(recipient_ids=[%d recipient_ids], message=[omitted])" % len(recipient_ids))
+        if executor is None or len(recipient_ids) < 2:
+            return [self.encrypt(recipient_id, message) for recipient_id in recipient_ids]
+        # create ciphers up front, so workers only ever read _session_ciphers
+        for recipient_id in recipient_ids:
+            self._get_session_cipher(recipient_id)
+        return list(executor.map(lambda recipient_id: self.encrypt(recipient_id, message), recipient_ids))
+
     def decrypt_pkmsg(self, senderid, data, unpad):
         logger.debug("decrypt_pkmsg(senderid=%s, data=(omitted), unpad=%s)" % (senderid, unpad))
         pkmsg = PreKeyWhisperMessage(serialized=data)
         try:
-            plaintext = self._get_session_cipher(senderid).decryptPkmsg(pkmsg)
+            plaintext = self._revert_on_error(
+                lambda cache: cache.revertSession(senderid, 1), self._get_session_cipher(senderid).decryptPkmsg, pkmsg
+            )
             return self._unpad(plaintext) if unpad else plaintext
         except NoSessionException:
             raise exceptions.NoSessionException()
@@ -182,7 +263,9 @@ class AxolotlManager(object):
         logger.debug("decrypt_msg(senderid=%s, data=[omitted], unpad=%s)" % (senderid, unpad))
         msg = WhisperMessage(serialized=data)
         try:
-            plaintext = self._get_session_cipher(senderid).decryptMsg(msg)
+            plaintext = self._revert_on_error(
+                lambda cache: cache.revertSession(senderid, 1), self._get_session_cipher(senderid).decryptMsg, msg
+            )
 
             return self._unpad(plaintext) if unpad else plaintext
         except NoSessionException:
@@ -214,7 +297,10 @@ class AxolotlManager(object):
         logger.debug("group_decrypt(groupid=%s, participantid=%s, data=[omitted])" % (groupid, participantid))
         group_cipher = self._get_group_cipher(groupid, participantid)
         try:
-            plaintext = group_cipher.decrypt(data)
+            plaintext = self._revert_on_error(
+                lambda cache: cache.revertSenderKey(SenderKeyName(groupid, AxolotlAddress(participantid, 0))),
+                group_cipher.decrypt, data
+            )
             plaintext = self._unpad(plaintext)
             return plaintext
         except NoSessionException:
@@ -265,6 +351,24 @@ class AxolotlManager(object):
             else:
                 raise exceptions.UntrustedIdentityException(ex.getName(), ex.getIdentityKey())
 
+    def create_sessions(self, prekeybundles, autotrust=False):
+        """
+        Creates a session with each of the bundles, then persists them together
+        :param prekeybundles:
+        :type prekeybundles: dict[str, PreKeyBundle]
+        :return: username -> UntrustedIdentityException for the sessions which could not be created
+        :rtype: dict[str, exceptions.UntrustedIdentityException]
+        """
+        logger.debug("create_sessions(prekeybundles=[%d prekeybundles], autotrust=%s)" % (len(prekeybundles), autotrust))
+        errors = {}
+        for username, prekeybundle in prekeybundles.items():
+            try:
+                self.create_session(username, prekeybundle, autotrust)
+            except exceptions.UntrustedIdentityException as e:
+                errors[username] = e
+        self.flush()
+        return errors
+
     def session_exists(self, username):
         """
         :param username:
@@ -275,6 +379,16 @@ class AxolotlManager(object):
         logger.debug("session_exists(%s)?" % username)
         return self._store.containsSession(username, 1)
 
+    def sessions_exist(self, usernames):
+        """
+        :param usernames:
+        :type usernames: list[str]
+        :return: the usernames which have a session
+        :rtype: set[str]
+        """
+        logger.debug("sessions_exist([%d usernames])?" % len(usernames))
+        return self._store.containsSessions(usernames, 1)
+
     def load_senderkey(self, groupid):
         logger.debug("load_senderkey(groupid=%s)" % groupid)
         senderkeyname = SenderKeyName(groupid, AxolotlAddress(self._username, 0))
@@ -0,0 +1,66 @@
+from axolotl.state.axolotlstore import AxolotlStore
+from axolotl.groups.state.senderkeystore import SenderKeyStore
+
+
+class YowAxolotlStore(AxolotlStore, SenderKeyStore):
+    """
+    Interface of the stores AxolotlManager works with: python-axolotl's AxolotlStore and SenderKeyStore, plus bulk
+    operations and prekey bookkeeping. Storage backends implement this and are registered with
+    AxolotlManagerFactory.register_store.
+    """
+
+    def storePreKeys(self, preKeyRecords):
+        """
+        Stores all records, in a single transaction where the backend has transactions
+        :type preKeyRecords: list[PreKeyRecord]
+        """
+        raise NotImplementedError()
+
+    def countPreKeys(self):
+        """
+        :rtype: int
+        """
+        raise NotImplementedError()
+
+    def loadMaxPreKeyId(self):
+        """
+        :return: highest stored prekey id, 0 if there are none
+        :rtype: int
+        """
+        raise NotImplementedError()
+
+    def loadUnsentPreKeys(self):
+        """
+        :rtype: list[PreKeyRecord]
+        """
+        raise NotImplementedError()
+
+    def setPreKeysAsSent(self, preKeyIds):
+        """
+        :type preKeyIds: list[int]
+        """
+        raise NotImplementedError()
+
+    def storeSessions(self, sessions):
+        """
+        :type sessions: list[tuple[str, int, SessionRecord]]
+        """
+        raise NotImplementedError()
+
+    def containsSessions(self, recipientIds, deviceId):
+        """
+        :type recipientIds: list[str]
+        :type deviceId: int
+        :return: the recipientIds which have a session with deviceId
+        :rtype: set[str]
+        """
+        return set(recipientId for recipientId in recipientIds if self.containsSession(recipientId, deviceId))
+
+    def storeSenderKeys(self, senderKeys):
+        """
+        :type senderKeys: list[tuple[SenderKeyName, SenderKeyRecord]]
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
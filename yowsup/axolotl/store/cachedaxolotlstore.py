@@ -0,0 +1,264 @@
+from yowsup.axolotl.store.base import YowAxolotlStore
+from axolotl.state.sessionrecord import SessionRecord
+from axolotl.groups.state.senderkeyrecord import SenderKeyRecord
+from collections import OrderedDict
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _SerializedRecord(object):
+    """Snapshot of a record as it was when it was stored"""
+    __slots__ = ("_serialized",)
+
+    def __init__(self, serialized):
+        self._serialized = serialized
+
+    def serialize(self):
+        return self._serialized
+
+
+class CachedAxolotlStore(YowAxolotlStore):
+    """
+    Write-back cache of deserialized session and sender key records in front of another store.
+
+    Loads are served from a bounded LRU of records, and stores only snapshot the record in memory. Snapshots are
+    written to the underlying store in one transaction by flush, which runs when max_dirty records are pending,
+    before a prekey is removed, and when called by the owner of the store (AxolotlControlLayer flushes periodically
+    while connected and on disconnect, AxolotlManagerFactory at exit). Everything else is passed through to the
+    underlying store.
+
+    Crash safety: session and sender key updates made since the last flush are lost if the process dies before the
+    next one, e.g. when it is killed or exits through os._exit. This is why AxolotlManagerFactory.CACHE_RECORDS is
+    off unless enabled. On restart such sessions are back at the last flushed state. If their ratchet advanced in
+    between, incoming messages fail to decrypt, and messages we send reuse message keys which recipients reject as
+    duplicates, so the affected sessions have to be rebuilt, as with any lost session. A new session is never lost
+    after the prekey it consumed was removed, since removing a prekey flushes first. Identities, prekeys and signed
+    prekeys are never deferred.
+    """
+    DEFAULT_MAX_RECORDS = 1024
+    DEFAULT_MAX_DIRTY = 256
+
+    def __init__(self, store, max_records=None, max_dirty=None):
+        """
+        :param store: store to cache records of
+        :type store: YowAxolotlStore
+        :param max_records: maximum number of deserialized records kept in memory per record type
+        :type max_records: int | None
+        :param max_dirty: number of pending records after which they are flushed
+        :type max_dirty: int | None
+        """
+        self._store = store
+        self._max_records = max_records or self.DEFAULT_MAX_RECORDS
+        self._max_dirty = max_dirty or self.DEFAULT_MAX_DIRTY
+        self._sessions = OrderedDict()  # type: OrderedDict[tuple[int, int], SessionRecord]
+        self._sender_keys = OrderedDict()  # type: OrderedDict[tuple[str, str], SenderKeyRecord]
+        self._dirty_sessions = {}  # type: dict[tuple[int, int], _SerializedRecord]
+        self._dirty_sender_keys = {}  # type: dict[tuple[str, str], tuple[SenderKeyName, _SerializedRecord]]
+        self._lock = threading.RLock()
+
+    def __str__(self):
+        return str(self._store)
+
+    def close(self):
+        self.flush()
+        self._store.close()
+
+    def flush(self):
+        """
+        Writes all pending session and sender key records to the underlying store
+        """
+        with self._lock:
+            if self._dirty_sessions:
+                logger.debug("Flushing %d sessions" % len(self._dirty_sessions))
+                self._store.storeSessions(
+                    [(key[0], key[1], record) for key, record in self._dirty_sessions.items()]
+                )
+                self._dirty_sessions = {}
+            if self._dirty_sender_keys:
+                logger.debug("Flushing %d sender keys" % len(self._dirty_sender_keys))
+                self._store.storeSenderKeys(list(self._dirty_sender_keys.values()))
+                self._dirty_sender_keys = {}
+
+    def revertSession(self, recipientId, deviceId):
+        """
+        Drops the in-memory record so that the next load returns the last stored state, for when an operation that
+        mutates the loaded record failed before storing it
+        """
+        with self._lock:
+            self._sessions.pop((recipientId, deviceId), None)
+
+    def revertSenderKey(self, senderKeyName):
+        with self._lock:
+            self._sender_keys.pop(self._sender_key_id(senderKeyName), None)
+
+    def _cache(self, records, key, record):
+        records[key] = record
+        if len(records) > self._max_records:
+            records.popitem(last=False)
+
+    def _flush_if_full(self):
+        if len(self._dirty_sessions) + len(self._dirty_sender_keys) >= self._max_dirty:
+            self.flush()
+
+    @staticmethod
+    def _sender_key_id(senderKeyName):
+        return senderKeyName.getGroupId(), senderKeyName.getSender().getName()
+
+    def loadSession(self, recipientId, deviceId):
+        key = (recipientId, deviceId)
+        with self._lock:
+            record = self._sessions.get(key)
+            if record is not None:
+                self._sessions.move_to_end(key)
+                return record
+            if key in self._dirty_sessions:
+                record = SessionRecord(serialized=self._dirty_sessions[key].serialize())
+            else:
+                record = self._store.loadSession(recipientId, deviceId)
+            self._cache(self._sessions, key, record)
+            return record
+
+    def storeSession(self, recipientId, deviceId, sessionRecord):
+        key = (recipientId, deviceId)
+        with self._lock:
+            # a stored record loads as not fresh, keep the cached one consistent with that
+            sessionRecord.fresh = False
+            self._cache(self._sessions, key, sessionRecord)
+            self._sessions.move_to_end(key)
+            self._dirty_sessions[key] = _SerializedRecord(sessionRecord.serialize())
+            self._flush_if_full()
+
+    def storeSessions(self, sessions):
+        with self._lock:
+            for recipientId, deviceId, sessionRecord in sessions:
+                self.storeSession(recipientId, deviceId, sessionRecord)
+
+    def containsSession(self, recipientId, deviceId):
+        key = (recipientId, deviceId)
+        with self._lock:
+            if key in self._dirty_sessions:
+                return True
+            record = self._sessions.get(key)
+            if record is not None:
+                return not record.isFresh()
+        return self._store.containsSession(recipientId, deviceId)
+
+    def containsSessions(self, recipientIds, deviceId):
+        found = set()
+        unknown = []
+        with self._lock:
+            for recipientId in recipientIds:
+                key = (recipientId, deviceId)
+                record = self._sessions.get(key)
+                if key in self._dirty_sessions or (record is not None and not record.isFresh()):
+                    found.add(recipientId)
+                elif record is None:
+                    unknown.append(recipientId)
+        if unknown:
+            found.update(self._store.containsSessions(unknown, deviceId))
+        return found
+
+    def getSubDeviceSessions(self, recipientId):
+        self.flush()
+        return self._store.getSubDeviceSessions(recipientId)
+
+    def deleteSession(self, recipientId, deviceId):
+        with self._lock:
+            self._sessions.pop((recipientId, deviceId), None)
+            self._dirty_sessions.pop((recipientId, deviceId), None)
+            self._store.deleteSession(recipientId, deviceId)
+
+    def deleteAllSessions(self, recipientId):
+        with self._lock:
+            for records in (self._sessions, self._dirty_sessions):
+                for key in [key for key in records if key[0] == recipientId]:
+                    del records[key]
+            self._store.deleteAllSessions(recipientId)
+
+    def loadSenderKey(self, senderKeyName):
+        key = self._sender_key_id(senderKeyName)
+        with self._lock:
+            record = self._sender_keys.get(key)
+            if record is not None:
+                self._sender_keys.move_to_end(key)
+                return record
+            if key in self._dirty_sender_keys:
+                record = SenderKeyRecord(serialized=self._dirty_sender_keys[key][1].serialize())
+            else:
+                record = self._store.loadSenderKey(senderKeyName)
+            self._cache(self._sender_keys, key, record)
+            return record
+
+    def storeSenderKey(self, senderKeyName, senderKeyRecord):
+        key = self._sender_key_id(senderKeyName)
+        with self._lock:
+            self._cache(self._sender_keys, key, senderKeyRecord)
+            self._sender_keys.move_to_end(key)
+            self._dirty_sender_keys[key] = (senderKeyName, _SerializedRecord(senderKeyRecord.serialize()))
+            self._flush_if_full()
+
+    def storeSenderKeys(self, senderKeys):
+        with self._lock:
+            for senderKeyName, senderKeyRecord in senderKeys:
+                self.storeSenderKey(senderKeyName, senderKeyRecord)
+
+    def removePreKey(self, preKeyId):
+        # a session built from this prekey must be persisted before the prekey is gone
+        self.flush()
+        self._store.removePreKey(preKeyId)
+
+    def getIdentityKeyPair(self):
+        return self._store.getIdentityKeyPair()
+
+    def getLocalRegistrationId(self):
+        return self._store.getLocalRegistrationId()
+
+    def saveIdentity(self, recepientId, identityKey):
+        self._store.saveIdentity(recepientId, identityKey)
+
+    def isTrustedIdentity(self, recepientId, identityKey):
+        return self._store.isTrustedIdentity(recepientId, identityKey)
+
+    def loadPreKey(self, preKeyId):
+        return self._store.loadPreKey(preKeyId)
+
+    def loadPreKeys(self):
+        return self._store.loadPreKeys()
+
+    def storePreKey(self, preKeyId, preKeyRecord):
+        self._store.storePreKey(preKeyId, preKeyRecord)
+
+    def storePreKeys(self, preKeyRecords):
+        self._store.storePreKeys(preKeyRecords)
+
+    def countPreKeys(self):
+        return self._store.countPreKeys()
+
+    def loadMaxPreKeyId(self):
+        return self._store.loadMaxPreKeyId()
+
+    def loadUnsentPreKeys(self):
+        return self._store.loadUnsentPreKeys()
+
+    def setPreKeysAsSent(self, preKeyIds):
+        self._store.setPreKeysAsSent(preKeyIds)
+
+    def containsPreKey(self, preKeyId):
+        return self._store.containsPreKey(preKeyId)
+
+    def loadSignedPreKey(self, signedPreKeyId):
+        return self._store.loadSignedPreKey(signedPreKeyId)
+
+    def loadSignedPreKeys(self):
+        return self._store.loadSignedPreKeys()
+
+    def storeSignedPreKey(self, signedPreKeyId, signedPreKeyRecord):
+        self._store.storeSignedPreKey(signedPreKeyId, signedPreKeyRecord)
+
+    def containsSignedPreKey(self, signedPreKeyId):
+        return self._store.containsSignedPreKey(signedPreKeyId)
+
+    def removeSignedPreKey(self, signedPreKeyId):
+        self._store.removeSignedPreKey(signedPreKeyId)
@@ -0,0 +1,285 @@
+import logging
+import os
+import struct
+import threading
+import zlib
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class AppendLogLockedError(Exception):
+    pass
+
+
+class _LogState(object):
+    __slots__ = ("fd", "index", "size", "dead", "readers", "retired")
+
+    def __init__(self, fd, index, size, dead):
+        self.fd = fd
+        self.index = index  # type: dict[int, dict[bytes, tuple[int, int]]]
+        self.size = size
+        self.dead = dead
+        # one element per reader of fd, appended and popped without a lock, list operations are atomic
+        self.readers = []  # type: list[None]
+        self.retired = False
+
+
+class AppendLog(object):
+    """
+    Key-value store persisted as an append-only log file.
+
+    Every write appends put/delete records, each carrying a crc32, and the latest record of a key wins. An in-memory
+    index maps each key to the position of its value, so reads are one positional read from the file and take no
+    lock: any number of threads can read while a single writer, serialized by a lock, appends. The file is rewritten
+    with only the live records once more than half of it is dead. An exclusive lock on the file keeps other processes
+    out.
+
+    Writes are handed to the OS before write returns, so they survive a crash of the process. Unless fsync is set,
+    a power loss may lose the latest writes; a partially written tail is detected through its crc and dropped when
+    the log is opened.
+
+    Keys are bytes within a namespace, a number from 0 to 255.
+    """
+    _HEADER = struct.Struct(">IBBHI")  # crc32, op, namespace, key length, value length
+    OP_PUT = 1
+    OP_DELETE = 2
+    COMPACT_MIN_BYTES = 1024 * 1024
+
+    def __init__(self, path, fsync=False):
+        """
+        :param path:
+        :type path: str
+        :param fsync: fsync after every write
+        :type fsync: bool
+        """
+        self._path = path
+        self._fsync = fsync
+        self._write_lock = threading.Lock()
+        self._retired = []  # type: list[_LogState] # states of compacted files, kept open while readers use them
+        self._state = self._load(self._open())
+
+    def __str__(self):
+        return self._path
+
+    def _open(self, path=None, flags=0):
+        """
+        :param path: file to open and lock, the log if None
+        :type path: str | None
+        :param flags: extra os.open flags
+        :type flags: int
+        :rtype: int
+        """
+        path = path or self._path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0) | flags, 0o600)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                os.close(fd)
+                raise AppendLogLockedError("%s is in use by another process" % path)
+        return fd
+
+    def _load(self, fd):
+        with open(self._path, "rb") as f:
+            data = memoryview(f.read())
+        header = self._HEADER
+        index = {}
+        offset = dead = 0
+        while offset + header.size <= len(data):
+            crc, op, namespace, key_length, value_length = header.unpack_from(data, offset)
+            key_offset = offset + header.size
+            end = key_offset + key_length + value_length
+            if end > len(data) or zlib.crc32(data[offset + 4:end]) & 0xffffffff != crc:
+                break
+            key = data[key_offset:key_offset + key_length].tobytes()
+            entries = index.setdefault(namespace, {})
+            previous = entries.pop(key, None)
+            if previous is not None:
+                dead += self._record_size(key, previous[1])
+            if op == self.OP_PUT:
+                entries[key] = (key_offset + key_length, value_length)
+            else:
+                dead += end - offset
+            offset = end
+        if offset < len(data):
+            logger.warning("Dropping %d bytes of incomplete records at the end of %s" % (len(data) - offset, self._path))
+            os.ftruncate(fd, offset)
+        return _LogState(fd, index, offset, dead)
+
+    @classmethod
+    def _record_size(cls, key, value_length):
+        return cls._HEADER.size + len(key) + value_length
+
+    @classmethod
+    def _encode(cls, out, op, namespace, key, value):
+        start = len(out)
+        out += cls._HEADER.pack(0, op, namespace, len(key), len(value))
+        out += key
+        out += value
+        struct.pack_into(">I", out, start, zlib.crc32(memoryview(out)[start + 4:]) & 0xffffffff)
+
+    def _acquire(self):
+        """
+        :return: the current state, registered as read from until passed to _release
+        :rtype: _LogState
+        """
+        while True:
+            state = self._state
+            state.readers.append(None)
+            # retired is set before compaction looks for readers: either it sees this reader and keeps fd open, or
+            # this reader sees retired and moves on to the new state
+            if not state.retired:
+                return state
+            state.readers.pop()
+
+    @staticmethod
+    def _release(state):
+        state.readers.pop()
+
+    def _read(self, fd, offset, length):
+        data = os.pread(fd, length, offset)
+        if len(data) != length:
+            raise IOError("Short read from %s" % self._path)
+        return data
+
+    def get(self, namespace, key):
+        """
+        :type namespace: int
+        :type key: bytes
+        :rtype: bytes | None
+        """
+        state = self._acquire()
+        try:
+            entry = state.index.get(namespace, {}).get(key)
+            if entry is None:
+                return None
+            return self._read(state.fd, entry[0], entry[1])
+        finally:
+            self._release(state)
+
+    def contains(self, namespace, key):
+        return key in self._state.index.get(namespace, {})
+
+    def keys(self, namespace):
+        """
+        :return: keys of the namespace, in the order they were first written in
+        :rtype: list[bytes]
+        """
+        return list(self._state.index.get(namespace, {}))
+
+    def items(self, namespace):
+        """
+        :rtype: list[tuple[bytes, bytes]]
+        """
+        state = self._acquire()
+        try:
+            # list() copies the entries without releasing the GIL, so it's safe against a concurrent write
+            return [(key, self._read(state.fd, offset, length))
+                    for key, (offset, length) in list(state.index.get(namespace, {}).items())]
+        finally:
+            self._release(state)
+
+    def count(self, namespace):
+        return len(self._state.index.get(namespace, {}))
+
+    def write(self, puts=(), deletes=()):
+        """
+        Appends all puts and deletes with a single write
+        :param puts:
+        :type puts: list[tuple[int, bytes, bytes]]
+        :param deletes:
+        :type deletes: list[tuple[int, bytes]]
+        """
+        with self._write_lock:
+            state = self._state
+            out = bytearray()
+            updates = []
+            # whether keys put or deleted by this batch exist after it, deletes of keys which don't are skipped
+            exists = {}
+            for namespace, key, value in puts:
+                self._encode(out, self.OP_PUT, namespace, key, value)
+                updates.append((namespace, key, (state.size + len(out) - len(value), len(value))))
+                exists[(namespace, key)] = True
+            for namespace, key in deletes:
+                if exists.get((namespace, key), key in state.index.get(namespace, {})):
+                    self._encode(out, self.OP_DELETE, namespace, key, b"")
+                    updates.append((namespace, key, None))
+                    exists[(namespace, key)] = False
+            if not out:
+                return
+            view = memoryview(out)
+            while view:
+                view = view[os.write(state.fd, view):]
+            if self._fsync:
+                os.fsync(state.fd)
+
+            # the file is written before the index points into it, readers always find complete values
+            state.size += len(out)
+            for namespace, key, entry in updates:
+                entries = state.index.setdefault(namespace, {})
+                previous = entries.pop(key, None) if entry is None else entries.get(key)
+                if previous is not None:
+                    state.dead += self._record_size(key, previous[1])
+                if entry is None:
+                    state.dead += self._record_size(key, 0)
+                else:
+                    entries[key] = entry
+            if state.dead > self.COMPACT_MIN_BYTES and state.dead > state.size // 2:
+                self._compact()
+
+    def compact(self):
+        with self._write_lock:
+            self._compact()
+
+    def _compact(self):
+        state = self._state
+        logger.debug("Compacting %s, %d of %d bytes are dead" % (self._path, state.dead, state.size))
+        out = bytearray()
+        index = {}
+        for namespace, entries in state.index.items():
+            compacted = index[namespace] = {}
+            for key, (offset, length) in entries.items():
+                self._encode(out, self.OP_PUT, namespace, key, self._read(state.fd, offset, length))
+                compacted[key] = (len(out) - length, length)
+
+        # the compacted file is locked before it replaces the log, so that no other process can take the log over in
+        # between
+        path = self._path + ".compact"
+        fd = self._open(path, os.O_TRUNC)
+        try:
+            view = memoryview(out)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+            os.replace(path, self._path)
+        except Exception:
+            os.close(fd)
+            raise
+        self._state = _LogState(fd, index, len(out), 0)
+
+        state.retired = True
+        self._retired.append(state)
+        self._close_retired()
+
+    def _close_retired(self):
+        """
+        Closes the files of retired states no reader uses anymore, the others are looked at again on the next
+        compaction
+        """
+        retired = []
+        for state in self._retired:
+            if state.readers:
+                retired.append(state)
+            else:
+                os.close(state.fd)
+        self._retired = retired
+
+    def close(self):
+        with self._write_lock:
+            for state in self._retired + [self._state]:
+                os.close(state.fd)
+            self._retired = []
@@ -0,0 +1,182 @@
+from axolotl.state.prekeyrecord import PreKeyRecord
+from axolotl.state.signedprekeyrecord import SignedPreKeyRecord
+from axolotl.state.sessionrecord import SessionRecord
+from axolotl.groups.state.senderkeyrecord import SenderKeyRecord
+from axolotl.identitykeypair import IdentityKeyPair
+from axolotl.invalidkeyidexception import InvalidKeyIdException as AxolotlInvalidKeyIdException
+from axolotl.util.keyhelper import KeyHelper
+from yowsup.axolotl.exceptions import InvalidKeyIdException
+from yowsup.axolotl.store.base import YowAxolotlStore
+from yowsup.axolotl.store.log.appendlog import AppendLog
+import struct
+
+_PREKEY_ID = struct.Struct(">I")
+
+
+class LogAxolotlStore(YowAxolotlStore):
+    """
+    Axolotl store kept in an AppendLog file. Reads don't block each other or the writer, writes are serialized.
+    """
+    NS_LOCAL = 0
+    NS_IDENTITIES = 1
+    NS_PREKEYS = 2
+    NS_SIGNED_PREKEYS = 3
+    NS_SESSIONS = 4
+    NS_SENDER_KEYS = 5
+
+    KEY_IDENTITY = b"identity"
+    KEY_REGISTRATION_ID = b"registration_id"
+
+    # prekey values are prefixed with whether the prekey was sent to the server
+    PREKEY_UNSENT = b"\x00"
+    PREKEY_SENT = b"\x01"
+
+    def __init__(self, path, fsync=False):
+        """
+        :param path: path to the log file
+        :type path: str
+        :param fsync: see AppendLog
+        :type fsync: bool
+        """
+        self._log = AppendLog(path, fsync)
+        if self._log.get(self.NS_LOCAL, self.KEY_IDENTITY) is None:
+            self._log.write(puts=[
+                (self.NS_LOCAL, self.KEY_IDENTITY, KeyHelper.generateIdentityKeyPair().serialize()),
+                (self.NS_LOCAL, self.KEY_REGISTRATION_ID, _PREKEY_ID.pack(KeyHelper.generateRegistrationId(True)))
+            ])
+
+    def __str__(self):
+        return str(self._log)
+
+    def close(self):
+        self._log.close()
+
+    @staticmethod
+    def _session_key(recipientId, deviceId):
+        return ("%s\0%s" % (recipientId, deviceId)).encode()
+
+    @staticmethod
+    def _sender_key_key(senderKeyName):
+        return ("%s\0%s" % (senderKeyName.getGroupId(), senderKeyName.getSender().getName())).encode()
+
+    def getIdentityKeyPair(self):
+        return IdentityKeyPair(serialized=self._log.get(self.NS_LOCAL, self.KEY_IDENTITY))
+
+    def getLocalRegistrationId(self):
+        return _PREKEY_ID.unpack(self._log.get(self.NS_LOCAL, self.KEY_REGISTRATION_ID))[0]
+
+    def saveIdentity(self, recepientId, identityKey):
+        self._log.write(puts=[(self.NS_IDENTITIES, str(recepientId).encode(), identityKey.getPublicKey().serialize())])
+
+    def isTrustedIdentity(self, recepientId, identityKey):
+        stored = self._log.get(self.NS_IDENTITIES, str(recepientId).encode())
+        return stored is None or stored == identityKey.getPublicKey().serialize()
+
+    def loadPreKey(self, preKeyId):
+        value = self._log.get(self.NS_PREKEYS, _PREKEY_ID.pack(preKeyId))
+        if value is None:
+            raise InvalidKeyIdException("No such prekeyrecord!")
+        return PreKeyRecord(serialized=value[1:])
+
+    def loadPreKeys(self):
+        return [PreKeyRecord(serialized=value[1:]) for _, value in self._log.items(self.NS_PREKEYS)]
+
+    def loadUnsentPreKeys(self):
+        return [PreKeyRecord(serialized=value[1:]) for _, value in self._log.items(self.NS_PREKEYS)
+                if value[:1] == self.PREKEY_UNSENT]
+
+    def storePreKey(self, preKeyId, preKeyRecord):
+        self.storePreKeys([preKeyRecord])
+
+    def storePreKeys(self, preKeyRecords):
+        self._log.write(puts=[
+            (self.NS_PREKEYS, _PREKEY_ID.pack(record.getId()), self.PREKEY_UNSENT + record.serialize())
+            for record in preKeyRecords
+        ])
+
+    def setPreKeysAsSent(self, preKeyIds):
+        puts = []
+        for preKeyId in preKeyIds:
+            key = _PREKEY_ID.pack(preKeyId)
+            value = self._log.get(self.NS_PREKEYS, key)
+            if value is not None:
+                puts.append((self.NS_PREKEYS, key, self.PREKEY_SENT + value[1:]))
+        self._log.write(puts=puts)
+
+    def countPreKeys(self):
+        return self._log.count(self.NS_PREKEYS)
+
+    def loadMaxPreKeyId(self):
+        return max([_PREKEY_ID.unpack(key)[0] for key in self._log.keys(self.NS_PREKEYS)] or [0])
+
+    def containsPreKey(self, preKeyId):
+        return self._log.contains(self.NS_PREKEYS, _PREKEY_ID.pack(preKeyId))
+
+    def removePreKey(self, preKeyId):
+        self._log.write(deletes=[(self.NS_PREKEYS, _PREKEY_ID.pack(preKeyId))])
+
+    def loadSignedPreKey(self, signedPreKeyId):
+        value = self._log.get(self.NS_SIGNED_PREKEYS, _PREKEY_ID.pack(signedPreKeyId))
+        if value is None:
+            raise AxolotlInvalidKeyIdException("No such signedprekeyrecord! %s " % signedPreKeyId)
+        return SignedPreKeyRecord(serialized=value)
+
+    def loadSignedPreKeys(self):
+        return [SignedPreKeyRecord(serialized=value) for _, value in self._log.items(self.NS_SIGNED_PREKEYS)]
+
+    def storeSignedPreKey(self, signedPreKeyId, signedPreKeyRecord):
+        self._log.write(puts=[
+            (self.NS_SIGNED_PREKEYS, _PREKEY_ID.pack(signedPreKeyId), signedPreKeyRecord.serialize())
+        ])
+
+    def containsSignedPreKey(self, signedPreKeyId):
+        return self._log.contains(self.NS_SIGNED_PREKEYS, _PREKEY_ID.pack(signedPreKeyId))
+
+    def removeSignedPreKey(self, signedPreKeyId):
+        self._log.write(deletes=[(self.NS_SIGNED_PREKEYS, _PREKEY_ID.pack(signedPreKeyId))])
+
+    def loadSession(self, recepientId, deviceId):
+        value = self._log.get(self.NS_SESSIONS, self._session_key(recepientId, deviceId))
+        return SessionRecord(serialized=value) if value is not None else SessionRecord()
+
+    def getSubDeviceSessions(self, recepientId):
+        prefix = ("%s\0" % recepientId).encode()
+        return [int(key[len(prefix):]) for key in self._log.keys(self.NS_SESSIONS) if key.startswith(prefix)]
+
+    def storeSession(self, recepientId, deviceId, sessionRecord):
+        self.storeSessions([(recepientId, deviceId, sessionRecord)])
+
+    def storeSessions(self, sessions):
+        self._log.write(puts=[
+            (self.NS_SESSIONS, self._session_key(recepientId, deviceId), sessionRecord.serialize())
+            for recepientId, deviceId, sessionRecord in sessions
+        ])
+
+    def containsSession(self, recepientId, deviceId):
+        return self._log.contains(self.NS_SESSIONS, self._session_key(recepientId, deviceId))
+
+    def containsSessions(self, recepientIds, deviceId):
+        return set(recepientId for recepientId in recepientIds
+                   if self._log.contains(self.NS_SESSIONS, self._session_key(recepientId, deviceId)))
+
+    def deleteSession(self, recepientId, deviceId):
+        self._log.write(deletes=[(self.NS_SESSIONS, self._session_key(recepientId, deviceId))])
+
+    def deleteAllSessions(self, recepientId):
+        prefix = ("%s\0" % recepientId).encode()
+        self._log.write(deletes=[
+            (self.NS_SESSIONS, key) for key in self._log.keys(self.NS_SESSIONS) if key.startswith(prefix)
+        ])
+
+    def loadSenderKey(self, senderKeyName):
+        value = self._log.get(self.NS_SENDER_KEYS, self._sender_key_key(senderKeyName))
+        return SenderKeyRecord(serialized=value) if value is not None else SenderKeyRecord()
+
+    def storeSenderKey(self, senderKeyName, senderKeyRecord):
+        self.storeSenderKeys([(senderKeyName, senderKeyRecord)])
+
+    def storeSenderKeys(self, senderKeys):
+        self._log.write(puts=[
+            (self.NS_SENDER_KEYS, self._sender_key_key(senderKeyName), senderKeyRecord.serialize())
+            for senderKeyName, senderKeyRecord in senderKeys
+        ])
@@ -0,0 +1,102 @@
+from yowsup.axolotl.store.log import appendlog
+from yowsup.axolotl.store.log.appendlog import AppendLog, AppendLogLockedError
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class AppendLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.log")
+        self.log = AppendLog(self.path)
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.directory)
+
+    def reopen(self):
+        self.log.close()
+        self.log = AppendLog(self.path)
+
+    def test_put_delete(self):
+        self.log.write(puts=[(1, b"a", b"1"), (1, b"b", b"2"), (2, b"a", b"3")])
+        self.log.write(puts=[(1, b"a", b"4")], deletes=[(1, b"b"), (1, b"missing")])
+        for _ in range(0, 2):
+            self.assertEqual(b"4", self.log.get(1, b"a"))
+            self.assertIsNone(self.log.get(1, b"b"))
+            self.assertEqual(b"3", self.log.get(2, b"a"))
+            self.assertEqual([(b"a", b"4")], self.log.items(1))
+            self.assertEqual(1, self.log.count(2))
+            self.reopen()
+
+    def test_put_delete_same_batch(self):
+        self.log.write(puts=[(1, b"a", b"1")])
+        self.log.write(puts=[(1, b"a", b"2"), (1, b"b", b"3")], deletes=[(1, b"a"), (1, b"a"), (1, b"c")])
+        for _ in range(0, 2):
+            self.assertIsNone(self.log.get(1, b"a"))
+            self.assertEqual([b"b"], self.log.keys(1))
+            self.reopen()
+        self.log.write(puts=[(1, b"b", b"4")], deletes=[(1, b"b"), (1, b"b")])
+        self.assertEqual(0, self.log.count(1))
+        self.log.compact()
+        self.assertEqual(0, os.path.getsize(self.path))
+
+    def test_torn_tail_dropped(self):
+        self.log.write(puts=[(1, b"a", b"1")])
+        self.log.write(puts=[(1, b"b", b"2" * 100)])
+        self.log.close()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 10)
+        self.log = AppendLog(self.path)
+        self.assertEqual(b"1", self.log.get(1, b"a"))
+        self.assertFalse(self.log.contains(1, b"b"))
+        self.log.write(puts=[(1, b"c", b"3")])
+        self.reopen()
+        self.assertEqual([b"a", b"c"], self.log.keys(1))
+
+    def test_corrupt_record_dropped(self):
+        self.log.write(puts=[(1, b"a", b"1")])
+        size = os.path.getsize(self.path)
+        self.log.write(puts=[(1, b"a", b"2")])
+        self.log.close()
+        with open(self.path, "r+b") as f:
+            f.seek(size + AppendLog._HEADER.size + 1)
+            f.write(b"x")
+        self.log = AppendLog(self.path)
+        self.assertEqual(b"1", self.log.get(1, b"a"))
+
+    def test_compaction(self):
+        value = b"x" * 4096
+        for i in range(0, 600):
+            self.log.write(puts=[(1, b"key%d" % (i % 10), value + b"%d" % i)])
+        self.assertLess(os.path.getsize(self.path), AppendLog.COMPACT_MIN_BYTES * 2)
+        self.log.compact()
+        self.assertEqual(10 * (AppendLog._HEADER.size + 4 + len(value) + 3), os.path.getsize(self.path))
+        self.reopen()
+        self.assertEqual(value + b"599", self.log.get(1, b"key9"))
+        self.assertEqual(10, self.log.count(1))
+
+    def test_reader_spanning_compactions(self):
+        self.log.write(puts=[(1, b"a", b"1")])
+        self.log.write(puts=[(1, b"a", b"2")])
+        state = self.log._acquire()
+        offset, length = state.index[1][b"a"]
+        self.log.compact()
+        self.log.compact()
+        self.assertEqual(b"2", self.log._read(state.fd, offset, length))
+        self.log._release(state)
+        self.assertEqual([state], self.log._retired)
+        self.log.compact()
+        self.assertEqual([], self.log._retired)
+        self.assertEqual(b"2", self.log.get(1, b"a"))
+
+    def test_locked(self):
+        if appendlog.fcntl is None:
+            self.skipTest("file locking is not available")
+        self.assertRaises(AppendLogLockedError, AppendLog, self.path)
+        self.log.write(puts=[(1, b"a", b"1")])
+        self.log.compact()
+        self.assertRaises(AppendLogLockedError, AppendLog, self.path)
+        self.assertFalse(os.path.exists(self.path + ".compact"))
@@ -1,88 +1,184 @@
-from axolotl.state.axolotlstore import AxolotlStore
+from yowsup.axolotl.store.base import YowAxolotlStore
 from .liteidentitykeystore import LiteIdentityKeyStore
 from .liteprekeystore import LitePreKeyStore
 from .litesessionstore import LiteSessionStore
 from .litesignedprekeystore import LiteSignedPreKeyStore
 from .litesenderkeystore import LiteSenderKeyStore
+import functools
 import sqlite3
-
-
-class LiteAxolotlStore(AxolotlStore):
-    def __init__(self, db):
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def locked(fn):
+    """
+    Runs a store method under the store's lock. All stores share one connection, a transaction of one thread would
+    otherwise take in the statements of another, such as AxolotlManager storing prekeys on its worker.
+    """
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+
+class LiteAxolotlStore(YowAxolotlStore):
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db, wal=False):
+        """
+        :param db: path to the database file
+        :type db: str
+        :param wal: use write-ahead logging with synchronous=NORMAL. Commits then no longer wait for the disk, a power
+        loss may lose the latest transactions but does not corrupt the database
+        :type wal: bool
+        """
         conn = sqlite3.connect(db, check_same_thread=False)
         conn.text_factory = bytes
+        if wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
         self._db = db
+        self._conn = conn
+        self._lock = threading.RLock()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        existing = conn.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0] > 0
         self.identityKeyStore = LiteIdentityKeyStore(conn)
         self.preKeyStore = LitePreKeyStore(conn)
         self.signedPreKeyStore = LiteSignedPreKeyStore(conn)
         self.sessionStore = LiteSessionStore(conn)
         self.senderKeyStore = LiteSenderKeyStore(conn)
+        if existing and version < self.SCHEMA_VERSION:
+            logger.info("Migrating %s from schema version %d to %d" % (db, version, self.SCHEMA_VERSION))
+            self.sessionStore.migrate(version)
+        if version != self.SCHEMA_VERSION:
+            conn.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
 
     def __str__(self):
         return self._db
 
+    @locked
+    def close(self):
+        self._conn.close()
+
+    @locked
     def getIdentityKeyPair(self):
         return self.identityKeyStore.getIdentityKeyPair()
 
+    @locked
     def getLocalRegistrationId(self):
         return self.identityKeyStore.getLocalRegistrationId()
 
+    @locked
     def saveIdentity(self, recepientId, identityKey):
         self.identityKeyStore.saveIdentity(recepientId, identityKey)
 
+    @locked
     def isTrustedIdentity(self, recepientId, identityKey):
         return self.identityKeyStore.isTrustedIdentity(recepientId, identityKey)
 
+    @locked
     def loadPreKey(self, preKeyId):
         return self.preKeyStore.loadPreKey(preKeyId)
 
+    @locked
     def loadPreKeys(self):
         return self.preKeyStore.loadPendingPreKeys()
 
+    @locked
     def storePreKey(self, preKeyId, preKeyRecord):
         self.preKeyStore.storePreKey(preKeyId, preKeyRecord)
 
+    @locked
+    def storePreKeys(self, preKeyRecords):
+        self.preKeyStore.storePreKeys(preKeyRecords)
+
+    @locked
+    def countPreKeys(self):
+        return self.preKeyStore.countPendingPreKeys()
+
+    @locked
+    def loadMaxPreKeyId(self):
+        return self.preKeyStore.loadMaxPreKeyId()
+
+    @locked
+    def loadUnsentPreKeys(self):
+        return self.preKeyStore.loadUnsentPendingPreKeys()
+
+    @locked
+    def setPreKeysAsSent(self, preKeyIds):
+        self.preKeyStore.setAsSent(preKeyIds)
+
+    @locked
     def containsPreKey(self, preKeyId):
         return self.preKeyStore.containsPreKey(preKeyId)
 
+    @locked
     def removePreKey(self, preKeyId):
         self.preKeyStore.removePreKey(preKeyId)
 
+    @locked
     def loadSession(self, recepientId, deviceId):
         return self.sessionStore.loadSession(recepientId, deviceId)
 
+    @locked
     def getSubDeviceSessions(self, recepientId):
         return self.sessionStore.getSubDeviceSessions(recepientId)
 
+    @locked
     def storeSession(self, recepientId, deviceId, sessionRecord):
         self.sessionStore.storeSession(recepientId, deviceId, sessionRecord)
 
+    @locked
+    def storeSessions(self, sessions):
+        self.sessionStore.storeSessions(sessions)
+
+    @locked
     def containsSession(self, recepientId, deviceId):
         return self.sessionStore.containsSession(recepientId, deviceId)
 
+    @locked
+    def containsSessions(self, recepientIds, deviceId):
+        return self.sessionStore.containsSessions(recepientIds, deviceId)
+
+    @locked
     def deleteSession(self, recepientId, deviceId):
         self.sessionStore.deleteSession(recepientId, deviceId)
 
+    @locked
     def deleteAllSessions(self, recepientId):
         self.sessionStore.deleteAllSessions(recepientId)
 
+    @locked
     def loadSignedPreKey(self, signedPreKeyId):
         return self.signedPreKeyStore.loadSignedPreKey(signedPreKeyId)
 
+    @locked
     def loadSignedPreKeys(self):
         return self.signedPreKeyStore.loadSignedPreKeys()
 
+    @locked
     def storeSignedPreKey(self, signedPreKeyId, signedPreKeyRecord):
         self.signedPreKeyStore.storeSignedPreKey(signedPreKeyId, signedPreKeyRecord)
 
+    @locked
     def containsSignedPreKey(self, signedPreKeyId):
         return self.signedPreKeyStore.containsSignedPreKey(signedPreKeyId)
 
+    @locked
     def removeSignedPreKey(self, signedPreKeyId):
         self.signedPreKeyStore.removeSignedPreKey(signedPreKeyId)
 
+    @locked
     def loadSenderKey(self, senderKeyName):
         return self.senderKeyStore.loadSenderKey(senderKeyName)
 
+    @locked
     def storeSenderKey(self, senderKeyName, senderKeyRecord):
         self.senderKeyStore.storeSenderKey(senderKeyName, senderKeyRecord)
+
+    @locked
+    def storeSenderKeys(self, senderKeys):
+        self.senderKeyStore.storeSenderKeys(senderKeys)
@@ -3,7 +3,6 @@ from axolotl.identitykey import IdentityKey
 from axolotl.identitykeypair import IdentityKeyPair
 from axolotl.util.keyhelper import KeyHelper
 from axolotl.ecc.djbec import *
-import sys
 
 
 class LiteIdentityKeyStore(IdentityKeyStore):
@@ -47,10 +46,6 @@ class LiteIdentityKeyStore(IdentityKeyStore):
         pubKey = identityKeyPair.getPublicKey().getPublicKey().serialize()
         privKey = identityKeyPair.getPrivateKey().serialize()
 
-        if sys.version_info < (2,7):
-            pubKey = buffer(pubKey)
-            privKey = buffer(privKey)
-
         c.execute(q, (registrationId,
                       pubKey,
                       privKey))
@@ -58,16 +53,11 @@ class LiteIdentityKeyStore(IdentityKeyStore):
         self.dbConn.commit()
 
     def saveIdentity(self, recipientId, identityKey):
-        q = "DELETE FROM identities WHERE recipient_id=?"
-        self.dbConn.cursor().execute(q, (recipientId,))
-        self.dbConn.commit()
-
-
-        q = "INSERT INTO identities (recipient_id, public_key) VALUES(?, ?)"
+        q = "INSERT OR REPLACE INTO identities (recipient_id, public_key) VALUES(?, ?)"
         c = self.dbConn.cursor()
 
         pubKey = identityKey.getPublicKey().serialize()
-        c.execute(q, (recipientId, buffer(pubKey) if sys.version_info < (2,7) else pubKey))
+        c.execute(q, (recipientId, pubKey))
         self.dbConn.commit()
 
     def isTrustedIdentity(self, recipientId, identityKey):
@@ -80,7 +70,4 @@ class LiteIdentityKeyStore(IdentityKeyStore):
 
         pubKey = identityKey.getPublicKey().serialize()
 
-        if sys.version_info < (2, 7):
-            pubKey = buffer(pubKey)
-
         return result[0] == pubKey
\ No newline at end of file
@@ -1,7 +1,6 @@
 from axolotl.state.prekeystore import PreKeyStore
 from axolotl.state.prekeyrecord import PreKeyRecord
 from yowsup.axolotl.exceptions import InvalidKeyIdException
-import sys
 
 
 class LitePreKeyStore(PreKeyStore):
@@ -42,11 +41,9 @@ class LitePreKeyStore(PreKeyStore):
         :return:
         :rtype:
         """
-        for prekeyId in prekeyIds:
-            q = "UPDATE prekeys SET sent_to_server = ? WHERE prekey_id = ?"
-            cursor = self.dbConn.cursor()
-            cursor.execute(q, (1, prekeyId))
-        self.dbConn.commit()
+        q = "UPDATE prekeys SET sent_to_server = ? WHERE prekey_id = ?"
+        with self.dbConn:
+            self.dbConn.executemany(q, ((1, prekeyId) for prekeyId in prekeyIds))
 
     def loadPendingPreKeys(self):
         q = "SELECT record FROM prekeys"
@@ -61,9 +58,25 @@ class LitePreKeyStore(PreKeyStore):
         q = "INSERT INTO prekeys (prekey_id, record) VALUES(?,?)"
         cursor = self.dbConn.cursor()
         serialized = preKeyRecord.serialize()
-        cursor.execute(q, (preKeyId, buffer(serialized) if sys.version_info < (2,7) else serialized))
+        cursor.execute(q, (preKeyId, serialized))
         self.dbConn.commit()
 
+    def storePreKeys(self, preKeyRecords):
+        """
+        Stores all records in a single transaction
+        :param preKeyRecords:
+        :type preKeyRecords: list[PreKeyRecord]
+        """
+        q = "INSERT INTO prekeys (prekey_id, record) VALUES(?,?)"
+        with self.dbConn:
+            self.dbConn.executemany(q, ((record.getId(), record.serialize()) for record in preKeyRecords))
+
+    def countPendingPreKeys(self):
+        q = "SELECT count(*) FROM prekeys"
+        cursor = self.dbConn.cursor()
+        cursor.execute(q)
+        return cursor.fetchone()[0]
+
     def containsPreKey(self, preKeyId):
         q = "SELECT record FROM prekeys WHERE prekey_id = ?"
         cursor = self.dbConn.cursor()
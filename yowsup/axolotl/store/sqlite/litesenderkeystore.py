@@ -1,7 +1,6 @@
 from axolotl.groups.state.senderkeystore import SenderKeyStore
 from axolotl.groups.state.senderkeyrecord import SenderKeyRecord
 import sqlite3
-import sys
 class LiteSenderKeyStore(SenderKeyStore):
     def __init__(self, dbConn):
         """
@@ -22,8 +21,6 @@ class LiteSenderKeyStore(SenderKeyStore):
         q = "INSERT OR REPLACE INTO sender_keys (group_id, sender_id, record) VALUES(?,?, ?)"
         cursor = self.dbConn.cursor()
         serialized = senderKeyRecord.serialize()
-        if sys.version_info < (2,7):
-            serialized = buffer(serialized)
         try:
             cursor.execute(q, (senderKeyName.getGroupId(), senderKeyName.getSender().getName(), serialized))
             self.dbConn.commit()
@@ -33,6 +30,18 @@ class LiteSenderKeyStore(SenderKeyStore):
             cursor.execute(q, (serialized, senderKeyName.getGroupId(), senderKeyName.getSender().getName()))
             self.dbConn.commit()
 
+    def storeSenderKeys(self, senderKeys):
+        """
+        Stores all sender keys in a single transaction
+        :type senderKeys: list[tuple[SenderKeyName, SenderKeyRecord]]
+        """
+        q = "INSERT OR REPLACE INTO sender_keys (group_id, sender_id, record) VALUES(?,?, ?)"
+        with self.dbConn:
+            self.dbConn.executemany(q, (
+                (senderKeyName.getGroupId(), senderKeyName.getSender().getName(), senderKeyRecord.serialize())
+                for senderKeyName, senderKeyRecord in senderKeys
+            ))
+
     def loadSenderKey(self, senderKeyName):
         """
         :type senderKeyName: SenderKeyName
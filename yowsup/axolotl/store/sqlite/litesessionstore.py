@@ -1,15 +1,39 @@
 from axolotl.state.sessionstore import SessionStore
 from axolotl.state.sessionrecord import SessionRecord
-import sys
 class LiteSessionStore(SessionStore):
+    # stays below SQLITE_MAX_VARIABLE_NUMBER of older sqlite versions
+    MAX_QUERY_PARAMS = 500
+
     def __init__(self, dbConn):
         """
         :type dbConn: Connection
         """
         self.dbConn = dbConn
         dbConn.execute("CREATE TABLE IF NOT EXISTS sessions (_id INTEGER PRIMARY KEY AUTOINCREMENT,"
-                       "recipient_id INTEGER UNIQUE, device_id INTEGER, record BLOB, timestamp INTEGER);")
+                       "recipient_id INTEGER, device_id INTEGER, record BLOB, timestamp INTEGER,"
+                       "UNIQUE(recipient_id, device_id));")
 
+    def migrate(self, version):
+        """
+        :param version: schema version of the database being opened
+        :type version: int
+        """
+        if version < 1:
+            # sessions used to be unique per recipient_id only, which left (recipient_id, device_id) lookups without a
+            # matching index and made a REPLACE by (recipient_id, device_id) impossible
+            self.dbConn.execute("BEGIN")
+            try:
+                self.dbConn.execute("CREATE TABLE sessions_v1 (_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                                    "recipient_id INTEGER, device_id INTEGER, record BLOB, timestamp INTEGER,"
+                                    "UNIQUE(recipient_id, device_id));")
+                self.dbConn.execute("INSERT INTO sessions_v1 (_id, recipient_id, device_id, record, timestamp) "
+                                    "SELECT _id, recipient_id, device_id, record, timestamp FROM sessions")
+                self.dbConn.execute("DROP TABLE sessions")
+                self.dbConn.execute("ALTER TABLE sessions_v1 RENAME TO sessions")
+                self.dbConn.commit()
+            except:
+                self.dbConn.rollback()
+                raise
 
     def loadSession(self, recipientId, deviceId):
         q = "SELECT record FROM sessions WHERE recipient_id = ? AND device_id = ?"
@@ -32,14 +56,24 @@ class LiteSessionStore(SessionStore):
         return deviceIds
 
     def storeSession(self, recipientId, deviceId, sessionRecord):
-        self.deleteSession(recipientId, deviceId)
-
-        q = "INSERT INTO sessions(recipient_id, device_id, record) VALUES(?,?,?)"
+        q = "INSERT OR REPLACE INTO sessions(recipient_id, device_id, record) VALUES(?,?,?)"
         c = self.dbConn.cursor()
         serialized = sessionRecord.serialize()
-        c.execute(q, (recipientId, deviceId, buffer(serialized) if sys.version_info < (2,7) else serialized))
+        c.execute(q, (recipientId, deviceId, serialized))
         self.dbConn.commit()
 
+    def storeSessions(self, sessions):
+        """
+        Stores all sessions in a single transaction
+        :param sessions:
+        :type sessions: list[tuple[int, int, SessionRecord]]
+        """
+        q = "INSERT OR REPLACE INTO sessions(recipient_id, device_id, record) VALUES(?,?,?)"
+        with self.dbConn:
+            self.dbConn.executemany(
+                q, ((recipientId, deviceId, record.serialize()) for recipientId, deviceId, record in sessions)
+            )
+
     def containsSession(self, recipientId, deviceId):
         q = "SELECT record FROM sessions WHERE recipient_id = ? AND device_id = ?"
         c = self.dbConn.cursor()
@@ -48,6 +82,24 @@ class LiteSessionStore(SessionStore):
 
         return result is not None
 
+    def containsSessions(self, recipientIds, deviceId):
+        """
+        :return: the recipientIds which have a session with deviceId
+        :rtype: set
+        """
+        # recipient_id has integer affinity, numeric ids come back as int
+        recipientIds = {str(recipientId): recipientId for recipientId in recipientIds}
+        ids = list(recipientIds.values())
+        found = set()
+        for i in range(0, len(ids), self.MAX_QUERY_PARAMS):
+            chunk = ids[i:i + self.MAX_QUERY_PARAMS]
+            q = "SELECT recipient_id FROM sessions WHERE device_id = ? AND recipient_id IN (%s)" % \
+                ",".join("?" * len(chunk))
+            c = self.dbConn.cursor()
+            c.execute(q, [deviceId] + chunk)
+            found.update(recipientIds[str(r[0])] for r in c.fetchall())
+        return found
+
     def deleteSession(self, recipientId, deviceId):
         q = "DELETE FROM sessions WHERE recipient_id = ? AND device_id = ?"
         self.dbConn.cursor().execute(q, (recipientId, deviceId))
@@ -0,0 +1,61 @@
+from axolotl.state.sessionrecord import SessionRecord
+from axolotl.state.sessionstate import SessionState
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+
+def session_record(version):
+    state = SessionState()
+    state.setSessionVersion(version)
+    return SessionRecord(sessionState=state)
+
+
+class LiteAxolotlStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = os.path.join(self.directory, "axolotl.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_wal(self):
+        store = LiteAxolotlStore(self.db, wal=True)
+        conn = store.sessionStore.dbConn
+        self.assertEqual(b"wal", conn.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual(1, conn.execute("PRAGMA synchronous").fetchone()[0])
+        self.assertEqual(LiteAxolotlStore.SCHEMA_VERSION, conn.execute("PRAGMA user_version").fetchone()[0])
+
+    def test_store_session_replaces(self):
+        store = LiteAxolotlStore(self.db)
+        store.storeSession("123", 1, session_record(2))
+        store.storeSession("123", 2, session_record(2))
+        store.storeSession("123", 1, session_record(3))
+        self.assertEqual(3, store.loadSession("123", 1).getSessionState().getSessionVersion())
+        self.assertEqual([1, 2], sorted(store.getSubDeviceSessions("123")))
+        store.storeSessions([("123", 2, session_record(3)), ("456", 1, session_record(3))])
+        self.assertEqual(3, store.loadSession("123", 2).getSessionState().getSessionVersion())
+        self.assertTrue(store.containsSession("456", 1))
+
+    def test_migrate_sessions(self):
+        conn = sqlite3.connect(self.db)
+        conn.execute("CREATE TABLE sessions (_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                     "recipient_id INTEGER UNIQUE, device_id INTEGER, record BLOB, timestamp INTEGER);")
+        conn.executemany("INSERT INTO sessions(recipient_id, device_id, record) VALUES(?,?,?)",
+                         [(str(i), 1, session_record(i).serialize()) for i in range(2, 5)])
+        conn.commit()
+        conn.close()
+
+        store = LiteAxolotlStore(self.db)
+        for i in range(2, 5):
+            self.assertEqual(i, store.loadSession(str(i), 1).getSessionState().getSessionVersion())
+        store.storeSession("2", 2, session_record(3))
+        self.assertEqual([1, 2], sorted(store.getSubDeviceSessions("2")))
+        conn = store.sessionStore.dbConn
+        self.assertEqual(LiteAxolotlStore.SCHEMA_VERSION, conn.execute("PRAGMA user_version").fetchone()[0])
+
+        # reopening does not migrate again
+        self.assertEqual([1, 2], sorted(LiteAxolotlStore(self.db).getSubDeviceSessions("2")))
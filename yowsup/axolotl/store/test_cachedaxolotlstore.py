@@ -0,0 +1,103 @@
+from axolotl.state.prekeybundle import PreKeyBundle
+from yowsup.axolotl import exceptions
+from yowsup.axolotl.manager import AxolotlManager
+from yowsup.axolotl.store.cachedaxolotlstore import CachedAxolotlStore
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def prekey_bundle(manager):
+    prekey = manager.level_prekeys()[0]
+    signed_prekey = manager.generate_signed_prekey()
+    return PreKeyBundle(
+        manager.registration_id, 1, prekey.getId(), prekey.getKeyPair().getPublicKey(),
+        signed_prekey.getId(), signed_prekey.getKeyPair().getPublicKey(), signed_prekey.getSignature(),
+        manager.identity.getPublicKey()
+    )
+
+
+def manager(store, username):
+    manager = AxolotlManager(store, username)
+    # python-axolotl does not pad plaintexts which are a multiple of the AES block size but always unpads, keep the
+    # random padding from making the tests flaky
+    manager._generate_random_padding = lambda: b"\x01"
+    return manager
+
+
+class CachedAxolotlStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = os.path.join(self.directory, "axolotl.db")
+        self.backend = LiteAxolotlStore(self.db)
+        self.store = CachedAxolotlStore(self.backend, max_records=2, max_dirty=100)
+        self.bob = manager(self.store, "2")
+        self.alice = manager(LiteAxolotlStore(":memory:"), "1")
+        self.alice.create_session("2", prekey_bundle(self.bob), autotrust=True)
+        # establishes the session on bob's side, which removes a prekey and therefore flushes
+        self.assertEqual(b"hello", self.bob.decrypt_pkmsg("1", self.alice.encrypt("2", b"hello").serialize(), True))
+        self.assertEqual(b"hi", self.alice.decrypt_msg("2", self.bob.encrypt("1", b"hi").serialize(), True))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def exchange(self, count):
+        for i in range(0, count):
+            message = b"message %d" % i
+            self.assertEqual(message, self.bob.decrypt_msg("1", self.alice.encrypt("2", message).serialize(), True))
+            self.assertEqual(message, self.alice.decrypt_msg("2", self.bob.encrypt("1", message).serialize(), True))
+
+    def test_session_written_back(self):
+        flushed = self.backend.loadSession("1", 1).serialize()
+        self.exchange(3)
+        self.assertTrue(self.store.containsSession("1", 1))
+        self.assertEqual(flushed, self.backend.loadSession("1", 1).serialize())
+        self.bob.flush()
+        self.assertEqual(self.store.loadSession("1", 1).serialize(), self.backend.loadSession("1", 1).serialize())
+
+    def test_max_dirty(self):
+        self.store = CachedAxolotlStore(self.backend, max_dirty=1)
+        self.bob = manager(self.store, "2")
+        self.exchange(1)
+        self.assertEqual(self.store.loadSession("1", 1).serialize(), self.backend.loadSession("1", 1).serialize())
+
+    def test_crash_loses_unflushed(self):
+        self.exchange(2)
+        message = self.alice.encrypt("2", b"after").serialize()
+        # without a flush the persisted session is behind the ratchet steps taken since
+        reopened = manager(LiteAxolotlStore(self.db), "2")
+        self.assertRaises(exceptions.InvalidMessageException, reopened.decrypt_msg, "1", message, True)
+        self.bob.flush()
+        reopened = manager(LiteAxolotlStore(self.db), "2")
+        self.assertEqual(b"after", reopened.decrypt_msg("1", message, True))
+
+    def test_evicted_dirty_record_is_kept(self):
+        self.exchange(1)
+        for i in range(0, 3):
+            self.store.loadSession(str(100 + i), 1)
+        self.assertFalse(self.store.containsSession("100", 1))
+        self.exchange(1)
+        self.bob.flush()
+        self.assertEqual(self.store.loadSession("1", 1).serialize(), self.backend.loadSession("1", 1).serialize())
+
+    def test_failed_decrypt_reverted(self):
+        message = self.alice.encrypt("2", b"once").serialize()
+        self.assertEqual(b"once", self.bob.decrypt_msg("1", message, True))
+        stored = self.store.loadSession("1", 1).serialize()
+        self.assertRaises(exceptions.DuplicateMessageException, self.bob.decrypt_msg, "1", message, True)
+        self.assertEqual(stored, self.store.loadSession("1", 1).serialize())
+        self.exchange(1)
+
+    def test_group(self):
+        self.alice.group_create_skmsg("group")
+        skmsg = self.alice.group_create_skmsg("group").serialize()
+        self.bob.group_create_session("group", "1", skmsg)
+        for i in range(0, 3):
+            message = b"group msg %d" % i
+            self.assertEqual(message, self.bob.group_decrypt("group", "1", self.alice.group_encrypt("group", message)))
+        self.bob.flush()
+        reopened = manager(LiteAxolotlStore(self.db), "2")
+        message = self.alice.group_encrypt("group", b"after")
+        self.assertEqual(b"after", reopened.group_decrypt("group", "1", message))
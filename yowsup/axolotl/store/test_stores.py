@@ -0,0 +1,204 @@
+from axolotl.axolotladdress import AxolotlAddress
+from axolotl.groups.senderkeyname import SenderKeyName
+from axolotl.groups.state.senderkeyrecord import SenderKeyRecord
+from axolotl.invalidkeyidexception import InvalidKeyIdException as AxolotlInvalidKeyIdException
+from axolotl.state.sessionrecord import SessionRecord
+from axolotl.state.sessionstate import SessionState
+from axolotl.util.keyhelper import KeyHelper
+from yowsup.axolotl.exceptions import InvalidKeyIdException
+from yowsup.axolotl.factory import AxolotlManagerFactory
+from yowsup.axolotl.store.cachedaxolotlstore import CachedAxolotlStore
+from yowsup.axolotl.store.log.logaxolotlstore import LogAxolotlStore
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.axolotl.store.test_cachedaxolotlstore import manager, prekey_bundle
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import weakref
+
+
+def session_record(version):
+    state = SessionState()
+    state.setSessionVersion(version)
+    return SessionRecord(sessionState=state)
+
+
+class StoreConformanceTest(object):
+    """
+    Behaviour every YowAxolotlStore backend has to share. Subclasses implement open_store, which opens the store kept
+    in self.directory, and mix in unittest.TestCase.
+    """
+
+    def open_store(self):
+        raise NotImplementedError()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = self.open_store()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def reopen(self):
+        self.store.close()
+        self.store = self.open_store()
+
+    def test_identity(self):
+        identity = self.store.getIdentityKeyPair()
+        registration_id = self.store.getLocalRegistrationId()
+        remote = KeyHelper.generateIdentityKeyPair().getPublicKey()
+        other = KeyHelper.generateIdentityKeyPair().getPublicKey()
+        self.assertTrue(self.store.isTrustedIdentity("123", remote))
+        self.store.saveIdentity("123", remote)
+        self.assertTrue(self.store.isTrustedIdentity("123", remote))
+        self.assertFalse(self.store.isTrustedIdentity("123", other))
+        self.store.saveIdentity("123", other)
+        self.assertTrue(self.store.isTrustedIdentity("123", other))
+
+        self.reopen()
+        self.assertEqual(identity.serialize(), self.store.getIdentityKeyPair().serialize())
+        self.assertEqual(registration_id, self.store.getLocalRegistrationId())
+        self.assertTrue(self.store.isTrustedIdentity("123", other))
+
+    def test_prekeys(self):
+        self.assertEqual(0, self.store.loadMaxPreKeyId())
+        prekeys = KeyHelper.generatePreKeys(1, 10)
+        self.store.storePreKeys(prekeys)
+        self.assertEqual(10, self.store.countPreKeys())
+        self.assertEqual(10, self.store.loadMaxPreKeyId())
+        self.assertTrue(self.store.containsPreKey(3))
+        self.assertEqual(prekeys[2].serialize(), self.store.loadPreKey(3).serialize())
+        self.store.setPreKeysAsSent([1, 2, 3])
+        self.assertEqual(list(range(4, 11)), sorted(prekey.getId() for prekey in self.store.loadUnsentPreKeys()))
+        self.store.removePreKey(3)
+        self.assertFalse(self.store.containsPreKey(3))
+        self.assertRaises(InvalidKeyIdException, self.store.loadPreKey, 3)
+        self.assertEqual(9, len(self.store.loadPreKeys()))
+
+        self.reopen()
+        self.assertEqual(9, self.store.countPreKeys())
+        self.assertEqual(list(range(4, 11)), sorted(prekey.getId() for prekey in self.store.loadUnsentPreKeys()))
+
+    def test_signed_prekeys(self):
+        signed_prekey = KeyHelper.generateSignedPreKey(self.store.getIdentityKeyPair(), 7)
+        self.assertFalse(self.store.containsSignedPreKey(7))
+        self.assertRaises(AxolotlInvalidKeyIdException, self.store.loadSignedPreKey, 7)
+        self.store.storeSignedPreKey(7, signed_prekey)
+        self.assertTrue(self.store.containsSignedPreKey(7))
+        self.assertEqual(signed_prekey.serialize(), self.store.loadSignedPreKey(7).serialize())
+        self.assertEqual(1, len(self.store.loadSignedPreKeys()))
+        self.reopen()
+        self.assertEqual(signed_prekey.serialize(), self.store.loadSignedPreKey(7).serialize())
+        self.store.removeSignedPreKey(7)
+        self.assertFalse(self.store.containsSignedPreKey(7))
+
+    def test_sessions(self):
+        self.assertFalse(self.store.containsSession("123", 1))
+        self.assertTrue(self.store.loadSession("123", 1).isFresh())
+        self.store.storeSession("123", 1, session_record(2))
+        self.store.storeSessions([("123", 2, session_record(3)), ("1234", 1, session_record(3))])
+        self.store.storeSession("123", 1, session_record(3))
+        self.assertEqual(3, self.store.loadSession("123", 1).getSessionState().getSessionVersion())
+        self.assertEqual([1, 2], sorted(self.store.getSubDeviceSessions("123")))
+
+        self.reopen()
+        self.assertEqual(3, self.store.loadSession("123", 2).getSessionState().getSessionVersion())
+        self.store.deleteSession("123", 2)
+        self.assertFalse(self.store.containsSession("123", 2))
+        self.store.deleteAllSessions("123")
+        self.assertFalse(self.store.containsSession("123", 1))
+        self.assertTrue(self.store.containsSession("1234", 1))
+
+    def test_contains_sessions(self):
+        self.store.storeSessions([(str(100000000 + i), 1, session_record(3)) for i in range(0, 600)])
+        self.store.storeSession("123", 2, session_record(3))
+        recipients = [str(100000000 + i) for i in range(0, 1200, 2)] + ["123"]
+        self.assertEqual(set(str(100000000 + i) for i in range(0, 600, 2)), self.store.containsSessions(recipients, 1))
+        self.reopen()
+        self.assertEqual(set(["100000000"]), self.store.containsSessions(["100000000", "123", "456"], 1))
+
+    def test_sender_keys(self):
+        name = SenderKeyName("group", AxolotlAddress("123", 0))
+        self.assertTrue(self.store.loadSenderKey(name).isEmpty())
+        record = SenderKeyRecord()
+        record.setSenderKeyState(1, 0, os.urandom(32), KeyHelper.generateSenderSigningKey())
+        self.store.storeSenderKeys([(name, record)])
+        self.reopen()
+        self.assertEqual(record.serialize(), self.store.loadSenderKey(name).serialize())
+        self.assertTrue(self.store.loadSenderKey(SenderKeyName("group", AxolotlAddress("1234", 0))).isEmpty())
+
+    def test_manager_round_trip(self):
+        bob = manager(self.store, "2")
+        alice = manager(LiteAxolotlStore(":memory:"), "1")
+        alice.create_session("2", prekey_bundle(bob), autotrust=True)
+        self.assertEqual(b"hello", bob.decrypt_pkmsg("1", alice.encrypt("2", b"hello").serialize(), True))
+        self.assertEqual(b"hi", alice.decrypt_msg("2", bob.encrypt("1", b"hi").serialize(), True))
+        bob.flush()
+
+        self.reopen()
+        bob = manager(self.store, "2")
+        self.assertEqual(b"again", bob.decrypt_msg("1", alice.encrypt("2", b"again").serialize(), True))
+
+    def test_concurrent_readers(self):
+        self.store.storeSessions([(str(i), 1, session_record(3)) for i in range(0, 50)])
+        errors = []
+
+        def read():
+            try:
+                for _ in range(0, 20):
+                    for i in range(0, 50):
+                        assert self.store.loadSession(str(i), 1).getSessionState().getSessionVersion() == 3
+            except Exception as e:
+                errors.append(e)
+
+        def write():
+            try:
+                for i in range(50, 250):
+                    self.store.storeSession(str(i), 1, session_record(3))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(0, 4)] + [threading.Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(250, len([i for i in range(0, 250) if self.store.containsSession(str(i), 1)]))
+
+
+class LiteAxolotlStoreConformanceTest(StoreConformanceTest, unittest.TestCase):
+    def open_store(self):
+        return LiteAxolotlStore(os.path.join(self.directory, "axolotl.db"), wal=True)
+
+
+class CachedAxolotlStoreConformanceTest(StoreConformanceTest, unittest.TestCase):
+    def open_store(self):
+        return CachedAxolotlStore(LiteAxolotlStore(os.path.join(self.directory, "axolotl.db"), wal=True))
+
+
+class LogAxolotlStoreConformanceTest(StoreConformanceTest, unittest.TestCase):
+    def open_store(self):
+        return LogAxolotlStore(os.path.join(self.directory, "axolotl.log"))
+
+
+class AxolotlManagerFactoryStoresTest(unittest.TestCase):
+    def test_registered_stores(self):
+        self.assertEqual(["log", "sqlite"], AxolotlManagerFactory.get_store_names())
+
+    def test_unknown_store(self):
+        self.assertRaises(ValueError, AxolotlManagerFactory().get_manager, "profile", "123", "unknown")
+
+    def test_flush_at_exit(self):
+        store = LiteAxolotlStore(":memory:")
+        cached = CachedAxolotlStore(store)
+        cached.storeSession("123", 1, session_record(3))
+        self.assertFalse(store.containsSession("123", 1))
+        AxolotlManagerFactory._flush_at_exit(weakref.ref(cached))
+        self.assertTrue(store.containsSession("123", 1))
+        cached = weakref.ref(cached)
+        self.assertIsNone(cached())
+        AxolotlManagerFactory._flush_at_exit(cached)
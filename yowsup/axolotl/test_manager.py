@@ -0,0 +1,64 @@
+from axolotl.state.sessionrecord import SessionRecord
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from yowsup.axolotl.manager import AxolotlManager
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.axolotl.store.test_cachedaxolotlstore import manager, prekey_bundle
+
+
+class AxolotlManagerPreKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.store = LiteAxolotlStore(":memory:")
+        self.manager = AxolotlManager(self.store, "123456789")
+
+    def test_level_prekeys(self):
+        prekeys = self.manager.level_prekeys()
+        self.assertEqual(AxolotlManager.COUNT_GEN_PREKEYS, len(prekeys))
+        self.assertEqual(AxolotlManager.COUNT_GEN_PREKEYS, self.store.countPreKeys())
+        self.assertEqual(prekeys[-1].getId(), self.store.loadMaxPreKeyId())
+        self.assertEqual(prekeys[0].serialize(), self.store.loadPreKey(prekeys[0].getId()).serialize())
+        self.assertEqual([], self.manager.level_prekeys())
+
+    def test_level_prekeys_async(self):
+        future = self.manager.level_prekeys_async()
+        prekeys = future.result(30)
+        self.assertEqual(AxolotlManager.COUNT_GEN_PREKEYS, len(prekeys))
+        self.assertEqual(AxolotlManager.COUNT_GEN_PREKEYS, len(self.manager.load_unsent_prekeys()))
+        self.assertIsNone(self.manager.level_prekeys_async())
+
+    def test_level_prekeys_async_waits_for_store(self):
+        with self.store._lock:
+            future = self.manager.level_prekeys_async()
+            self.assertFalse(future.done())
+            self.store.storeSessions([(str(i), 1, SessionRecord()) for i in range(50)])
+        self.assertEqual(AxolotlManager.COUNT_GEN_PREKEYS, len(future.result(30)))
+        self.assertEqual(AxolotlManager.COUNT_GEN_PREKEYS, self.store.countPreKeys())
+        self.assertTrue(self.store.containsSession("49", 1))
+
+    def test_set_prekeys_as_sent(self):
+        prekeys = self.manager.level_prekeys()
+        self.manager.set_prekeys_as_sent(prekeys[:100])
+        unsent = self.manager.load_unsent_prekeys()
+        self.assertEqual([prekey.getId() for prekey in prekeys[100:]], [prekey.getId() for prekey in unsent])
+
+
+class AxolotlManagerEncryptManyTest(unittest.TestCase):
+    def setUp(self):
+        self.sender = manager(LiteAxolotlStore(":memory:"), "1")
+        self.recipients = [manager(LiteAxolotlStore(":memory:"), str(i)) for i in range(2, 6)]
+        for recipient in self.recipients:
+            self.sender.create_session(recipient._username, prekey_bundle(recipient), autotrust=True)
+
+    def check(self, executor):
+        recipient_ids = [recipient._username for recipient in self.recipients]
+        ciphertexts = self.sender.encrypt_many(recipient_ids, b"fanout", executor)
+        self.assertEqual(set(recipient_ids), self.sender.sessions_exist(recipient_ids + ["6"]))
+        for recipient, ciphertext in zip(self.recipients, ciphertexts):
+            self.assertEqual(b"fanout", recipient.decrypt_pkmsg("1", ciphertext.serialize(), True))
+
+    def test_encrypt_many(self):
+        self.check(None)
+
+    def test_encrypt_many_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.check(executor)
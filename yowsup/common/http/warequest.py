@@ -1,7 +1,6 @@
 from .waresponseparser import ResponseParser
 from yowsup.env import YowsupEnv
 
-import sys
 import logging
 from axolotl.ecc.curve import Curve
 from axolotl.ecc.ec import ECPublicKey
@@ -13,19 +12,8 @@ import struct
 import random
 import base64
 
-if sys.version_info < (3, 0):
-    import httplib
-    from urllib import quote as urllib_quote
-
-    if sys.version_info >= (2, 7, 9):
-        # see https://github.com/tgalal/yowsup/issues/677
-        import ssl
-
-        ssl._create_default_https_context = ssl._create_unverified_context
-
-else:
-    from http import client as httplib
-    from urllib.parse import quote as urllib_quote
+from http import client as httplib
+from urllib.parse import quote as urllib_quote
 
 logger = logging.getLogger(__name__)
 
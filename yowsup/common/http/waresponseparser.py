@@ -152,10 +152,7 @@ class PListResponseParser(ResponseParser):
         
         #tmp = minidom.parseString(xml)
         
-        if sys.version_info >= (3, 0):
-            pl = plistlib.readPlistFromBytes(xml.encode());
-        else:
-            pl = plistlib.readPlistFromString(xml);
+        pl = plistlib.loads(xml.encode())
         
         parsed= {}
         pvars = self.getVars(pvars)
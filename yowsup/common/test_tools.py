@@ -0,0 +1,81 @@
+from yowsup.common.tools import WATools, FileMemo
+from yowsup.layers.protocol_media.mediacipher import MediaCipher
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class WAToolsFileDigestsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "video.mp4")
+        self.content = os.urandom(2 * WATools.HASH_CHUNK_SIZE + 5)
+        with open(self.path, "wb") as f:
+            f.write(self.content)
+        self.fileMemo = WATools.fileMemo
+        WATools.fileMemo = FileMemo()
+
+    def tearDown(self):
+        WATools.fileMemo = self.fileMemo
+        shutil.rmtree(self.directory)
+
+    def test_hash_for_upload(self):
+        self.assertEqual(
+            base64.b64encode(hashlib.sha256(self.content).digest()).decode(), WATools.getFileHashForUpload(self.path)
+        )
+
+    def test_digests(self):
+        mediaKey = os.urandom(32)
+        digests = WATools.getFileDigests(self.path, ("sha256", "sha1"), mediaKey, MediaCipher.INFO_VIDEO)
+        encrypted = MediaCipher().encrypt(self.content, mediaKey, MediaCipher.INFO_VIDEO)
+        self.assertEqual(hashlib.sha256(self.content).digest(), digests["sha256"])
+        self.assertEqual(hashlib.sha1(self.content).digest(), digests["sha1"])
+        self.assertEqual(hashlib.sha256(encrypted).digest(), digests["enc_sha256"])
+        self.assertEqual(len(encrypted), digests["enc_length"])
+
+    def test_empty_file(self):
+        with open(self.path, "wb"):
+            pass
+        self.assertEqual(hashlib.sha256(b"").digest(), WATools.getFileDigests(self.path)["sha256"])
+
+    def test_memoized_until_changed(self):
+        digests = WATools.getFileDigests(self.path)
+        self.assertEqual(digests, WATools.getFileDigests(self.path))
+        self.assertEqual((1, 1), (WATools.fileMemo.hits, WATools.fileMemo.misses))
+        with open(self.path, "ab") as f:
+            f.write(b"x")
+        self.assertEqual(hashlib.sha256(self.content + b"x").digest(), WATools.getFileDigests(self.path)["sha256"])
+        self.assertEqual(2, WATools.fileMemo.misses)
+
+
+class FileMemoTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.directory, "%d.jpg" % i)
+            with open(path, "wb") as f:
+                f.write(b"%d" % i)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_keys_are_kept_apart(self):
+        memo = FileMemo()
+        self.assertEqual(1, memo.get(self.paths[0], "a", lambda: 1))
+        self.assertEqual(2, memo.get(self.paths[0], "b", lambda: 2))
+        self.assertEqual(1, memo.get(self.paths[0], "a", lambda: 3))
+
+    def test_least_recently_used_are_dropped(self):
+        memo = FileMemo(2)
+        memo.get(self.paths[0], "a", lambda: 0)
+        memo.get(self.paths[1], "a", lambda: 1)
+        memo.get(self.paths[0], "a", lambda: None)
+        memo.get(self.paths[2], "a", lambda: 2)
+        self.assertEqual(2, len(memo))
+        self.assertEqual(0, memo.get(self.paths[0], "a", lambda: None))
+        self.assertIsNone(memo.get(self.paths[1], "a", lambda: None))
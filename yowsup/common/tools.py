@@ -1,12 +1,15 @@
 import os
 from .constants import YowConstants
-import codecs, sys
+import codecs
 import logging
 import tempfile
 import base64
 import hashlib
 import os.path, mimetypes
+import mmap
+import threading
 import uuid
+from collections import OrderedDict
 from consonance.structs.keypair import KeyPair
 from appdirs import user_config_dir
 
@@ -28,11 +31,66 @@ class HexTools:
     @staticmethod
     def decodeHex(hexString):
         result = HexTools.decode_hex(hexString)[0]
-        if sys.version_info >= (3,0):
-            result = result.decode('latin-1')
+        return result.decode('latin-1')
+
+class FileMemo(object):
+    """
+    Results computed from files, kept by path and the file's size, mtime and inode so that a file is only read again
+    once it changed. The least recently used results beyond max_entries are dropped.
+    """
+    DEFAULT_MAX_ENTRIES = 256
+
+    def __init__(self, max_entries=None):
+        self._max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    @staticmethod
+    def fingerprint(path):
+        """
+        :return: absolute path, size, mtime in nanoseconds and inode of the file
+        :rtype: tuple[str, int, int, int]
+        """
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def get(self, path, key, compute):
+        """
+        :param path:
+        :type path: str
+        :param key: what is computed from the file, results for different keys are kept apart
+        :type key: collections.Hashable
+        :param compute: computes the result from the file, called unless it is known
+        :type compute: () -> object
+        """
+        memoKey = (key,) + self.fingerprint(path)
+        with self._lock:
+            if memoKey in self._results:
+                self._results.move_to_end(memoKey)
+                self.hits += 1
+                return self._results[memoKey]
+        result = compute()
+        with self._lock:
+            self.misses += 1
+            self._results[memoKey] = result
+            while len(self._results) > self._max_entries:
+                self._results.popitem(last=False)
         return result
 
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
 class WATools:
+    HASH_CHUNK_SIZE = 1024 * 1024
+    fileMemo = FileMemo()
+
     @staticmethod
     def generateIdentity():
         return os.urandom(20)
@@ -69,17 +127,66 @@ class WATools:
         """
         return KeyPair.generate()
 
-    @staticmethod
-    def getFileHashForUpload(filePath):
-        sha1 = hashlib.sha256()
-        f = open(filePath, 'rb')
-        try:
-            sha1.update(f.read())
-        finally:
-            f.close()
-        b64Hash = base64.b64encode(sha1.digest())
+    @classmethod
+    def getFileHashForUpload(cls, filePath):
+        b64Hash = base64.b64encode(cls.getFileDigests(filePath)["sha256"])
         return b64Hash if type(b64Hash) is str else b64Hash.decode()
 
+    @classmethod
+    def getFileDigests(cls, filePath, algorithms=("sha256",), mediaKey=None, mediaInfo=None):
+        """
+        Hashes a file in one pass over a memory map of it. Results are kept in fileMemo, the file is not read again
+        until it changes.
+        :param algorithms: hashlib names of the digests of the file to compute
+        :type algorithms: tuple[str]
+        :param mediaKey: when given, the file is also encrypted as media with this key, see MediaCipher
+        :type mediaKey: bytes | None
+        :param mediaInfo: one of the MediaCipher.INFO_ constants, required with mediaKey
+        :type mediaInfo: bytes | None
+        :return: digests by algorithm name and, with mediaKey, "enc_sha256" and "enc_length" of the encrypted media
+        :rtype: dict[str, bytes | int]
+        """
+        return dict(cls.fileMemo.get(
+            filePath, ("digests", tuple(algorithms), mediaKey, mediaInfo),
+            lambda: cls._computeFileDigests(filePath, algorithms, mediaKey, mediaInfo)
+        ))
+
+    @classmethod
+    def _computeFileDigests(cls, filePath, algorithms, mediaKey, mediaInfo):
+        hashers = [(algorithm, hashlib.new(algorithm)) for algorithm in algorithms]
+
+        def chunks():
+            with open(filePath, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if not size:
+                    return
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for offset in range(0, size, cls.HASH_CHUNK_SIZE):
+                        with memoryview(mapped)[offset:offset + cls.HASH_CHUNK_SIZE] as chunk:
+                            for _, hasher in hashers:
+                                hasher.update(chunk)
+                            yield chunk
+                finally:
+                    mapped.close()
+
+        digests = {}
+        if mediaKey is not None:
+            from yowsup.layers.protocol_media.mediacipher import MediaCipher
+            encHasher = hashlib.sha256()
+            encLength = 0
+            for encrypted in MediaCipher().encrypt_stream(chunks(), mediaKey, mediaInfo):
+                encHasher.update(encrypted)
+                encLength += len(encrypted)
+            digests["enc_sha256"] = encHasher.digest()
+            digests["enc_length"] = encLength
+        else:
+            for _ in chunks():
+                pass
+        for algorithm, hasher in hashers:
+            digests[algorithm] = hasher.digest()
+        return digests
+
 
 class StorageTools:
     NAME_CONFIG = "config.json"
@@ -146,6 +253,10 @@ class ImageTools:
 
     @staticmethod
     def getImageDimensions(imageFile):
+        return WATools.fileMemo.get(imageFile, "image_dimensions", lambda: ImageTools._getImageDimensions(imageFile))
+
+    @staticmethod
+    def _getImageDimensions(imageFile):
         with PILOptionalModule() as imp:
             Image = imp("Image")
             im = Image.open(imageFile)
@@ -153,6 +264,10 @@ class ImageTools:
 
     @staticmethod
     def generatePreviewFromImage(image):
+        return WATools.fileMemo.get(image, "image_preview", lambda: ImageTools._generatePreviewFromImage(image))
+
+    @staticmethod
+    def _generatePreviewFromImage(image):
         fd, path = tempfile.mkstemp()
 
         preview = None
@@ -182,6 +297,10 @@ class MimeTools:
 class VideoTools:
     @staticmethod
     def getVideoProperties(videoFile):
+        return WATools.fileMemo.get(videoFile, "video_properties", lambda: VideoTools._getVideoProperties(videoFile))
+
+    @staticmethod
+    def _getVideoProperties(videoFile):
         with FFVideoOptionalModule() as imp:
             VideoStream = imp("VideoStream")
             s = VideoStream(videoFile)
@@ -189,11 +308,15 @@ class VideoTools:
 
     @staticmethod
     def generatePreviewFromVideo(videoFile):
+        return WATools.fileMemo.get(videoFile, "video_preview", lambda: VideoTools._generatePreviewFromVideo(videoFile))
+
+    @staticmethod
+    def _generatePreviewFromVideo(videoFile):
         with FFVideoOptionalModule() as imp:
             VideoStream = imp("VideoStream")
             fd, path = tempfile.mkstemp('.jpg')
             stream = VideoStream(videoFile)
             stream.get_frame_at_sec(0).image().save(path)
-            preview = ImageTools.generatePreviewFromImage(path)
+            preview = ImageTools._generatePreviewFromImage(path)
             os.remove(path)
             return preview
@@ -22,7 +22,8 @@ class Config(config.Config):
             expid=None,
             fdid=None,
             edge_routing_info=None,
-            chat_dns_domain=None
+            chat_dns_domain=None,
+            axolotl_store=None
     ):
         super(Config, self).__init__(1)
 
@@ -42,6 +43,7 @@ class Config(config.Config):
         self._sim_mnc = sim_mnc
         self._edge_routing_info = edge_routing_info
         self._chat_dns_domain = chat_dns_domain
+        self._axolotl_store = axolotl_store  # type: str
 
         if self._password is not None:
             logger.warn("Setting a password in Config is deprecated and not used anymore. "
@@ -182,3 +184,11 @@ class Config(config.Config):
     @chat_dns_domain.setter
     def chat_dns_domain(self, value):
         self._chat_dns_domain = value
+
+    @property
+    def axolotl_store(self):
+        return self._axolotl_store
+
+    @axolotl_store.setter
+    def axolotl_store(self, value):
+        self._axolotl_store = value
@@ -1,8 +1,5 @@
 import threading, inspect, shlex
-try:
-    import Queue
-except ImportError:
-    import queue as Queue
+import queue
 try:
     import readline
 except ImportError:
@@ -23,7 +20,7 @@ class Cli(object):
         self.commands = {}
         self.acceptingInput = False
         self.lastPrompt = True
-        self.blockingQueue = Queue.Queue()
+        self.blockingQueue = queue.Queue()
 
         self._queuedCmds = []
 
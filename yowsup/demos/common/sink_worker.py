@@ -9,81 +9,104 @@ import threading
 from tqdm import tqdm
 import requests
 import logging
-import math
-import sys
+import tempfile
 import os
 import base64
 
-if sys.version_info >= (3, 0):
-    from queue import Queue
-else:
-    from Queue import Queue
+from queue import Queue
 
 logger = logging.getLogger(__name__)
 
 
 class SinkWorker(threading.Thread):
-    def __init__(self, storage_dir):
+    """
+    Stores incoming media in storage_dir. Jobs are sorted out on this thread and downloads handed to
+    download_workers threads, which share the pooled connections of one requests.Session. A download is decrypted
+    as its chunks come in and written to a temporary file in storage_dir, which is renamed to its final name once
+    the media checked out, so only chunk_size sized pieces of a file are held in memory at any time.
+    """
+    DEFAULT_DOWNLOAD_WORKERS = 4
+    DEFAULT_CHUNK_SIZE = 256 * 1024
+    DOWNLOAD_TIMEOUT = 60
+
+    def __init__(self, storage_dir, download_workers=None, chunk_size=None):
+        """
+        :param storage_dir:
+        :type storage_dir: str
+        :param download_workers: number of media downloaded at once
+        :type download_workers: int | None
+        :param chunk_size: size of the pieces downloaded, decrypted and written at a time
+        :type chunk_size: int | None
+        """
         super(SinkWorker, self).__init__()
         self.daemon = True
         self._storage_dir = storage_dir
+        self._download_workers = download_workers or self.DEFAULT_DOWNLOAD_WORKERS
+        self._chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
         self._jobs = Queue()
+        # bounded so that jobs wait in _jobs rather than pile up ahead of the downloads
+        self._downloads = Queue(self._download_workers)
         self._media_cipher = MediaCipher()
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self._download_workers)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._filepath_lock = threading.Lock()
 
     def enqueue(self, media_message_protocolentity):
+        """
+        :param media_message_protocolentity: media to store, None to stop once the media enqueued before is stored
+        :type media_message_protocolentity: MediaMessageProtocolEntity | None
+        """
         self._jobs.put(media_message_protocolentity)
 
-    def _create_progress_iterator(self, iterable, niterations, desc):
+    def _create_progress(self, total, desc, position):
         return tqdm(
-                    iterable, total=niterations, unit='KB', dynamic_ncols=True,
-                    unit_scale=True, leave=True, desc=desc, ascii=True)
-
-    def _download(self, url):
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        logger.debug("%s total size is %s, downloading" % (url, total_size))
-        block_size = 1024
-        wrote = 0
-        enc_data = b""
-
-        for data in self._create_progress_iterator(
-                response.iter_content(block_size), math.ceil(total_size // block_size) + 1, "Download       ",
-        ):
-            wrote = wrote + len(data)
-            enc_data = enc_data + data
-
-        if total_size != 0 and wrote != total_size:
-            logger.error("Something went wrong")
-            return None
-
-        return enc_data
-
-    def _decrypt(self, ciphertext, ref_key, media_info):
-        length_kb = int(math.ceil(len(ciphertext) / 1024))
-        progress = self._create_progress_iterator(range(length_kb), length_kb, "Decrypt        ")
+                    total=total, unit='B', dynamic_ncols=True, unit_scale=True, leave=True, desc=desc,
+                    ascii=True, position=position)
+
+    def _download(self, url, position):
+        """
+        :return: the media at url in chunks of up to chunk_size, a ValueError is raised at the end if it's short
+        :rtype: collections.Iterator[bytes]
+        """
+        with self._session.get(url, stream=True, timeout=self.DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            total_size = int(response.headers.get('content-length', 0))
+            logger.debug("%s total size is %s, downloading" % (url, total_size))
+            wrote = 0
+            with self._create_progress(total_size or None, "Download       ", position) as progress:
+                for data in response.iter_content(self._chunk_size):
+                    wrote += len(data)
+                    progress.update(len(data))
+                    yield data
+
+            if total_size != 0 and wrote != total_size:
+                raise ValueError("Downloaded %d of %d bytes" % (wrote, total_size))
+
+    def _write(self, chunks, filepath):
+        """
+        Writes chunks to a temporary file which is renamed to filepath, or to a unique variation of it if it exists,
+        once all chunks were written
+        :param chunks:
+        :type chunks: collections.Iterable[bytes]
+        :param filepath:
+        :type filepath: str
+        :return: path the file was written to
+        :rtype: str
+        """
+        fd, temppath = tempfile.mkstemp(".part", ".", os.path.dirname(filepath))
         try:
-            plaintext = self._media_cipher.decrypt(ciphertext, ref_key, media_info)
-            progress.update(length_kb)
-            return plaintext
-        except Exception as e:
-            progress.set_description("Decrypt Error  ")
-            logger.error(e)
-
-        return None
-
-    def _write(self, data, filename):
-        length_kb = int(math.ceil(len(data) / 1024))
-        progress = self._create_progress_iterator(range(length_kb), length_kb, "Write          ")
-        try:
-            with open(filename, 'wb') as f:
-                f.write(data)
-            progress.update(length_kb)
-            return filename
-        except Exception as e:
-            progress.set_description("Write error    ")
-            logger.error(e)
-
-        return None
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            with self._filepath_lock:
+                filepath = self._create_unique_filepath(filepath)
+                os.rename(temppath, filepath)
+            return filepath
+        except Exception:
+            os.remove(temppath)
+            raise
 
     def _create_unique_filepath(self, filepath):
         file_dir = os.path.dirname(filepath)
@@ -97,14 +120,47 @@ class SinkWorker(threading.Thread):
 
         return os.path.join(file_dir, result_filename)
 
+    def _store(self, media_message_protocolentity, media_info, filepath, position):
+        try:
+            if media_info is None:
+                filedata = media_message_protocolentity.vcard
+                filepath = self._write([filedata.encode() if not isinstance(filedata, bytes) else filedata], filepath)
+            else:
+                filepath = self._write(self._media_cipher.decrypt_stream(
+                    self._download(media_message_protocolentity.url, position),
+                    media_message_protocolentity.media_key, media_info
+                ), filepath)
+            logger.info("Wrote %s" % filepath)
+        except Exception as e:
+            logger.error("Storing %s failed: %s" % (filepath, e))
+
+    def _run_downloads(self, position):
+        while True:
+            download = self._downloads.get()
+            if download is None:
+                return
+            self._store(*(download + (position,)))
+
     def run(self):
         logger.debug(
-            "SinkWorker started, storage_dir=%s" % self._storage_dir
+            "SinkWorker started, storage_dir=%s, download_workers=%d" % (self._storage_dir, self._download_workers)
         )
+        workers = []
+        for position in range(self._download_workers):
+            worker = threading.Thread(target=self._run_downloads, args=(position,), name="SinkDownload-%d" % position)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
         while True:
             media_message_protocolentity = self._jobs.get()
             if media_message_protocolentity is None:
-                sys.exit(0)
+                for _ in workers:
+                    self._downloads.put(None)
+                for worker in workers:
+                    worker.join()
+                self._session.close()
+                return
             if isinstance(media_message_protocolentity, DownloadableMediaMessageProtocolEntity):
                 logger.info(
                     "Processing [url=%s, media_key=%s]" %
@@ -113,7 +169,7 @@ class SinkWorker(threading.Thread):
             else:
                 logger.info("Processing %s" % media_message_protocolentity.media_type)
 
-            filedata = None
+            media_info = None
             fileext = None
             if isinstance(media_message_protocolentity, ImageDownloadableMediaMessageProtocolEntity):
                 media_info = MediaCipher.INFO_IMAGE
@@ -129,25 +185,13 @@ class SinkWorker(threading.Thread):
                 filename = media_message_protocolentity.file_name
             elif isinstance(media_message_protocolentity, ContactMediaMessageProtocolEntity):
                 filename = media_message_protocolentity.display_name
-                filedata = media_message_protocolentity.vcard
                 fileext = "vcard"
             elif isinstance(media_message_protocolentity, StickerDownloadableMediaMessageProtocolEntity):
                 media_info = MediaCipher.INFO_IMAGE
                 filename = "sticker"
             else:
                 logger.error("Unsupported Media type: %s" % media_message_protocolentity.__class__)
-                sys.exit(1)
-
-            if filedata is None:
-                enc_data = self._download(media_message_protocolentity.url)
-                if enc_data is None:
-                    logger.error("Download failed")
-                    sys.exit(1)
-
-                filedata = self._decrypt(enc_data, media_message_protocolentity.media_key, media_info)
-                if filedata is None:
-                    logger.error("Decrypt failed")
-                    sys.exit(1)
+                continue
 
             if not isinstance(media_message_protocolentity, DocumentDownloadableMediaMessageProtocolEntity):
                 if fileext is None:
@@ -155,8 +199,8 @@ class SinkWorker(threading.Thread):
                 filename_full = "%s.%s" % (filename, fileext)
             else:
                 filename_full = filename
-            filepath = self._create_unique_filepath(os.path.join(self._storage_dir, filename_full))
-            if self._write(filedata, filepath):
-                logger.info("Wrote %s" % filepath)
+            filepath = os.path.join(self._storage_dir, filename_full)
+            if media_info is None:
+                self._store(media_message_protocolentity, None, filepath, 0)
             else:
-                sys.exit(1)
+                self._downloads.put((media_message_protocolentity, media_info, filepath))
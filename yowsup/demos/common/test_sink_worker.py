@@ -0,0 +1,133 @@
+from yowsup.layers.protocol_media.mediacipher import MediaCipher
+from yowsup.layers.protocol_media.protocolentities import VideoDownloadableMediaMessageProtocolEntity
+from yowsup.layers.protocol_messages.protocolentities.attributes.attributes_downloadablemedia import \
+    DownloadableMediaMessageAttributes
+from yowsup.layers.protocol_messages.protocolentities.attributes.attributes_message_meta import \
+    MessageMetaAttributes
+from yowsup.layers.protocol_messages.protocolentities.attributes.attributes_video import VideoAttributes
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from yowsup.demos.common.sink_worker import SinkWorker
+    from tqdm import tqdm
+except ImportError:
+    SinkWorker = None
+
+from http.server import SimpleHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class MediaRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def translate_path(self, path):
+        return os.path.join(self.server.directory, path.lstrip("/"))
+
+
+class MediaServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory):
+        HTTPServer.__init__(self, ("localhost", 0), MediaRequestHandler)
+        self.directory = directory
+
+
+if SinkWorker is not None:
+    class QuietSinkWorker(SinkWorker):
+        def _create_progress(self, total, desc, position):
+            return tqdm(total=total, disable=True)
+
+    class SlowNamingSinkWorker(QuietSinkWorker):
+        """Widens the window between picking a free name and renaming a download to it"""
+        def _create_unique_filepath(self, filepath):
+            filepath = super(SlowNamingSinkWorker, self)._create_unique_filepath(filepath)
+            time.sleep(0.01)
+            return filepath
+
+
+@unittest.skipIf(SinkWorker is None, "the mediasink demo's requirements are not installed")
+class SinkWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.media_dir = tempfile.mkdtemp()
+        self.storage_dir = tempfile.mkdtemp()
+        self.server = MediaServer(self.media_dir)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.count = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.media_dir)
+        shutil.rmtree(self.storage_dir)
+
+    def create_entity(self, plaintext, media_key=None):
+        """
+        :return: a video message for plaintext encrypted with media_key, and served by the test server
+        :rtype: VideoDownloadableMediaMessageProtocolEntity
+        """
+        media_key = media_key or os.urandom(32)
+        name = "%d.enc" % self.count
+        self.count += 1
+        with open(os.path.join(self.media_dir, name), "wb") as f:
+            f.write(MediaCipher().encrypt(plaintext, media_key, MediaCipher.INFO_VIDEO))
+        url = "http://localhost:%d/%s" % (self.server.server_address[1], name)
+        return VideoDownloadableMediaMessageProtocolEntity(
+            VideoAttributes(DownloadableMediaMessageAttributes("video/mp4", len(plaintext), b"", url, media_key),
+                            1, 1, 1),
+            MessageMetaAttributes(id=name, sender="1@s.whatsapp.net", timestamp=1)
+        )
+
+    def store(self, entities, worker_class=None, download_workers=None):
+        worker = (worker_class or QuietSinkWorker)(self.storage_dir, download_workers, 64 * 1024)
+        worker.start()
+        for entity in entities:
+            worker.enqueue(entity)
+        worker.enqueue(None)
+        worker.join(30)
+        self.assertFalse(worker.is_alive())
+        return sorted(os.listdir(self.storage_dir))
+
+    def read(self, filename):
+        with open(os.path.join(self.storage_dir, filename), "rb") as f:
+            return f.read()
+
+    def test_store(self):
+        # not block aligned, MediaCipher.encrypt only pads then
+        plaintext = os.urandom(200 * 1024 + 1)
+        self.assertEqual(["video.mp4"], self.store([self.create_entity(plaintext)]))
+        self.assertEqual(plaintext, self.read("video.mp4"))
+
+    def test_mac_failure_removes_temp_file(self):
+        entity = self.create_entity(os.urandom(200 * 1024 + 1))
+        entity.media_key = os.urandom(32)
+        with self.assertLogs("yowsup.demos.common.sink_worker", "ERROR"):
+            self.assertEqual([], self.store([entity]))
+
+    def test_missing_media_skipped(self):
+        entity = self.create_entity(os.urandom(1025))
+        os.remove(os.path.join(self.media_dir, "0.enc"))
+        plaintext = os.urandom(1025)
+        with self.assertLogs("yowsup.demos.common.sink_worker", "ERROR"):
+            self.assertEqual(["video.mp4"], self.store([entity, self.create_entity(plaintext)]))
+        self.assertEqual(plaintext, self.read("video.mp4"))
+
+    def test_unique_names(self):
+        plaintexts = [os.urandom(1025) for _ in range(0, 8)]
+        filenames = self.store([self.create_entity(plaintext) for plaintext in plaintexts], SlowNamingSinkWorker)
+        self.assertEqual(["video.mp4"] + ["video_%d.mp4" % i for i in range(1, 8)], sorted(filenames))
+        self.assertEqual(sorted(plaintexts), sorted(self.read(filename) for filename in filenames))
+
+    def test_shutdown_stops_download_threads(self):
+        self.store([self.create_entity(os.urandom(1025))], download_workers=3)
+        self.assertEqual([], [thread for thread in threading.enumerate() if thread.name.startswith("SinkDownload-")])
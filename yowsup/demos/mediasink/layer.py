@@ -22,6 +22,7 @@ logger = logging.getLogger(__name__)
 
 class MediaSinkLayer(YowInterfaceLayer):
     PROP_STORAGE_DIR = "org.openwhatsapp.yowsup.prop.demos.mediasink.storage_dir"
+    PROP_DOWNLOAD_WORKERS = "org.openwhatsapp.yowsup.prop.demos.mediasink.download_workers"
 
     def __init__(self):
         super(MediaSinkLayer, self).__init__()
@@ -40,7 +41,7 @@ class MediaSinkLayer(YowInterfaceLayer):
             os.makedirs(storage_dir)
 
         logger.info("Storing incoming media to %s" % storage_dir)
-        self._sink_worker = SinkWorker(storage_dir)
+        self._sink_worker = SinkWorker(storage_dir, self.getProp(self.PROP_DOWNLOAD_WORKERS))
         self._sink_worker.start()
 
     @ProtocolEntityCallback("message")
@@ -1,6 +1,5 @@
 import abc
 import logging
-from six import with_metaclass
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +13,7 @@ class YowsupEnvType(abc.ABCMeta):
         super(YowsupEnvType, cls).__init__(name, bases, dct)
 
 
-class YowsupEnv(with_metaclass(YowsupEnvType, object)):
+class YowsupEnv(object, metaclass=YowsupEnvType):
     __metaclass__ = YowsupEnvType
     __ENVS = {}
     __CURR = None
@@ -1,11 +1,7 @@
 import unittest
 import inspect
 import threading
-
-try:
-    import Queue
-except ImportError:
-    import queue as Queue
+import queue
 
 class YowLayerEvent:
     def __init__(self, name, **kwargs):
@@ -38,7 +34,7 @@ class YowLayer(object):
     __upper = None
     __lower = None
     _props = {}
-    __detachedQueue = Queue.Queue()
+    __detachedQueue = queue.Queue()
     # def __init__(self, upperLayer, lowerLayer):
     #     self.setLayers(upperLayer, lowerLayer)
 
@@ -79,10 +75,22 @@ class YowLayer(object):
             self.__upper.receive(data)
 
     def toLower(self, data):
-        self.lock.acquire()
-        if self.__lower:
-            self.__lower.send(data)
-        self.lock.release()
+        lock = self.lock
+        if lock is None:
+            if self.__lower:
+                self.__lower.send(data)
+            return
+        with lock:
+            if self.__lower:
+                self.__lower.send(data)
+
+    def setSingleThreaded(self, singleThreaded):
+        """
+        :param singleThreaded: whether everything passing through the layer does so on a single thread, toLower then
+        doesn't serialize sends with the layer's lock
+        :type singleThreaded: bool
+        """
+        self.lock = None if singleThreaded else threading.Lock()
 
     def emitEvent(self, yowLayerEvent):
         if self.__upper and not self.__upper.onEvent(yowLayerEvent):
@@ -188,6 +196,11 @@ class YowParallelLayer(YowLayer):
         for s in self.sublayers:
             s.setStack(self.getStack())
 
+    def setSingleThreaded(self, singleThreaded):
+        super(YowParallelLayer, self).setSingleThreaded(singleThreaded)
+        for s in self.sublayers:
+            s.setSingleThreaded(singleThreaded)
+
 
     def receive(self, data):
         for s in self.sublayers:
@@ -12,6 +12,9 @@ logger = logging.getLogger(__name__)
 
 
 class AxolotlBaseLayer(YowProtocolLayer):
+    # max number of jids in a single key request
+    KEYS_BATCH_SIZE = 100
+
     def __init__(self):
         super(AxolotlBaseLayer, self).__init__()
         self._manager = None  # type: AxolotlManager | None
@@ -41,35 +44,52 @@ class AxolotlBaseLayer(YowProtocolLayer):
         self._manager = None
 
     def getKeysFor(self, jids, resultClbk, errorClbk = None, reason=None):
-        logger.debug("getKeysFor(jids=%s, resultClbk=[omitted], errorClbk=[omitted], reason=%s)" % (jids, reason))
+        """
+        Fetches keys of jids, at most KEYS_BATCH_SIZE per request, and creates sessions with them. resultClbk gets the
+        results of all requests once the last one is answered, unless every request failed. errorClbk is called for
+        each failed request.
+        """
+        logger.debug("getKeysFor(jids=[%d jids], resultClbk=[omitted], errorClbk=[omitted], reason=%s)" % (len(jids), reason))
+        successJids = []
+        errorJids = {}  # jid -> exception
+        requests = {"pending": 0, "failed": 0}
+
+        def onAnswered():
+            requests["pending"] -= 1
+            if requests["pending"] == 0 and requests["failed"] < len(batches):
+                resultClbk(successJids, errorJids)
 
         def onSuccess(resultNode, getKeysEntity):
             entity = ResultGetKeysIqProtocolEntity.fromProtocolTreeNode(resultNode)
             resultJids = entity.getJids()
-            successJids = []
-            errorJids = entity.getErrors() #jid -> exception
+            errorJids.update(entity.getErrors())
 
+            preKeyBundles = {}
             for jid in getKeysEntity.jids:
                 if jid not in resultJids:
                     self.skipEncJids.append(jid)
                     continue
+                preKeyBundles[jid.split('@')[0]] = entity.getPreKeyBundleFor(jid)
 
+            errors = self.manager.create_sessions(preKeyBundles, autotrust=self.getProp(PROP_IDENTITY_AUTOTRUST, False))
+            for jid in getKeysEntity.jids:
                 recipient_id = jid.split('@')[0]
-                preKeyBundle = entity.getPreKeyBundleFor(jid)
-                try:
-                    self.manager.create_session(recipient_id, preKeyBundle,
-                                                autotrust=self.getProp(PROP_IDENTITY_AUTOTRUST, False))
+                if recipient_id in errors:
+                    errorJids[jid] = errors[recipient_id]
+                    logger.error(errors[recipient_id])
+                    logger.warning("Ignoring message with untrusted identity")
+                elif recipient_id in preKeyBundles:
                     successJids.append(jid)
-                except exceptions.UntrustedIdentityException as e:
-                        errorJids[jid] = e
-                        logger.error(e)
-                        logger.warning("Ignoring message with untrusted identity")
-
-            resultClbk(successJids, errorJids)
+            onAnswered()
 
         def onError(errorNode, getKeysEntity):
+            requests["failed"] += 1
             if errorClbk:
                 errorClbk(errorNode, getKeysEntity)
+            onAnswered()
 
-        entity = GetKeysIqProtocolEntity(jids, reason=reason)
-        self._sendIq(entity, onSuccess, onError=onError)
+        batches = [jids[i:i + self.KEYS_BATCH_SIZE] for i in range(0, len(jids), self.KEYS_BATCH_SIZE)]
+        requests["pending"] = len(batches)
+        for batch in batches:
+            entity = GetKeysIqProtocolEntity(batch, reason=reason)
+            self._sendIq(entity, onSuccess, onError=onError)
@@ -2,6 +2,7 @@ from .layer_base import AxolotlBaseLayer
 from yowsup.layers import YowLayerEvent, EventCallback
 from yowsup.layers.network.layer import YowNetworkLayer
 from yowsup.layers.axolotl.protocolentities import *
+from yowsup.layers.axolotl.props import PROP_STORE_FLUSH_INTERVAL
 from yowsup.layers.auth.layer_authentication import YowAuthenticationProtocolLayer
 from yowsup.layers.protocol_acks.protocolentities import OutgoingAckProtocolEntity
 from axolotl.util.hexutil import HexUtil
@@ -13,10 +14,16 @@ logger = logging.getLogger(__name__)
 
 
 class AxolotlControlLayer(AxolotlBaseLayer):
+    DEFAULT_STORE_FLUSH_INTERVAL = 5
+
     def __init__(self):
         super(AxolotlControlLayer, self).__init__()
         self._unsent_prekeys = []
+        self._leveled_prekeys = None  # type: concurrent.futures.Future | None
+        # authed passively and waiting for _leveled_prekeys before flushing
+        self._flush_when_leveled = False
         self._reboot_connection = False
+        self._connection_id = 0
 
     def send(self, node):
         self.toLower(node)
@@ -46,31 +53,71 @@ class AxolotlControlLayer(AxolotlBaseLayer):
         entity = RequestKeysEncryptNotification.fromProtocolTreeNode(protocolTreeNode)
         ack = OutgoingAckProtocolEntity(protocolTreeNode["id"], "notification", protocolTreeNode["type"], protocolTreeNode["from"])
         self.toLower(ack.toProtocolTreeNode())
-        self.flush_keys(
-            self.manager.generate_signed_prekey(),
-            self.manager.level_prekeys(force=True)
+        signed_prekey = self.manager.generate_signed_prekey()
+        self.manager.level_prekeys_async(force=True).add_done_callback(
+            lambda future: self.getStack().execDetached(lambda: self.flush_keys(signed_prekey, future.result()))
         )
 
     @EventCallback(YowNetworkLayer.EVENT_STATE_CONNECTED)
     def on_connected(self, yowLayerEvent):
         super(AxolotlControlLayer, self).on_connected(yowLayerEvent)
-        self.manager.level_prekeys()
         self._unsent_prekeys.extend(self.manager.load_unsent_prekeys())
-        if len(self._unsent_prekeys):
+        if self._leveled_prekeys is None:
+            # prekeys are generated while the connection is being authenticated, and are collected in
+            # _on_prekeys_leveled. Ones still being generated for a previous connection are collected for this one.
+            future = self.manager.level_prekeys_async()
+            if future is not None:
+                self._leveled_prekeys = future
+                future.add_done_callback(
+                    lambda future: self.getStack().execDetached(lambda: self._on_prekeys_leveled(future))
+                )
+        if len(self._unsent_prekeys) or self._leveled_prekeys is not None:
             self.setProp(YowAuthenticationProtocolLayer.PROP_PASSIVE, True)
+        self._connection_id += 1
+        if self.manager.is_cached:
+            self._schedule_store_flush(self._connection_id)
+
+    def _schedule_store_flush(self, connection_id):
+        interval = self.getProp(PROP_STORE_FLUSH_INTERVAL, self.DEFAULT_STORE_FLUSH_INTERVAL)
+        self.getStack().execDetachedLater(interval, lambda: self._flush_store(connection_id))
+
+    def _flush_store(self, connection_id):
+        # stops once the connection it was scheduled for is gone, on_disconnected flushed for it
+        if connection_id == self._connection_id and self.manager is not None:
+            self.manager.flush()
+            self._schedule_store_flush(connection_id)
 
     @EventCallback(YowAuthenticationProtocolLayer.EVENT_AUTHED)
     def onAuthed(self, yowLayerEvent):
-        if yowLayerEvent.getArg("passive") and len(self._unsent_prekeys):
-            logger.debug("SHOULD FLUSH KEYS %d NOW!!" % len(self._unsent_prekeys))
-            self.flush_keys(
-                self.manager.load_latest_signed_prekey(generate=True),
-                self._unsent_prekeys[:], reboot_connection=True
-            )
-            self._unsent_prekeys = []
+        if yowLayerEvent.getArg("passive") and (len(self._unsent_prekeys) or self._leveled_prekeys is not None):
+            if self._leveled_prekeys is not None:
+                self._flush_when_leveled = True
+            else:
+                self._flush_unsent_prekeys()
+
+    def _on_prekeys_leveled(self, future):
+        self._leveled_prekeys = None
+        self._unsent_prekeys.extend(future.result())
+        if self._flush_when_leveled:
+            self._flush_unsent_prekeys()
+
+    def _flush_unsent_prekeys(self):
+        self._flush_when_leveled = False
+        # prekeys stored by a previous connection's leveling can also have been loaded as unsent
+        prekeys = list(dict((prekey.getId(), prekey) for prekey in self._unsent_prekeys).values())
+        self._unsent_prekeys = []
+        logger.debug("SHOULD FLUSH KEYS %d NOW!!" % len(prekeys))
+        self.flush_keys(
+            self.manager.load_latest_signed_prekey(generate=True),
+            prekeys, reboot_connection=True
+        )
 
     @EventCallback(YowNetworkLayer.EVENT_STATE_DISCONNECTED)
     def on_disconnected(self, yowLayerEvent):
+        if self.manager is not None:
+            self.manager.flush()
+        self._connection_id += 1
+        self._flush_when_leveled = False
         super(AxolotlControlLayer, self).on_disconnected(yowLayerEvent)
         logger.debug(("Disconnected, reboot_connect? = %s" % self._reboot_connection))
         if self._reboot_connection:
@@ -5,16 +5,23 @@ from yowsup.layers.protocol_groups.protocolentities import InfoGroupsIqProtocolE
 from axolotl.protocol.whispermessage import WhisperMessage
 from yowsup.layers.protocol_messages.protocolentities.message import MessageMetaAttributes
 from yowsup.layers.axolotl.protocolentities.iq_keys_get_result import MissingParametersException
+from yowsup.layers.axolotl.props import PROP_GROUP_ENCRYPT_WORKERS, PROP_SENT_STORE_MAX_MESSAGES, \
+    PROP_SENT_STORE_MAX_AGE, PROP_SENT_STORE_SPILL_PATH
+from yowsup.layers.axolotl.sentstore import SentMessageStore
+from yowsup.layers.network.layer import YowNetworkLayer
+from yowsup.layers import EventCallback
 from yowsup.axolotl import exceptions
 from .layer_base import AxolotlBaseLayer
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 
 class AxolotlSendLayer(AxolotlBaseLayer):
-    MAX_SENT_QUEUE = 100
+    MAX_SENT_QUEUE = SentMessageStore.DEFAULT_MAX_MESSAGES
 
     def __init__(self):
         super(AxolotlSendLayer, self).__init__()
@@ -22,18 +29,65 @@ class AxolotlSendLayer(AxolotlBaseLayer):
         self.sessionCiphers = {}
         self.groupCiphers = {}
         '''
-            Sent messages will be put in Queue until we receive a receipt for them.
+            Sent messages will be put in a SentMessageStore until we receive a receipt for them.
             This is for handling retry receipts which requires re-encrypting and resend of the original message
             As the receipt for a sent message might arrive at a different yowsup instance,
             ideally the original message should be fetched from a persistent storage.
-            Therefore, if the original message is not in sentQueue for any reason, we will
+            Therefore, if the original message is not in the store for any reason, we will
             notify the upper layers and let them handle it.
         '''
-        self.sentQueue = []
+        self._sentStore = None  # type: SentMessageStore | None
+        self._encrypt_executor = None  # type: ThreadPoolExecutor | None
+        '''
+            Messages to jids we are fetching keys for are held here and sent once the session exists. Jids queued
+            while handling one batch of messages are requested together on the next run of the stack's loop.
+            Messages are enqueued from the sending thread and the queue is flushed on the stack's, _keysLock guards
+            both.
+        '''
+        self._awaitingKeys = {}  # type: dict[str, list[tuple[ProtocolTreeNode, RetryIncomingReceiptProtocolEntity]]]
+        self._keysQueue = []  # type: list[str]
+        self._keysLock = threading.Lock()
 
     def __str__(self):
         return "Axolotl Layer"
 
+    @EventCallback(YowNetworkLayer.EVENT_STATE_DISCONNECTED)
+    def on_disconnected(self, yowLayerEvent):
+        if self._encrypt_executor is not None:
+            self._encrypt_executor.shutdown(wait=False)
+            self._encrypt_executor = None
+        with self._keysLock:
+            if len(self._awaitingKeys):
+                logger.warning("Dropping messages to %d jids still waiting for keys" % len(self._awaitingKeys))
+            self._awaitingKeys = {}
+            self._keysQueue = []
+        super(AxolotlSendLayer, self).on_disconnected(yowLayerEvent)
+
+    @property
+    def sentStore(self):
+        """
+        :rtype: SentMessageStore
+        """
+        if self._sentStore is None:
+            self._sentStore = SentMessageStore(
+                self.getProp(PROP_SENT_STORE_MAX_MESSAGES, self.MAX_SENT_QUEUE),
+                self.getProp(PROP_SENT_STORE_MAX_AGE),
+                self.getProp(PROP_SENT_STORE_SPILL_PATH)
+            )
+        return self._sentStore
+
+    def _get_encrypt_executor(self):
+        """
+        :return: executor for encrypting sender keys to group participants, None unless PROP_GROUP_ENCRYPT_WORKERS is set
+        :rtype: ThreadPoolExecutor | None
+        """
+        workers = self.getProp(PROP_GROUP_ENCRYPT_WORKERS, 0)
+        if not workers:
+            return None
+        if self._encrypt_executor is None:
+            self._encrypt_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="axolotl-encrypt")
+        return self._encrypt_executor
+
     def send(self, node):
         if node.tag == "message" and node["to"] not in self.skipEncJids:
             self.processPlaintextNodeAndSend(node)
@@ -41,22 +95,17 @@ class AxolotlSendLayer(AxolotlBaseLayer):
             self.toLower(node)
 
     def receive(self, protocolTreeNode):
-
-        def on_get_keys_success(node, retry_entity, success_jids, errors):
-            if len(errors):
-                self.on_get_keys_process_errors(errors)
-            elif len(success_jids) == 1:
-                self.processPlaintextNodeAndSend(node, retry_entity)
-            else:
-                raise NotImplementedError()
-
         if not self.processIqRegistry(protocolTreeNode):
             if protocolTreeNode.tag == "receipt":
                 '''
-                Going to keep all group message enqueued, as we get receipts from each participant
-                So can't just remove it on first receipt. Therefore, the MAX queue length mechanism should better be working
+                Group messages stay in the store until each participant they were distributed to sent a receipt,
+                other messages are removed by their first receipt
                 '''
-                messageNode = self.getEnqueuedMessageNode(protocolTreeNode["id"], protocolTreeNode["participant"] is not None)
+                participant = protocolTreeNode["participant"]
+                if protocolTreeNode["type"] == "retry" and participant is None:
+                    messageNode = self.sentStore.pop(protocolTreeNode["id"])
+                else:
+                    messageNode = self.sentStore.get(protocolTreeNode["id"])
                 if not messageNode:
                     logger.debug("Axolotl layer does not have the message, bubbling it upwards")
                     self.toUpper(protocolTreeNode)
@@ -64,12 +113,12 @@ class AxolotlSendLayer(AxolotlBaseLayer):
                     logger.info("Got retry to for message %s, and Axolotl layer has the message" % protocolTreeNode["id"])
                     retryReceiptEntity = RetryIncomingReceiptProtocolEntity.fromProtocolTreeNode(protocolTreeNode)
                     self.toLower(retryReceiptEntity.ack().toProtocolTreeNode())
-                    self.getKeysFor(
-                        [protocolTreeNode["participant"] or protocolTreeNode["from"]],
-                        lambda successJids, errors: on_get_keys_success(messageNode, retryReceiptEntity, successJids, errors)
+                    self.enqueueForKeys(
+                        protocolTreeNode["participant"] or protocolTreeNode["from"], messageNode, retryReceiptEntity
                     )
                 else:
                     #not interested in any non retry receipts, bubble upwards
+                    self.sentStore.ack(protocolTreeNode["id"], participant)
                     self.toUpper(protocolTreeNode)
 
     def on_get_keys_process_errors(self, errors):
@@ -81,52 +130,94 @@ class AxolotlSendLayer(AxolotlBaseLayer):
             elif isinstance(error, exceptions.UntrustedIdentityException):
                 logger.error("Failed to create session for %s as user's identity is not trusted. " % jid)
             else:
-                logger.error("Failed to process keys for %s, is that a valid user? Exception: %s" % error)
+                logger.error("Failed to process keys for %s, is that a valid user? Exception: %s" % (jid, error))
 
     def processPlaintextNodeAndSend(self, node, retryReceiptEntity = None):
         recipient_id = node["to"].split('@')[0]
         isGroup = "-" in recipient_id
 
-        def on_get_keys_error(error_node, getkeys_entity, plaintext_node):
-            logger.error("Failed to fetch keys for %s, is that a valid user? "
-                         "Server response: [code=%s, text=%s], aborting send." % (
-                plaintext_node["to"], error_node.children[0]["code"], error_node.children[0]["text"]
-            ))
-
-        def on_get_keys_success(node, success_jids, errors):
-            if len(errors):
-                self.on_get_keys_process_errors(errors)
-            elif len(success_jids) == 1:
-                self.sendToContact(node)
-            else:
-                raise NotImplementedError()
-
         if isGroup:
             self.sendToGroup(node, retryReceiptEntity)
         elif self.manager.session_exists(recipient_id):
             self.sendToContact(node)
         else:
-            self.getKeysFor(
-                [node["to"]],
-                lambda successJids, errors: on_get_keys_success(node, successJids, errors),
-                lambda error_node, entity: on_get_keys_error(error_node, entity, node)
-            )
+            self.enqueueForKeys(node["to"], node)
+
+    def enqueueForKeys(self, jid, node, retryReceiptEntity=None):
+        """
+        Holds node until keys of jid are fetched and a session is created with them, then processes it again
+        :param jid: whose keys to fetch, the recipient or the participant asking for a retry
+        :type jid: str
+        :param node: plaintext message node
+        :type node: ProtocolTreeNode
+        :param retryReceiptEntity:
+        :type retryReceiptEntity: RetryIncomingReceiptProtocolEntity | None
+        """
+        logger.debug("enqueueForKeys(jid=%s, node=[omitted], retryReceiptEntity=%s)" % (jid, retryReceiptEntity))
+        with self._keysLock:
+            if jid in self._awaitingKeys:
+                # keys for jid are already queued or being fetched
+                self._awaitingKeys[jid].append((node, retryReceiptEntity))
+                return
+            self._awaitingKeys[jid] = [(node, retryReceiptEntity)]
+            self._keysQueue.append(jid)
+            queued = len(self._keysQueue)
+        if queued == 1:
+            self.getStack().execDetached(self.flushKeysQueue)
+        elif queued >= self.KEYS_BATCH_SIZE:
+            self.flushKeysQueue()
+
+    def flushKeysQueue(self):
+        """
+        Requests keys for all queued jids
+        """
+        with self._keysLock:
+            jids, self._keysQueue = self._keysQueue, []
+        if not jids:
+            return
+        logger.debug("flushKeysQueue(): requesting keys for %d jids" % len(jids))
+
+        def on_get_keys_success(success_jids, errors):
+            if len(errors):
+                self.on_get_keys_process_errors(errors)
+            self._releaseAwaitingKeys(success_jids)
+            self._dropAwaitingKeys([jid for jid in jids if jid in self._awaitingKeys])
 
-    def enqueueSent(self, node):
-        logger.debug("enqueueSent(node=[omitted])")
-        if len(self.sentQueue) >= self.__class__.MAX_SENT_QUEUE:
-            logger.warn("Discarding queued node without receipt")
-            self.sentQueue.pop(0)
-        self.sentQueue.append(node)
-
-    def getEnqueuedMessageNode(self, messageId, keepEnqueued = False):
-        for i in range(0, len(self.sentQueue)):
-            if self.sentQueue[i]["id"] == messageId:
-                if keepEnqueued:
-                    return self.sentQueue[i]
-                return self.sentQueue.pop(i)
-
-    def sendEncEntities(self, node, encEntities, participant=None):
+        def on_get_keys_error(error_node, getkeys_entity):
+            logger.error("Failed to fetch keys for %s, is that a valid user? "
+                         "Server response: [code=%s, text=%s], aborting send." % (
+                getkeys_entity.jids, error_node.children[0]["code"], error_node.children[0]["text"]
+            ))
+            self._dropAwaitingKeys(getkeys_entity.jids)
+
+        self.getKeysFor(jids, on_get_keys_success, on_get_keys_error)
+
+    def _releaseAwaitingKeys(self, jids):
+        for jid in jids:
+            with self._keysLock:
+                nodes = self._awaitingKeys.pop(jid, [])
+            for node, retryReceiptEntity in nodes:
+                self.processPlaintextNodeAndSend(node, retryReceiptEntity)
+
+    def _dropAwaitingKeys(self, jids):
+        for jid in jids:
+            with self._keysLock:
+                nodes = self._awaitingKeys.pop(jid, [])
+            if jid in self.skipEncJids:
+                # the server has no keys for jid, send messages to it as is, like any later message to it
+                for node in [node for node, retryReceiptEntity in nodes if retryReceiptEntity is None]:
+                    self.toLower(node)
+                nodes = [entry for entry in nodes if entry[1] is not None]
+            if len(nodes):
+                logger.error("Dropping %d messages waiting for keys of %s" % (len(nodes), jid))
+
+    def enqueueSent(self, node, participants=None):
+        logger.debug("enqueueSent(node=[omitted], participants=%s)" % (
+            "[%d participants]" % len(participants) if participants is not None else None
+        ))
+        self.sentStore.put(node, participants)
+
+    def sendEncEntities(self, node, encEntities, participant=None, participants=None):
         logger.debug("sendEncEntities(node=[omitted], encEntities=[omitted], participant=%s)" % participant)
         message_attrs = MessageMetaAttributes.from_message_protocoltreenode(node)
         message_attrs.participant = participant
@@ -138,7 +229,7 @@ class AxolotlSendLayer(AxolotlBaseLayer):
         # if participant is set, this message is directed to that specific participant as a result of a retry, therefore
         # we already have the original group message and there is no need to store it again.
         if participant is None:
-            self.enqueueSent(node)
+            self.enqueueSent(node, participants)
         self.toLower(messageEntity.toProtocolTreeNode())
 
     def sendToContact(self, node):
@@ -171,11 +262,15 @@ class AxolotlSendLayer(AxolotlBaseLayer):
         participant = jidsNeedSenderKey[0] if len(jidsNeedSenderKey) == 1 and retryCount > 0 else None
         if len(jidsNeedSenderKey):
             senderKeyDistributionMessage = self.manager.group_create_skmsg(groupJid)
-            for jid in jidsNeedSenderKey:
-                message =  self.serializeSenderKeyDistributionMessageToProtobuf(node["to"], senderKeyDistributionMessage)
-                if retryCount > 0:
-                    message.MergeFromString(protoNode.getData())
-                ciphertext = self.manager.encrypt(jid.split('@')[0], message.SerializeToString())
+            # the plaintext is the same for every participant, only the encryption differs
+            message = self.serializeSenderKeyDistributionMessageToProtobuf(node["to"], senderKeyDistributionMessage)
+            if retryCount > 0:
+                message.MergeFromString(protoNode.getData())
+            ciphertexts = self.manager.encrypt_many(
+                [jid.split('@')[0] for jid in jidsNeedSenderKey], message.SerializeToString(),
+                self._get_encrypt_executor()
+            )
+            for jid, ciphertext in zip(jidsNeedSenderKey, ciphertexts):
                 encEntities.append(
                     EncProtocolEntity(
                             EncProtocolEntity.TYPE_MSG if ciphertext.__class__ == WhisperMessage else EncProtocolEntity.TYPE_PKMSG
@@ -190,14 +285,14 @@ class AxolotlSendLayer(AxolotlBaseLayer):
 
             encEntities.append(EncProtocolEntity(EncProtocolEntity.TYPE_SKMSG, 2, ciphertext, mediaType))
 
-        self.sendEncEntities(node, encEntities, participant)
+        # when the sender key was distributed to everyone with this message, we know whose receipts to wait for
+        self.sendEncEntities(node, encEntities, participant,
+                             jidsNeedSenderKey if len(jidsNeedSenderKey) and not retryCount else None)
 
     def ensureSessionsAndSendToGroup(self, node, jids):
         logger.debug("ensureSessionsAndSendToGroup(node=[omitted], jids=%s)" % jids)
-        jidsNoSession = []
-        for jid in jids:
-            if not self.manager.session_exists(jid.split('@')[0]):
-                jidsNoSession.append(jid)
+        withSession = self.manager.sessions_exist([jid.split('@')[0] for jid in jids])
+        jidsNoSession = [jid for jid in jids if jid.split('@')[0] not in withSession]
 
         def on_get_keys_success(node, success_jids, errors):
             if len(errors):
@@ -259,6 +354,5 @@ class AxolotlSendLayer(AxolotlBaseLayer):
         m = message or Message()
         m.sender_key_distribution_message.group_id = groupId
         m.sender_key_distribution_message.axolotl_sender_key_distribution_message = senderKeyDistributionMessage.serialize()
-        m.sender_key_distribution_message.axolotl_sender_key_distribution_message = senderKeyDistributionMessage.serialize()
         # m.conversation = text
         return m
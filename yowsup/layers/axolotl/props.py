@@ -1 +1,6 @@
-PROP_IDENTITY_AUTOTRUST =  "org.openwhatsapp.yowsup.prop.axolotl.INDENTITY_AUTOTRUST"
\ No newline at end of file
+PROP_IDENTITY_AUTOTRUST =  "org.openwhatsapp.yowsup.prop.axolotl.INDENTITY_AUTOTRUST"
+PROP_STORE_FLUSH_INTERVAL = "org.openwhatsapp.yowsup.prop.axolotl.STORE_FLUSH_INTERVAL"
+PROP_GROUP_ENCRYPT_WORKERS = "org.openwhatsapp.yowsup.prop.axolotl.GROUP_ENCRYPT_WORKERS"
+PROP_SENT_STORE_MAX_MESSAGES = "org.openwhatsapp.yowsup.prop.axolotl.SENT_STORE_MAX_MESSAGES"
+PROP_SENT_STORE_MAX_AGE = "org.openwhatsapp.yowsup.prop.axolotl.SENT_STORE_MAX_AGE"
+PROP_SENT_STORE_SPILL_PATH = "org.openwhatsapp.yowsup.prop.axolotl.SENT_STORE_SPILL_PATH"
@@ -6,7 +6,6 @@ from axolotl.identitykey import IdentityKey
 from axolotl.ecc.curve import Curve
 from axolotl.ecc.djbec import DjbECPublicKey
 import binascii
-import sys
 
 
 class ResultGetKeysIqProtocolEntity(ResultIqProtocolEntity):
@@ -70,15 +69,12 @@ class ResultGetKeysIqProtocolEntity(ResultIqProtocolEntity):
 
     @staticmethod
     def _bytesToInt(val):
-        if sys.version_info >= (3,0):
-            valEnc = val.encode('latin-1') if type(val) is str else val
-        else:
-            valEnc = val
+        valEnc = val.encode('latin-1') if type(val) is str else val
         return int(binascii.hexlify(valEnc), 16)
 
     @staticmethod
     def encStr(string):
-        if sys.version_info >= (3,0) and type(string) is str:
+        if type(string) is str:
             return string.encode('latin-1')
         return string
 
@@ -0,0 +1,209 @@
+from yowsup.layers.coder.tokendictionary import TokenDictionary
+try:
+    from yowsup.layers.coder._coder import ReadDecoder, WriteEncoder
+except ImportError:
+    from yowsup.layers.coder.encoder import WriteEncoder
+    from yowsup.layers.coder.decoder import ReadDecoder
+from collections import OrderedDict
+import sqlite3
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _SentMessage(object):
+    __slots__ = ("node", "pending", "timestamp")
+
+    def __init__(self, node, pending, timestamp):
+        self.node = node
+        self.pending = pending  # type: set[str] | None
+        self.timestamp = timestamp
+
+
+class SentMessageStore(object):
+    """
+    Plaintext message nodes sent by AxolotlSendLayer, kept by message id until they are acknowledged so that they can
+    be encrypted and sent again when a retry receipt comes in.
+
+    A message to a contact is acknowledged by its first receipt. A group message is kept until each participant it was
+    distributed to has sent a receipt, or until it ages out if its participants are unknown. At most max_messages are
+    kept in memory, the oldest are dropped when it's full, or moved to a sqlite database at spill_path when that is
+    given. Messages older than max_age are dropped from both.
+    """
+    DEFAULT_MAX_MESSAGES = 1000
+    DEFAULT_MAX_AGE = 24 * 60 * 60
+    EXPIRE_SPILL_INTERVAL = 60
+
+    def __init__(self, max_messages=None, max_age=None, spill_path=None, clock=time.time):
+        """
+        :param max_messages: number of messages kept in memory
+        :type max_messages: int | None
+        :param max_age: seconds after which a message is dropped
+        :type max_age: float | None
+        :param spill_path: sqlite database to move messages which don't fit in memory to
+        :type spill_path: str | None
+        :param clock:
+        :type clock: () -> float
+        """
+        self._max_messages = max_messages or self.DEFAULT_MAX_MESSAGES
+        self._max_age = max_age or self.DEFAULT_MAX_AGE
+        self._clock = clock
+        self._messages = OrderedDict()  # type: OrderedDict[str, _SentMessage]
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "acknowledged": 0,
+            "evicted_size": 0,
+            "evicted_age": 0,
+            "spilled": 0
+        }
+        self._spill = None  # type: sqlite3.Connection | None
+        self._spill_expired_at = 0
+        if spill_path is not None:
+            tokenDictionary = TokenDictionary()
+            self._writer = WriteEncoder(tokenDictionary)
+            self._reader = ReadDecoder(tokenDictionary)
+            self._spill = sqlite3.connect(spill_path, check_same_thread=False)
+            self._spill.execute("PRAGMA journal_mode=WAL")
+            self._spill.execute("PRAGMA synchronous=NORMAL")
+            self._spill.execute("CREATE TABLE IF NOT EXISTS sent_messages (id TEXT PRIMARY KEY, timestamp REAL,"
+                                "pending TEXT, node BLOB);")
+            self._spill.execute("CREATE INDEX IF NOT EXISTS sent_messages_timestamp ON sent_messages(timestamp);")
+
+    def __len__(self):
+        return len(self._messages)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+    def get_metrics(self):
+        """
+        :return: lookup hits and misses, and counts of messages acknowledged, dropped for lack of space, dropped for
+        their age and moved to the spill database
+        :rtype: dict[str, int]
+        """
+        metrics = dict(self._metrics)
+        metrics["messages"] = len(self._messages)
+        if self._spill is not None:
+            metrics["spilled_messages"] = self._spill.execute("SELECT count(*) FROM sent_messages").fetchone()[0]
+        return metrics
+
+    def put(self, node, participants=None):
+        """
+        :param node: plaintext message node
+        :type node: ProtocolTreeNode
+        :param participants: for a group message, the participants whose receipts acknowledge it
+        :type participants: list[str] | None
+        """
+        self._expire()
+        message_id = node["id"]
+        self._messages.pop(message_id, None)
+        self._messages[message_id] = _SentMessage(
+            node, set(participants) if participants is not None else None, self._clock()
+        )
+        while len(self._messages) > self._max_messages:
+            _, message = self._messages.popitem(last=False)
+            if self._spill is not None:
+                self._spill_message(message)
+            else:
+                self._metrics["evicted_size"] += 1
+                logger.debug("Discarding sent message %s without receipt" % message.node["id"])
+
+    def get(self, message_id):
+        """
+        :type message_id: str
+        :rtype: ProtocolTreeNode | None
+        """
+        self._expire()
+        message = self._messages.get(message_id)
+        if message is None and self._spill is not None:
+            message = self._unspill(message_id)
+        if message is None or message.timestamp < self._clock() - self._max_age:
+            self._metrics["misses"] += 1
+            return None
+        self._metrics["hits"] += 1
+        return message.node
+
+    def pop(self, message_id):
+        """
+        :type message_id: str
+        :rtype: ProtocolTreeNode | None
+        """
+        node = self.get(message_id)
+        if node is not None:
+            del self._messages[message_id]
+        return node
+
+    def ack(self, message_id, participant=None):
+        """
+        Records a receipt, removes the message once it's acknowledged by every recipient
+        :param message_id:
+        :type message_id: str
+        :param participant: group participant who sent the receipt
+        :type participant: str | None
+        :return: whether the message is fully acknowledged
+        :rtype: bool
+        """
+        message = self._messages.get(message_id)
+        if message is None and self._spill is not None:
+            message = self._unspill(message_id)
+        if message is None:
+            return False
+        if participant is not None:
+            if message.pending is None:
+                return False
+            message.pending.discard(participant)
+            if message.pending:
+                return False
+        del self._messages[message_id]
+        self._metrics["acknowledged"] += 1
+        return True
+
+    def _expire(self):
+        deadline = self._clock() - self._max_age
+        while self._messages:
+            message = next(iter(self._messages.values()))
+            if message.timestamp >= deadline:
+                break
+            self._messages.popitem(last=False)
+            self._metrics["evicted_age"] += 1
+        if self._spill is not None and self._spill_expired_at < self._clock() - self.EXPIRE_SPILL_INTERVAL:
+            self._spill_expired_at = self._clock()
+            with self._spill:
+                expired = self._spill.execute("DELETE FROM sent_messages WHERE timestamp < ?", (deadline,)).rowcount
+            self._metrics["evicted_age"] += expired
+
+    def _spill_message(self, message):
+        with self._spill:
+            self._spill.execute(
+                "INSERT OR REPLACE INTO sent_messages(id, timestamp, pending, node) VALUES(?,?,?,?)", (
+                    message.node["id"], message.timestamp,
+                    "\n".join(sorted(message.pending)) if message.pending is not None else None,
+                    bytes(self._writer.protocolTreeNodeToBytes(message.node))
+                )
+            )
+        self._metrics["spilled"] += 1
+
+    def _unspill(self, message_id):
+        """
+        Moves a message back from the spill database into memory
+        """
+        row = self._spill.execute(
+            "SELECT timestamp, pending, node FROM sent_messages WHERE id = ?", (message_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._spill:
+            self._spill.execute("DELETE FROM sent_messages WHERE id = ?", (message_id,))
+        timestamp, pending, data = row
+        message = _SentMessage(
+            self._reader.getProtocolTreeNode(bytearray(data)),
+            set(jid for jid in pending.split("\n") if jid) if pending is not None else None,
+            timestamp
+        )
+        self._messages[message_id] = message
+        while len(self._messages) > self._max_messages:
+            self._spill_message(self._messages.popitem(last=False)[1])
+        return message
@@ -0,0 +1,93 @@
+from yowsup.axolotl.manager import AxolotlManager
+from yowsup.axolotl.store.cachedaxolotlstore import CachedAxolotlStore
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.layers import YowLayerEvent
+from yowsup.layers.auth.layer_authentication import YowAuthenticationProtocolLayer
+from yowsup.layers.axolotl.layer_control import AxolotlControlLayer
+from yowsup.layers.network.layer import YowNetworkLayer
+import threading
+import unittest
+
+
+class ProfileStub(object):
+    def __init__(self, axolotl_manager):
+        self.axolotl_manager = axolotl_manager
+
+
+class StackStub(object):
+    def __init__(self, profile):
+        self.props = {"profile": profile}
+        self.detached = []
+        self.later = []
+
+    def execDetached(self, fn):
+        self.detached.append(fn)
+
+    def execDetachedLater(self, delay, fn):
+        self.later.append(fn)
+
+    def getProp(self, key, default=None):
+        return self.props.get(key, default)
+
+    def setProp(self, key, val):
+        self.props[key] = val
+
+    def runDetached(self):
+        detached, self.detached = self.detached, []
+        for fn in detached:
+            fn()
+
+
+class AxolotlControlLayerPrekeysTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = AxolotlManager(LiteAxolotlStore(":memory:"), "1")
+        self.manager.COUNT_GEN_PREKEYS = 5
+        self.stack = StackStub(ProfileStub(self.manager))
+        self.sent = []
+        self.layer = AxolotlControlLayer()
+        self.layer.setStack(self.stack)
+        self.layer.toLower = self.sent.append
+
+    def test_flushed_once_leveled(self):
+        release = threading.Event()
+        generate_prekeys = self.manager._generate_prekeys
+        self.manager._generate_prekeys = lambda: release.wait(5) and generate_prekeys()
+
+        self.layer.on_connected(YowLayerEvent(YowNetworkLayer.EVENT_STATE_CONNECTED))
+        self.assertTrue(self.stack.getProp(YowAuthenticationProtocolLayer.PROP_PASSIVE))
+        # returns while prekeys are still being generated
+        self.layer.onAuthed(YowLayerEvent(YowAuthenticationProtocolLayer.EVENT_AUTHED, passive=True))
+        self.assertEqual([], self.sent)
+
+        future = self.layer._leveled_prekeys
+        release.set()
+        future.result(5)
+        self.stack.runDetached()
+        self.assertEqual(["iq"], [node.tag for node in self.sent])
+        self.assertEqual(5, len(self.sent[0].getChild("list").getAllChildren()))
+
+
+class AxolotlControlLayerStoreFlushTest(unittest.TestCase):
+    def connect(self, store):
+        manager = AxolotlManager(store, "1")
+        # enough prekeys already, none are generated on connect
+        manager.level_prekeys()
+        manager.set_prekeys_as_sent(manager.load_unsent_prekeys())
+        stack = StackStub(ProfileStub(manager))
+        layer = AxolotlControlLayer()
+        layer.setStack(stack)
+        layer.on_connected(YowLayerEvent(YowNetworkLayer.EVENT_STATE_CONNECTED))
+        return stack, layer
+
+    def test_not_scheduled_uncached(self):
+        stack, _ = self.connect(LiteAxolotlStore(":memory:"))
+        self.assertEqual([], stack.later)
+
+    def test_scheduled_cached(self):
+        stack, layer = self.connect(CachedAxolotlStore(LiteAxolotlStore(":memory:")))
+        self.assertEqual(1, len(stack.later))
+        stack.later.pop()()
+        self.assertEqual(1, len(stack.later))
+        layer.on_disconnected(YowLayerEvent(YowNetworkLayer.EVENT_STATE_DISCONNECTED))
+        stack.later.pop()()
+        self.assertEqual([], stack.later)
@@ -0,0 +1,134 @@
+from axolotl.state.prekeybundle import PreKeyBundle
+from axolotl.util.keyhelper import KeyHelper
+from yowsup.axolotl.manager import AxolotlManager
+from yowsup.axolotl.store.sqlite.liteaxolotlstore import LiteAxolotlStore
+from yowsup.layers.axolotl.layer_send import AxolotlSendLayer
+from yowsup.layers.axolotl.protocolentities import ResultGetKeysIqProtocolEntity
+from yowsup.structs import ProtocolTreeNode
+import threading
+import unittest
+
+
+def prekey_bundle():
+    identity = KeyHelper.generateIdentityKeyPair()
+    prekey = KeyHelper.generatePreKeys(1, 1)[0]
+    signed_prekey = KeyHelper.generateSignedPreKey(identity, 1)
+    return PreKeyBundle(
+        KeyHelper.generateRegistrationId(), 1, prekey.getId(), prekey.getKeyPair().getPublicKey(),
+        signed_prekey.getId(), signed_prekey.getKeyPair().getPublicKey(), signed_prekey.getSignature(),
+        identity.getPublicKey()
+    )
+
+
+class StackStub(object):
+    def __init__(self):
+        self.detached = []
+
+    def execDetached(self, fn):
+        self.detached.append(fn)
+
+    def getProp(self, key, default=None):
+        return default
+
+    def runDetached(self):
+        detached, self.detached = self.detached, []
+        for fn in detached:
+            fn()
+
+
+class AxolotlSendLayerKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.stack = StackStub()
+        self.sent = []
+        self.layer = AxolotlSendLayer()
+        self.layer.KEYS_BATCH_SIZE = 2
+        self.layer.setStack(self.stack)
+        self.layer.toLower = self.sent.append
+        self.layer._manager = AxolotlManager(LiteAxolotlStore(":memory:"), "1")
+        self.jids = ["%d@s.whatsapp.net" % (100 + i) for i in range(0, 5)]
+
+    def message(self, jid, i):
+        return ProtocolTreeNode("message", {"to": jid, "type": "text", "id": "%s-%d" % (jid, i)}, [
+            ProtocolTreeNode("proto", {"mediatype": None}, data=b"\x0a\x05hello")
+        ])
+
+    def answer(self, iq, bundles):
+        entity = ResultGetKeysIqProtocolEntity(iq["id"], dict(
+            (user["jid"], bundles[user["jid"]]) for user in iq.getChild("key").getAllChildren()
+            if user["jid"] in bundles
+        ))
+        self.layer.receive(entity.toProtocolTreeNode())
+
+    def test_coalesced_and_released(self):
+        for i in range(0, 2):
+            for jid in self.jids[:3]:
+                self.layer.send(self.message(jid, i))
+        # a full batch is requested right away
+        self.assertEqual(1, len(self.sent))
+        self.assertEqual(["iq"], [node.tag for node in self.sent])
+
+        self.layer.send(self.message(self.jids[3], 0))
+        self.stack.runDetached()
+        iqs = [node for node in self.sent if node.tag == "iq"]
+        self.assertEqual([self.jids[:2], self.jids[2:4]],
+                         [[user["jid"] for user in iq.getChild("key").getAllChildren()] for iq in iqs])
+
+        bundles = dict((jid, prekey_bundle()) for jid in self.jids)
+        del self.sent[:]
+        for iq in iqs:
+            self.answer(iq, bundles)
+        self.assertEqual(["%s-%d" % (jid, i) for jid in self.jids[:2] for i in range(0, 2)] +
+                         ["%s-%d" % (self.jids[2], i) for i in range(0, 2)] + ["%s-0" % self.jids[3]],
+                         [node["id"] for node in self.sent])
+        self.assertTrue(all(node.getChild("enc")["type"] == "pkmsg" for node in self.sent))
+        self.assertEqual({}, self.layer._awaitingKeys)
+
+        # sessions exist now, no more key requests
+        del self.sent[:]
+        self.layer.send(self.message(self.jids[0], 2))
+        self.assertEqual(["message"], [node.tag for node in self.sent])
+        self.assertEqual([], self.stack.detached)
+
+    def test_enqueue_while_flushing(self):
+        self.layer.KEYS_BATCH_SIZE = 1000
+        jids = ["%d@s.whatsapp.net" % (1000 + i) for i in range(0, 400)]
+        done = threading.Event()
+
+        def flush():
+            while not done.is_set():
+                self.layer.flushKeysQueue()
+
+        flusher = threading.Thread(target=flush)
+        flusher.start()
+        senders = [threading.Thread(target=lambda part: [self.layer.enqueueForKeys(jid, self.message(jid, 0))
+                                                         for jid in part], args=(jids[i::4],)) for i in range(0, 4)]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        done.set()
+        flusher.join()
+        self.stack.runDetached()
+        requested = [user["jid"] for iq in self.sent for user in iq.getChild("key").getAllChildren()]
+        self.assertEqual(sorted(jids), sorted(requested))
+
+    def test_missing_keys(self):
+        for jid in self.jids[:2]:
+            self.layer.send(self.message(jid, 0))
+        iq = self.sent.pop()
+        self.answer(iq, {self.jids[0]: prekey_bundle()})
+        self.assertEqual([self.jids[1]], self.layer.skipEncJids)
+        self.assertEqual(["%s-0" % jid for jid in self.jids[:2]], [node["id"] for node in self.sent])
+        self.assertEqual({}, self.layer._awaitingKeys)
+
+    def test_group_receipts(self):
+        received = []
+        self.layer.toUpper = received.append
+        node = ProtocolTreeNode("message", {"to": "123-456@g.us", "type": "text", "id": "group-0"})
+        self.layer.enqueueSent(node, self.jids[:2])
+        for jid in self.jids[:2]:
+            self.assertIs(node, self.layer.sentStore.get("group-0"))
+            self.layer.receive(ProtocolTreeNode("receipt", {"id": "group-0", "from": "123-456@g.us", "participant": jid}))
+        self.assertIsNone(self.layer.sentStore.get("group-0"))
+        self.assertEqual(2, len(received))
+        self.assertEqual(1, self.layer.sentStore.get_metrics()["acknowledged"])
@@ -0,0 +1,99 @@
+from yowsup.layers.axolotl.sentstore import SentMessageStore
+from yowsup.structs import ProtocolTreeNode
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def message(i):
+    return ProtocolTreeNode("message", {"to": "123@s.whatsapp.net", "type": "text", "id": "id%d" % i}, [
+        ProtocolTreeNode("proto", {"mediatype": "image"}, data=b"\x0a\x05hello")
+    ])
+
+
+class SentMessageStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_max_messages(self):
+        store = SentMessageStore(max_messages=3, clock=self.clock)
+        for i in range(0, 5):
+            store.put(message(i))
+        self.assertIsNone(store.get("id1"))
+        self.assertEqual("id2", store.get("id2")["id"])
+        self.assertEqual(3, len(store))
+        metrics = store.get_metrics()
+        self.assertEqual(2, metrics["evicted_size"])
+        self.assertEqual(1, metrics["misses"])
+        self.assertEqual(1, metrics["hits"])
+
+    def test_max_age(self):
+        store = SentMessageStore(max_age=60, clock=self.clock)
+        store.put(message(0))
+        self.clock.now += 30
+        store.put(message(1))
+        self.clock.now += 31
+        self.assertIsNone(store.get("id0"))
+        self.assertIsNotNone(store.get("id1"))
+        self.assertEqual(1, store.get_metrics()["evicted_age"])
+
+    def test_ack(self):
+        store = SentMessageStore(clock=self.clock)
+        store.put(message(0))
+        store.put(message(1), participants=["1@s.whatsapp.net", "2@s.whatsapp.net"])
+        store.put(message(2), participants=None)
+        self.assertTrue(store.ack("id0"))
+        self.assertIsNone(store.get("id0"))
+
+        self.assertFalse(store.ack("id1", "1@s.whatsapp.net"))
+        self.assertIsNotNone(store.get("id1"))
+        self.assertTrue(store.ack("id1", "2@s.whatsapp.net"))
+        self.assertIsNone(store.get("id1"))
+
+        # participants unknown, kept until it ages out
+        self.assertFalse(store.ack("id2", "1@s.whatsapp.net"))
+        self.assertIsNotNone(store.get("id2"))
+        self.assertEqual(2, store.get_metrics()["acknowledged"])
+
+    def test_pop(self):
+        store = SentMessageStore(clock=self.clock)
+        store.put(message(0))
+        self.assertEqual("id0", store.pop("id0")["id"])
+        self.assertIsNone(store.pop("id0"))
+
+    def test_spill(self):
+        store = SentMessageStore(max_messages=2, max_age=60, spill_path=os.path.join(self.directory, "sent.db"),
+                                 clock=self.clock)
+        store.put(message(0), participants=["1@s.whatsapp.net", "2@s.whatsapp.net"])
+        for i in range(1, 5):
+            store.put(message(i))
+        self.assertEqual(2, len(store))
+        self.assertEqual(3, store.get_metrics()["spilled_messages"])
+
+        node = store.get("id0")
+        self.assertEqual(message(0).getChild("proto").getData(), node.getChild("proto").getData())
+        self.assertEqual("image", node.getChild("proto")["mediatype"])
+        self.assertFalse(store.ack("id0", "1@s.whatsapp.net"))
+        self.assertTrue(store.ack("id0", "2@s.whatsapp.net"))
+        self.assertTrue(store.ack("id1"))
+
+        self.clock.now += 120
+        self.assertIsNone(store.get("id2"))
+        metrics = store.get_metrics()
+        self.assertEqual(0, metrics["evicted_size"])
+        self.assertEqual(0, metrics["spilled_messages"])
+        self.assertEqual(0, metrics["messages"])
+        store.close()
@@ -0,0 +1,478 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled ReadDecoder and WriteEncoder.
+
+This mirrors the pure python implementation in decoder.py and encoder.py byte for byte, and exposes the same
+interface: both are constructed with a TokenDictionary, ReadDecoder.getProtocolTreeNode(data) returns a
+ProtocolTreeNode and WriteEncoder.protocolTreeNodeToBytes(node) returns a bytearray. The coder layer picks this
+module up automatically when it was built, see setup.py.
+"""
+from cpython.bytearray cimport PyByteArray_FromStringAndSize
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from cpython.unicode cimport PyUnicode_DecodeASCII, PyUnicode_DecodeLatin1
+from libc.stdlib cimport free, realloc
+from libc.string cimport memcpy
+
+from yowsup.structs import ProtocolTreeNode
+import zlib
+
+cdef const char *HEX_DIGITS = b"0123456789ABCDEF"
+cdef const char *NIBBLE_DIGITS = b"0123456789-."
+
+# buffers grown beyond this are released after encoding instead of being kept for reuse
+cdef Py_ssize_t MAX_RETAINED_BUFFER = 1024 * 1024
+
+
+cdef class ReadDecoder:
+    cdef readonly object tokenDictionary
+    cdef list _primary
+    cdef list _secondary
+    cdef const unsigned char *_buf
+    cdef Py_ssize_t _length
+    cdef Py_ssize_t _offset
+
+    def __init__(self, tokenDictionary):
+        self.tokenDictionary = tokenDictionary
+        self._primary = list(tokenDictionary.dictionary)
+        self._secondary = list(tokenDictionary.secondaryDictionary)
+        self._buf = NULL
+        self._length = 0
+        self._offset = 0
+
+    def getProtocolTreeNode(self, data):
+        cdef const unsigned char[::1] view
+        cdef Py_ssize_t offset = 1
+
+        if type(data) is list:
+            data = bytearray(data)
+
+        view = data
+        if view.shape[0] == 0:
+            raise IndexError("index out of range")
+
+        if view[0] & self.tokenDictionary.FLAG_DEFLATE != 0:
+            data = zlib.decompress(bytes(data[1:]))
+            view = data
+            offset = 0
+        elif view[0] & self.tokenDictionary.FLAG_SEGMENTED != 0:
+            raise ValueError("server to client stanza fragmentation not supported")
+
+        self._buf = &view[0] if view.shape[0] else NULL
+        self._length = view.shape[0]
+        self._offset = offset
+        try:
+            return self._nextTreeInternal()
+        finally:
+            self._buf = NULL
+            self._length = 0
+
+    cdef inline int _readInt8(self) except -1:
+        if self._offset >= self._length:
+            raise IndexError("index out of range")
+        self._offset += 1
+        return self._buf[self._offset - 1]
+
+    cdef inline const unsigned char *_readFixed(self, Py_ssize_t size) except NULL:
+        if self._offset + size > self._length:
+            raise IndexError("index out of range")
+        self._offset += size
+        return self._buf + self._offset - size
+
+    cdef int _readInt16(self) except -1:
+        cdef const unsigned char *p = self._readFixed(2)
+        return (p[0] << 8) | p[1]
+
+    cdef int _readInt20(self) except -1:
+        cdef const unsigned char *p = self._readFixed(3)
+        return ((p[0] & 0xF) << 16) | (p[1] << 8) | p[2]
+
+    cdef long _readInt31(self) except -1:
+        cdef const unsigned char *p = self._readFixed(4)
+        return (<long>(p[0] & 0x7F) << 24) | (p[1] << 16) | (p[2] << 8) | p[3]
+
+    cdef const unsigned char *_readArray(self, Py_ssize_t *length):
+        # like slicing, reads past the end are truncated rather than failing
+        cdef Py_ssize_t available = self._length - self._offset
+        cdef const unsigned char *start = self._buf + self._offset
+        self._offset += length[0]
+        if available < 0:
+            available = 0
+        if length[0] > available:
+            length[0] = available
+        return start
+
+    cdef object _getToken(self, int index):
+        token = self._primary[index] if 0 <= index < len(self._primary) else None
+        if not token:
+            index = self._readInt8()
+            token = self._secondary[index] if 0 <= index < len(self._secondary) else None
+            if not token:
+                raise ValueError("Invalid token %s" % token)
+        return token
+
+    cdef object _getTokenDouble(self, int n, int n2):
+        cdef int pos = n2 + n * 256
+        token = self._secondary[pos] if 0 <= pos < len(self._secondary) else None
+        if not token:
+            raise ValueError("Invalid token %s" % pos)
+        return token
+
+    cdef object _readPacked8(self, int n):
+        cdef int size = self._readInt8()
+        cdef Py_ssize_t length = size & 0x7F
+        cdef const unsigned char *packed = self._readArray(&length)
+        cdef char out[256]
+        cdef Py_ssize_t count = 0
+        cdef Py_ssize_t i
+        cdef int high, low
+
+        if n == 251:
+            for i in range(length):
+                out[count] = HEX_DIGITS[packed[i] >> 4]
+                out[count + 1] = HEX_DIGITS[packed[i] & 0xF]
+                count += 2
+            if size & 0x80 and count:
+                count -= 1
+        elif n == 255:
+            for i in range(length):
+                high = packed[i] >> 4
+                low = packed[i] & 0xF
+                if high > 11:
+                    raise ValueError("bad nibble %s" % high)
+                out[count] = NIBBLE_DIGITS[high]
+                count += 1
+                if low > 11:
+                    if i == length - 1:
+                        # padding of an odd number of nibbles
+                        break
+                    raise ValueError("bad nibble %s" % low)
+                out[count] = NIBBLE_DIGITS[low]
+                count += 1
+        else:
+            raise ValueError("bad packed type %s" % n)
+
+        return PyUnicode_DecodeASCII(out, count, NULL)
+
+    cdef object _readLatin1(self, Py_ssize_t length):
+        cdef const unsigned char *start = self._readArray(&length)
+        return PyUnicode_DecodeLatin1(<const char *>start, length, NULL)
+
+    cdef object _readBytes(self, Py_ssize_t length):
+        cdef const unsigned char *start = self._readArray(&length)
+        return PyBytes_FromStringAndSize(<const char *>start, length)
+
+    cdef Py_ssize_t _readListSize(self, int token) except -1:
+        if token == 0:
+            return 0
+        if token == 248:
+            return self._readInt8()
+        if token == 249:
+            return self._readInt16()
+        raise Exception("invalid list size in readListSize: token " + str(token))
+
+    cdef object _readString(self, int token):
+        if 2 < token < 236:
+            return self._getToken(token)
+
+        if token == 0:
+            return None
+
+        if 236 <= token <= 239:
+            return self._getTokenDouble(token - 236, self._readInt8())
+
+        if token == 250:
+            user = self._readString(self._readInt8())
+            server = self._readString(self._readInt8())
+            if user is not None and server is not None:
+                return user + "@" + server
+            if server is not None:
+                return server
+            raise Exception("readString couldn't reconstruct jid")
+
+        if token == 251 or token == 255:
+            return self._readPacked8(token)
+
+        if token == 252:
+            return self._readLatin1(self._readInt8())
+
+        if token == 253:
+            return self._readLatin1(self._readInt20())
+
+        if token == 254:
+            return self._readLatin1(self._readInt31())
+
+        raise Exception("readString couldn't match token " + str(token))
+
+    cdef object _nextTreeInternal(self):
+        cdef Py_ssize_t size = self._readListSize(self._readInt8())
+        cdef Py_ssize_t i
+        cdef int token = self._readInt8()
+        cdef int read2
+
+        if token == 1:
+            token = self._readInt8()
+
+        if token == 2:
+            return None
+
+        tag = self._readString(token)
+
+        if size == 0 or tag is None:
+            raise ValueError("nextTree sees 0 list or null tag")
+
+        attribs = {}
+        for i in range((size - 2 + size % 2) // 2):
+            key = self._readString(self._readInt8())
+            attribs[key] = self._readString(self._readInt8())
+
+        if size % 2 == 1:
+            return ProtocolTreeNode(tag, attribs)
+
+        read2 = self._readInt8()
+
+        nodeData = None
+        nodeChildren = None
+        if read2 == 248 or read2 == 0 or read2 == 249:
+            nodeChildren = [self._nextTreeInternal() for i in range(self._readListSize(read2))]
+        elif read2 == 252:
+            nodeData = self._readBytes(self._readInt8())
+        elif read2 == 253:
+            nodeData = self._readBytes(self._readInt20())
+        elif read2 == 254:
+            nodeData = self._readBytes(self._readInt31())
+        elif read2 == 255 or read2 == 251:
+            nodeData = self._readPacked8(read2).encode()
+        else:
+            nodeData = self._readString(read2)
+        return ProtocolTreeNode(tag, attribs, nodeChildren, nodeData)
+
+
+cdef inline int _packHex(unsigned char c):
+    if 48 <= c <= 57:
+        return c - 48
+    if 65 <= c <= 70:
+        return c - 55
+    return -1
+
+
+cdef inline int _packNibble(unsigned char c):
+    if 48 <= c <= 57:
+        return c - 48
+    if c == 45 or c == 46:
+        return c - 35
+    return -1
+
+
+cdef class WriteEncoder:
+    cdef readonly object tokenDictionary
+    cdef object _getIndex
+    cdef unsigned char *_buf
+    cdef Py_ssize_t _length
+    cdef Py_ssize_t _capacity
+
+    def __cinit__(self):
+        self._buf = NULL
+        self._length = 0
+        self._capacity = 0
+
+    def __dealloc__(self):
+        free(self._buf)
+
+    def __init__(self, tokenDictionary):
+        self.tokenDictionary = tokenDictionary
+        self._getIndex = tokenDictionary.getIndex
+
+    def protocolTreeNodeToBytes(self, node):
+        self._length = 0
+        try:
+            self._append(0) # flags
+            self._writeInternal(node)
+            return PyByteArray_FromStringAndSize(<char *>self._buf, self._length)
+        finally:
+            if self._capacity > MAX_RETAINED_BUFFER:
+                free(self._buf)
+                self._buf = NULL
+                self._capacity = 0
+
+    cdef int _reserve(self, Py_ssize_t size) except -1:
+        cdef Py_ssize_t capacity
+        cdef unsigned char *buf
+        if self._length + size <= self._capacity:
+            return 0
+        capacity = max(self._capacity * 2, self._length + size, 256)
+        buf = <unsigned char *>realloc(self._buf, capacity)
+        if buf == NULL:
+            raise MemoryError()
+        self._buf = buf
+        self._capacity = capacity
+        return 0
+
+    cdef inline int _append(self, int v) except -1:
+        if self._length == self._capacity:
+            self._reserve(1)
+        self._buf[self._length] = v & 0xFF
+        self._length += 1
+        return 0
+
+    cdef int _extend(self, const unsigned char *data, Py_ssize_t size) except -1:
+        self._reserve(size)
+        if size:
+            memcpy(self._buf + self._length, data, size)
+        self._length += size
+        return 0
+
+    cdef int _writeInt16(self, long v) except -1:
+        self._append(v >> 8)
+        self._append(v)
+        return 0
+
+    cdef int _writeInt20(self, long v) except -1:
+        self._append((v >> 16) & 0xF)
+        self._append(v >> 8)
+        self._append(v)
+        return 0
+
+    cdef int _writeInt31(self, long v) except -1:
+        self._append((v >> 24) & 0x7F)
+        self._append(v >> 16)
+        self._append(v >> 8)
+        self._append(v)
+        return 0
+
+    cdef int _writeListStart(self, Py_ssize_t i) except -1:
+        if i == 0:
+            self._append(0)
+        elif i < 256:
+            self._append(248)
+            self._append(i)
+        else:
+            self._append(249)
+            self._writeInt16(i)
+        return 0
+
+    cdef int _writeToken(self, token) except -1:
+        if token <= 255 and token >= 0:
+            self._append(token)
+        else:
+            raise ValueError("Invalid token: %s" % token)
+        return 0
+
+    cdef int _writeInternal(self, node) except -1:
+        attributes = node.attributes
+        data = node.data
+        hasChildren = node.hasChildren()
+
+        self._writeListStart(
+            1 +
+            (0 if attributes is None else len(attributes) * 2) +
+            (1 if hasChildren else 0) +
+            (0 if data is None else 1)
+        )
+
+        self._writeString(node.tag, False)
+        if attributes is not None:
+            for key, value in attributes.items():
+                self._writeString(key, False)
+                self._writeString(value, True)
+
+        if data is not None:
+            self._writeBytes(data, False)
+
+        if hasChildren:
+            self._writeListStart(len(node.children))
+            for c in node.children:
+                self._writeInternal(c)
+        return 0
+
+    cdef int _writeString(self, tag, bint packed) except -1:
+        tok = self._getIndex(tag)
+        if tok:
+            index, secondary = tok
+            if not secondary:
+                self._writeToken(index)
+            else:
+                quotient = index // 256
+                if not 0 <= quotient <= 3:
+                    raise ValueError("Double byte dictionary token out of range")
+                self._writeToken(236 + quotient)
+                self._writeToken(index % 256)
+        else:
+            at = b'@' if type(tag) == bytes else '@'
+            try:
+                atIndex = tag.index(at)
+
+                if atIndex < 1:
+                    raise ValueError("atIndex < 1")
+                else:
+                    self._writeJid(tag[0:atIndex], tag[atIndex + 1:])
+            except ValueError:
+                self._writeBytes(self._encodeString(tag), packed)
+        return 0
+
+    cdef object _encodeString(self, string):
+        if type(string) == bytes:
+            return string
+        return string.encode('latin-1')
+
+    cdef int _writeJid(self, user, server) except -1:
+        self._append(250)
+        if user is not None:
+            self._writeString(user, True)
+        else:
+            self._writeToken(0)
+        self._writeString(server, False)
+        return 0
+
+    cdef int _writeBytes(self, bytes_, bint packed) except -1:
+        cdef const unsigned char[::1] view
+        cdef const unsigned char *data = NULL
+        cdef Py_ssize_t size
+
+        if type(bytes_) is not bytes and type(bytes_) is not bytearray:
+            bytes_ = bytearray(bytes_) if type(bytes_) in (list, tuple) else self._encodeString(bytes_)
+
+        view = bytes_
+        size = view.shape[0]
+        if size:
+            data = &view[0]
+
+        if size >= 0x100000:
+            self._append(254)
+            self._writeInt31(size)
+        elif size >= 0x100:
+            self._append(253)
+            self._writeInt20(size)
+        elif packed and size < 128 and (self._tryPackAndWrite(255, data, size) or
+                                        self._tryPackAndWrite(251, data, size)):
+            return 0
+        else:
+            self._append(252)
+            self._append(size)
+
+        self._extend(data, size)
+        return 0
+
+    cdef bint _tryPackAndWrite(self, int v, const unsigned char *data, Py_ssize_t size) except -1:
+        cdef Py_ssize_t i
+        cdef int digit
+        cdef unsigned char packed = 0
+
+        if size == 0 or size >= 128:
+            return False
+
+        for i in range(size):
+            digit = _packHex(data[i]) if v == 251 else _packNibble(data[i])
+            if digit == -1:
+                return False
+
+        self._append(v)
+        self._append((size % 2) << 7 | (size + 1) // 2)
+        for i in range(size):
+            digit = _packHex(data[i]) if v == 251 else _packNibble(data[i])
+            if i % 2 == 0:
+                packed = digit << 4
+            else:
+                self._append(packed | digit)
+        if size % 2 == 1:
+            self._append(packed | 0xF)
+        return True
@@ -1,10 +1,29 @@
+from .packing import HEX_ALPHABET, NIBBLE_ALPHABET, PACK_NIBBLE_TABLE
+import binascii
+import struct
+
+
 class WriteEncoder:
+    """
+    Encodes a ProtocolTreeNode into its binary stanza representation.
+
+    Output is written straight into a growable bytearray, binary payloads are appended with a single extend.
+    """
+
+    _STRUCT_INT16 = struct.Struct('>H')
+    _STRUCT_INT32 = struct.Struct('>I')
 
     def __init__(self, tokenDictionary):
         self.tokenDictionary = tokenDictionary
 
     def protocolTreeNodeToBytes(self, node):
-        outBytes = [0] # flags
+        """
+        :param node:
+        :type node: ProtocolTreeNode
+        :return:
+        :rtype: bytearray
+        """
+        outBytes = bytearray(1) # flags
         self.writeInternal(node, outBytes)
 
         return outBytes
@@ -20,36 +39,31 @@ class WriteEncoder:
 
 
         self.writeString(node.tag, data)
-        self.writeAttributes(node.attributes, data);
+        self.writeAttributes(node.attributes, data)
 
 
         if node.data is not None:
             self.writeBytes(node.data, data)
 
         if node.hasChildren():
-            self.writeListStart(len(node.children), data);
+            self.writeListStart(len(node.children), data)
             for c in node.children:
-                self.writeInternal(c, data);
+                self.writeInternal(c, data)
 
 
     def writeAttributes(self, attributes, data):
         if attributes is not None:
             for key, value in attributes.items():
-                self.writeString(key, data);
-                self.writeString(value, data, True);
+                self.writeString(key, data)
+                self.writeString(value, data, True)
 
 
     def writeBytes(self, bytes_, data, packed = False):
-        bytes__ = []
-        for b in bytes_:
-            if type(b) is int:
-                bytes__.append(b)
-            else:
-                bytes__.append(ord(b))
-
+        if type(bytes_) not in (bytes, bytearray):
+            bytes_ = bytearray(bytes_) if type(bytes_) in (list, tuple) else self.encodeString(bytes_)
 
-        size = len(bytes__)
-        toWrite = bytes__
+        size = len(bytes_)
+        toWrite = bytes_
         if size >= 0x100000:
             data.append(254)
             self.writeInt31(size, data)
@@ -60,9 +74,9 @@ class WriteEncoder:
             r = None
             if packed:
                 if size < 128:
-                    r = self.tryPackAndWriteHeader(255, bytes__, data)
+                    r = self.tryPackAndWriteHeader(255, bytes_, data)
                     if r is None:
-                        r = self.tryPackAndWriteHeader(251, bytes__, data)
+                        r = self.tryPackAndWriteHeader(251, bytes_, data)
 
             if r is None:
                 data.append(252)
@@ -77,24 +91,16 @@ class WriteEncoder:
 
 
     def writeInt16(self, v, data):
-        data.append((v & 0xFF00) >> 8);
-        data.append((v & 0xFF) >> 0);
+        data.extend(self._STRUCT_INT16.pack(v & 0xFFFF))
 
     def writeInt20(self, v, data):
-        data.append((0xF0000 & v) >> 16)
-        data.append((0xFF00 & v) >> 8)
-        data.append((v & 0xFF) >> 0)
+        data.extend(self._STRUCT_INT32.pack(v & 0xFFFFF)[1:])
 
     def writeInt24(self, v, data):
-        data.append((v & 0xFF0000) >> 16)
-        data.append((v & 0xFF00) >> 8)
-        data.append((v & 0xFF) >> 0)
+        data.extend(self._STRUCT_INT32.pack(v & 0xFFFFFF)[1:])
 
     def writeInt31(self, v, data):
-        data.append((0x7F000000 & v) >> 24)
-        data.append((0xFF0000 & v) >> 16)
-        data.append((0xFF00 & v) >> 8)
-        data.append((v & 0xFF) >> 0)
+        data.extend(self._STRUCT_INT32.pack(v & 0x7FFFFFFF))
 
     def writeListStart(self, i, data):
         if i == 0:
@@ -149,15 +155,9 @@ class WriteEncoder:
                 self.writeBytes(self.encodeString(tag), data, packed)
 
     def encodeString(self, string):
-        res = []
-
         if type(string) == bytes:
-            for char in string:
-                res.append(char)
-        else:
-            for char in string:
-                res.append(ord(char))
-        return res;
+            return string
+        return string.encode('latin-1')
 
     def writeJid(self, user, server, data):
         data.append(250)
@@ -170,47 +170,23 @@ class WriteEncoder:
 
     def tryPackAndWriteHeader(self, v, headerData, data):
         size = len(headerData)
-        if size >= 128:
+        if size == 0 or size >= 128:
             return None
 
-        arr = [0] * int((size + 1) / 2)
-        for i in range(0, size):
-            packByte = self.packByte(v, headerData[i])
-            if packByte == -1:
-                arr = []
-                break
-            n2 = int(i / 2)
-            arr[n2] |= (packByte << 4 * (1 - i % 2))
-        if len(arr) > 0:
-            if size % 2 == 1:
-                arr[-1] |= 15 #0xF
-            data.append(v)
-            self.writeInt8(size %2 << 7 | len(arr), data)
-            return arr
-
-        return None
-
-
-
-    def packByte(self, v, n2):
         if v == 251:
-            return self.packHex(n2)
-        if v == 255:
-            return self.packNibble(n2)
-        return -1
-
-    def packHex(self, n):
-        if n in range(48, 58):
-            return n - 48
-        if n in range(65, 71):
-            return 10 + (n - 65)
-        return -1
-
-    def packNibble(self, n):
-        if n in (45, 46):
-            return 10 + (n - 45)
-
-        if n in range(48, 58):
-            return n - 48
-
-        return -1
+            if headerData.translate(None, HEX_ALPHABET):
+                return None
+            digits = bytes(headerData)
+        elif v == 255:
+            if headerData.translate(None, NIBBLE_ALPHABET):
+                return None
+            digits = headerData.translate(PACK_NIBBLE_TABLE)
+        else:
+            return None
+
+        if size % 2 == 1:
+            digits += b"f"
+        arr = binascii.unhexlify(digits)
+        data.append(v)
+        self.writeInt8(size % 2 << 7 | len(arr), data)
+        return arr
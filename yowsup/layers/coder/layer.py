@@ -1,7 +1,10 @@
 from yowsup.layers import YowLayer
-from .encoder import WriteEncoder
-from .decoder import ReadDecoder
 from .tokendictionary import TokenDictionary
+try:
+    from ._coder import ReadDecoder, WriteEncoder
+except ImportError:
+    from .encoder import WriteEncoder
+    from .decoder import ReadDecoder
 
 
 class YowCoderLayer(YowLayer):
@@ -16,12 +19,14 @@ class YowCoderLayer(YowLayer):
         self.write(self.writer.protocolTreeNodeToBytes(data))
 
     def receive(self, data):
-        node = self.reader.getProtocolTreeNode(bytearray(data))
+        node = self.reader.getProtocolTreeNode(data)
         if node:
             self.toUpper(node)
 
     def write(self, i):
-        if(type(i) in(list, tuple)):
+        if type(i) is bytearray:
+            self.toLower(i)
+        elif(type(i) in(list, tuple)):
             self.toLower(bytearray(i))
         else:
             self.toLower(bytearray([i]))
@@ -0,0 +1,25 @@
+HEX_ALPHABET = b"0123456789ABCDEF"
+NIBBLE_ALPHABET = b"0123456789-."
+
+
+def _translation_table(source, target):
+    """
+    :param source: characters to be replaced
+    :type source: bytes
+    :param target: replacement for each character in source
+    :type target: bytes
+    :return: a 256-entry translation table for bytes.translate
+    :rtype: bytes
+    """
+    table = bytearray(range(0, 256))
+    for char, replacement in zip(bytearray(source), bytearray(target)):
+        table[char] = replacement
+    return bytes(table)
+
+
+# A packed byte holds two digits, one per nibble. Hex packing stores the digits 0-F as-is, nibble packing stores
+# 0-9, '-' as 10 and '.' as 11, with 15 padding an odd length. Both can thus be (un)packed with (un)hexlify and a
+# translation between the packed alphabet and lowercase hex digits.
+UNPACK_HEX_TABLE = _translation_table(b"abcdef", b"ABCDEF")
+UNPACK_NIBBLE_TABLE = _translation_table(b"ab", b"-.")
+PACK_NIBBLE_TABLE = _translation_table(b"-.", b"ab")
@@ -0,0 +1,74 @@
+import unittest
+from yowsup.structs import ProtocolTreeNode
+from yowsup.layers.coder import encoder, decoder
+from yowsup.layers.coder.tokendictionary import TokenDictionary
+try:
+    from yowsup.layers.coder import _coder
+except ImportError:
+    _coder = None
+
+
+NODES = (
+    ProtocolTreeNode("message", {"from": "abc", "to": "xyz"}, [ProtocolTreeNode("media", {"width": "123"}, data=b"123456")]),
+    ProtocolTreeNode("iq", {"id": "1", "type": "get", "xmlns": "w:g2", "to": "g.us"}, [ProtocolTreeNode("participating")]),
+    ProtocolTreeNode("iq", {"from": "g.us", "type": "result"}, [
+        ProtocolTreeNode("group", {"id": "491234567890-1557226221", "subject": "A group"}, [
+            ProtocolTreeNode("participant", {"jid": "49%010d@s.whatsapp.net" % i}) for i in range(0, 300)
+        ])
+    ]),
+    ProtocolTreeNode("receipt", {"id": "3EB0C127D7BACC83D6A1", "t": "1557226221", "type": "read"}),
+    ProtocolTreeNode("message", {"id": "12-3.4", "type": "ABC", "notify": "J\xf6rg", "participant": "1.2-3@c.us"}),
+    ProtocolTreeNode("ack", {"class": "receipt", "to": "@s.whatsapp.net"}),
+    ProtocolTreeNode("enc", {"v": "2", "type": "skmsg"}, data=b""),
+    ProtocolTreeNode("enc", {"v": "2", "type": "pkmsg"}, data=bytes(bytearray(range(0, 256)))),
+    ProtocolTreeNode("enc", {"v": "2", "type": "msg"}, data=bytes(bytearray(range(0, 256))) * 5000),
+)
+
+
+class CoderTest(object):
+    """
+    Round trip tests which every ReadDecoder/WriteEncoder implementation must pass,
+    byte for byte identical to the reference python implementation.
+    """
+    ReadDecoder = None
+    WriteEncoder = None
+
+    def setUp(self):
+        tokenDictionary = TokenDictionary()
+        self.encoder = self.WriteEncoder(tokenDictionary)
+        self.decoder = self.ReadDecoder(tokenDictionary)
+        self.referenceEncoder = encoder.WriteEncoder(tokenDictionary)
+        self.referenceDecoder = decoder.ReadDecoder(tokenDictionary)
+
+    def test_encode(self):
+        for node in NODES:
+            self.assertEqual(self.encoder.protocolTreeNodeToBytes(node),
+                             self.referenceEncoder.protocolTreeNodeToBytes(node))
+
+    def test_roundtrip(self):
+        for node in NODES:
+            data = self.encoder.protocolTreeNodeToBytes(node)
+            self.assertEqual(self.decoder.getProtocolTreeNode(data), node)
+            self.assertEqual(self.decoder.getProtocolTreeNode(bytes(data)), node)
+            self.assertEqual(self.decoder.getProtocolTreeNode(list(data)), node)
+
+    def test_decode_stream_end(self):
+        self.assertIsNone(self.decoder.getProtocolTreeNode(bytearray([0, 248, 1, 2])))
+
+    def test_decode_truncated(self):
+        data = self.encoder.protocolTreeNodeToBytes(NODES[0])
+        self.assertRaises(IndexError, self.decoder.getProtocolTreeNode, data[:-10])
+
+    def test_decode_bad_nibble(self):
+        self.assertRaises(ValueError, self.decoder.getProtocolTreeNode, bytearray([0, 248, 3, 9, 4, 255, 2, 0xC1, 0x23]))
+
+
+class PythonCoderTest(CoderTest, unittest.TestCase):
+    ReadDecoder = decoder.ReadDecoder
+    WriteEncoder = encoder.WriteEncoder
+
+
+@unittest.skipIf(_coder is None, "compiled coder is not built")
+class CompiledCoderTest(CoderTest, unittest.TestCase):
+    ReadDecoder = getattr(_coder, "ReadDecoder", None)
+    WriteEncoder = getattr(_coder, "WriteEncoder", None)
@@ -13,3 +13,20 @@ class DecoderTest(unittest.TestCase):
         node = self.decoder.getProtocolTreeNode(data)
         targetNode = ProtocolTreeNode("message", {"from": "abc", "to":"xyz"}, [ProtocolTreeNode("media", {"width" : "123"}, data=b"123456")])
         self.assertEqual(node, targetNode)
+
+    def test_decode_does_not_consume_input(self):
+        data = bytes(bytearray([0, 248, 6, 9, 11, 252, 3, 120, 121, 122, 5, 252, 3, 97, 98, 99, 248, 1, 248, 4, 50, 238,
+                                86, 255, 130, 18, 63, 252, 6, 49, 50, 51, 52, 53, 54]))
+        self.assertEqual(self.decoder.getProtocolTreeNode(data), self.decoder.getProtocolTreeNode(data))
+
+    def test_decode_int20_data(self):
+        payload = bytes(bytearray(range(0, 256))) * 2
+        data = bytearray([0, 248, 2, 14, 253, 0, 2, 0]) + payload
+        node = self.decoder.getProtocolTreeNode(data)
+        self.assertEqual(node, ProtocolTreeNode("enc", data=payload))
+
+    def test_decode_packed(self):
+        # nibble packed "12-3.4" and odd-length hex packed "ABC"
+        data = bytearray([0, 248, 5, 9, 4, 255, 3, 18, 163, 180, 3, 251, 130, 171, 207])
+        node = self.decoder.getProtocolTreeNode(data)
+        self.assertEqual(node, ProtocolTreeNode("message", {"id": "12-3.4", "type": "ABC"}))
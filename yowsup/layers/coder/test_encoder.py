@@ -13,10 +13,21 @@ class EncoderTest(unittest.TestCase):
         result = self.encoder.protocolTreeNodeToBytes(node)
 
         self.assertTrue(result in (
-            [0, 248, 6, 9, 11, 252, 3, 120, 121, 122, 5, 252, 3, 97, 98, 99, 248, 1, 248, 4, 50, 238, 86, 255, 130, 18, 63,
-             252, 6, 49, 50, 51, 52, 53, 54],
-            [0, 248, 6, 9, 5, 252, 3, 97, 98, 99, 11, 252, 3, 120, 121, 122, 248, 1, 248, 4, 50, 238, 86, 255, 130, 18, 63,
-             252, 6, 49, 50, 51, 52, 53, 54]
+            bytearray([0, 248, 6, 9, 11, 252, 3, 120, 121, 122, 5, 252, 3, 97, 98, 99, 248, 1, 248, 4, 50, 238, 86, 255, 130, 18, 63,
+             252, 6, 49, 50, 51, 52, 53, 54]),
+            bytearray([0, 248, 6, 9, 5, 252, 3, 97, 98, 99, 11, 252, 3, 120, 121, 122, 248, 1, 248, 4, 50, 238, 86, 255, 130, 18, 63,
+             252, 6, 49, 50, 51, 52, 53, 54])
             )
         )
 
+    def test_encode_large_data(self):
+        payload = bytes(bytearray(range(0, 256))) * 400
+        node = ProtocolTreeNode("enc", data=payload)
+        result = self.encoder.protocolTreeNodeToBytes(node)
+        self.assertEqual(result, bytearray([0, 248, 2, 14, 253, 1, 144, 0]) + payload)
+
+    def test_encode_packed(self):
+        node = ProtocolTreeNode("message", {"id": "12-3.4"})
+        self.assertEqual(self.encoder.protocolTreeNodeToBytes(node), bytearray([0, 248, 3, 9, 4, 255, 3, 18, 163, 180]))
+        node = ProtocolTreeNode("message", {"id": "ABC"})
+        self.assertEqual(self.encoder.protocolTreeNodeToBytes(node), bytearray([0, 248, 3, 9, 4, 251, 130, 171, 207]))
@@ -17,4 +17,13 @@ class TokenDictionaryTest(unittest.TestCase):
         self.assertEqual(self.tokenDictionary.getToken(11, True), "reject")
 
     def test_getSecondaryIndex(self):
-        self.assertEqual(self.tokenDictionary.getIndex("reject"), (11, True))
\ No newline at end of file
+        self.assertEqual(self.tokenDictionary.getIndex("reject"), (11, True))
+
+    def test_getIndexUnknown(self):
+        self.assertIsNone(self.tokenDictionary.getIndex("not-a-token"))
+
+    def test_getIndexAll(self):
+        for index, token in enumerate(self.tokenDictionary.dictionary):
+            self.assertEqual(self.tokenDictionary.getIndex(token), (index, False))
+        for index, token in enumerate(self.tokenDictionary.secondaryDictionary):
+            self.assertEqual(self.tokenDictionary.getIndex(token), (index, True))
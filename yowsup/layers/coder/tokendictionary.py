@@ -1,7 +1,22 @@
+def _build_index(tokens):
+    """
+    Maps each token to the index of its first occurrence in tokens
+    :param tokens:
+    :type tokens: list[str]
+    :return:
+    :rtype: dict
+    """
+    return dict((token, index) for index, token in reversed(list(enumerate(tokens))))
+
+
 class TokenDictionary:
     FLAG_SEGMENTED = 0x1
     FLAG_DEFLATE = 0x2
 
+    # reverse lookup tables, built by the first instance and shared by all
+    _index = None
+    _secondaryIndex = None
+
     def __init__(self):
         self.dictionary = [
             '',
@@ -1269,6 +1284,9 @@ class TokenDictionary:
             'Europe/Copenhagen'
         ]
 
+        if TokenDictionary._index is None:
+            TokenDictionary._index = _build_index(self.dictionary)
+            TokenDictionary._secondaryIndex = _build_index(self.secondaryDictionary)
 
     def getToken(self, index, secondary = False):
         targetDict = self.dictionary
@@ -1283,9 +1301,12 @@ class TokenDictionary:
         return targetDict[index]
 
     def getIndex(self, token):
-        if token in self.dictionary:
-            return (self.dictionary.index(token), False)
-        elif token in self.secondaryDictionary:
-            return (self.secondaryDictionary.index(token), True)
+        index = self._index.get(token)
+        if index is not None:
+            return (index, False)
+
+        index = self._secondaryIndex.get(token)
+        if index is not None:
+            return (index, True)
 
         return None
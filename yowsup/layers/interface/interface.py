@@ -3,11 +3,14 @@ from yowsup.layers.protocol_iq.protocolentities import IqProtocolEntity
 from yowsup.layers.auth import YowAuthenticationProtocolLayer
 from yowsup.layers.protocol_media.protocolentities.iq_requestupload import RequestUploadIqProtocolEntity
 from yowsup.layers.protocol_media.mediauploader import MediaUploader
+from yowsup.layers.protocol_media.uploadmanager import MediaUploadManager
+from yowsup.layers.protocol_media.mediacache import MediaUploadCache
 from yowsup.layers.network.layer import YowNetworkLayer
 from yowsup.layers.auth.protocolentities import StreamErrorProtocolEntity
 from yowsup.layers import EventCallback
 import inspect
 import logging
+import os
 logger = logging.getLogger(__name__)
 
 
@@ -23,10 +26,29 @@ class ProtocolEntityCallback(object):
 class YowInterfaceLayer(YowLayer):
 
     PROP_RECONNECT_ON_STREAM_ERR = "org.openwhatsapp.yowsup.prop.interface.reconnect_on_stream_error"
+    # a MediaUploadManager to share between stacks, each layer creates its own otherwise
+    PROP_UPLOAD_MANAGER = "org.openwhatsapp.yowsup.prop.interface.upload_manager"
+    PROP_UPLOAD_WORKERS = "org.openwhatsapp.yowsup.prop.interface.upload_workers"
+    PROP_UPLOAD_MAX_PENDING = "org.openwhatsapp.yowsup.prop.interface.upload_max_pending"
+    # seconds _sendMediaMessage waits for a free upload slot before failing, it fails right away by default. Only
+    # set this when sending media from outside the stack's thread, slots are given back on that thread
+    PROP_UPLOAD_QUEUE_TIMEOUT = "org.openwhatsapp.yowsup.prop.interface.upload_queue_timeout"
+    # a MediaUploadCache to share between stacks, each layer creates its own otherwise
+    PROP_MEDIA_CACHE = "org.openwhatsapp.yowsup.prop.interface.media_cache"
+    # sqlite database to keep the media cache in across runs, it's kept in memory if not set
+    PROP_MEDIA_CACHE_PATH = "org.openwhatsapp.yowsup.prop.interface.media_cache_path"
+    PROP_MEDIA_CACHE_MAX_ENTRIES = "org.openwhatsapp.yowsup.prop.interface.media_cache_max_entries"
+    PROP_MEDIA_CACHE_MAX_AGE = "org.openwhatsapp.yowsup.prop.interface.media_cache_max_age"
+    # attributes of a media message builder which are kept in the media cache and restored on it for a cached upload
+    MEDIA_CACHE_BUILDER_ATTRIBUTES = ("media_key", "file_enc_sha256", "file_length")
 
     def __init__(self):
         super(YowInterfaceLayer, self).__init__()
         self.reconnect = False
+        self._uploadManager = None
+        # error callbacks of request upload iqs holding an upload slot, by iq id
+        self._uploadSlotIqs = {}
+        self._mediaCache = None
         self.entity_callbacks = {}
         self.iqRegistry = {}
         # self.receiptsRegistry = {}
@@ -102,31 +124,99 @@ class YowInterfaceLayer(YowLayer):
 
     @EventCallback(YowNetworkLayer.EVENT_STATE_DISCONNECTED)
     def onDisconnected(self, yowLayerEvent):
+        # request upload iqs won't be answered anymore
+        uploadSlotIqs, self._uploadSlotIqs = self._uploadSlotIqs, {}
+        for iqId, error in uploadSlotIqs.items():
+            self.iqRegistry.pop(iqId, None)
+            self.getUploadManager().release()
+            if error:
+                error(0, "disconnected", 0)
         if self.reconnect:
             self.reconnect = False
             self.connect()
 
-    def _sendMediaMessage(self, builder, success, error=None, progress=None):
+    def getUploadManager(self):
+        """
+        :rtype: MediaUploadManager
+        """
+        if self._uploadManager is None:
+            self._uploadManager = self.getProp(self.__class__.PROP_UPLOAD_MANAGER) or MediaUploadManager(
+                self.getProp(self.__class__.PROP_UPLOAD_WORKERS),
+                self.getProp(self.__class__.PROP_UPLOAD_MAX_PENDING)
+            )
+        return self._uploadManager
+
+    def getMediaCache(self):
+        """
+        :rtype: MediaUploadCache
+        """
+        if self._mediaCache is None:
+            # not "or", an empty cache is falsy
+            self._mediaCache = self.getProp(self.__class__.PROP_MEDIA_CACHE)
+            if self._mediaCache is None:
+                self._mediaCache = MediaUploadCache(
+                    self.getProp(self.__class__.PROP_MEDIA_CACHE_PATH),
+                    self.getProp(self.__class__.PROP_MEDIA_CACHE_MAX_ENTRIES),
+                    self.getProp(self.__class__.PROP_MEDIA_CACHE_MAX_AGE)
+                )
+        return self._mediaCache
+
+    def _sendMediaMessage(self, builder, success, error=None, progress=None,
+                          priority=MediaUploadManager.PRIORITY_NORMAL):
+        """
+        Media found in the media cache is not hashed or uploaded again: the cached MEDIA_CACHE_BUILDER_ATTRIBUTES the
+        builder has are set on it, and the request upload iq only confirms the server still has the media. When it
+        doesn't, the cache entry is dropped and the media uploaded.
+        error is called with code 0 when the upload manager already has PROP_UPLOAD_MAX_PENDING uploads pending and no
+        slot frees up within PROP_UPLOAD_QUEUE_TIMEOUT, or when the connection is lost before the upload was granted
+        :param priority: uploads with a lower value start first
+        :type priority: int
+        """
         # axolotlIface = self.getLayerInterface(YowAxolotlLayer)
         # if axolotlIface:
         #     axolotlIface.encryptMedia(builder)
 
-        iq = RequestUploadIqProtocolEntity(
-            builder.mediaType, filePath=builder.getFilepath(), encrypted=builder.isEncrypted())
+        mediaCache = self.getMediaCache()
+        filePath = builder.getFilepath()
+        fileHash = mediaCache.get_file_hash(filePath)
+        cached = mediaCache.get(fileHash, builder.mediaType)
+        if cached is not None:
+            for attribute in self.__class__.MEDIA_CACHE_BUILDER_ATTRIBUTES:
+                if hasattr(builder, attribute) and getattr(cached, attribute) is not None:
+                    setattr(builder, attribute, getattr(cached, attribute))
+
+        uploadManager = self.getUploadManager()
+        timeout = self.getProp(self.__class__.PROP_UPLOAD_QUEUE_TIMEOUT)
+        if not uploadManager.reserve(blocking=bool(timeout), timeout=timeout or None):
+            logger.warning("No upload slot available for %s" % filePath)
+            if error:
+                error(0, "upload queue full", 0)
+            return
+
+        iq = RequestUploadIqProtocolEntity(builder.mediaType, b64Hash=fileHash, size=os.path.getsize(filePath))
 
         def successFn(resultEntity, requestUploadEntity): return self.__onRequestUploadSuccess(
-            resultEntity, requestUploadEntity, builder, success, error, progress)
+            resultEntity, requestUploadEntity, builder, success, error, progress, priority, cached is not None)
 
         def errorFn(errorEntity, requestUploadEntity): return self.__onRequestUploadError(
-            errorEntity, requestUploadEntity, error)
+            errorEntity, requestUploadEntity, builder, error)
+        self._uploadSlotIqs[iq.getId()] = error
         self._sendIq(iq, successFn, errorFn)
 
-    def __onRequestUploadSuccess(self, resultRequestUploadIqProtocolEntity, requestUploadEntity, builder, success, error=None, progress=None):
+    def __onRequestUploadSuccess(self, resultRequestUploadIqProtocolEntity, requestUploadEntity, builder, success, error=None, progress=None,
+                                 priority=MediaUploadManager.PRIORITY_NORMAL, cached=False):
+        self._uploadSlotIqs.pop(requestUploadEntity.getId(), None)
+        if cached and not resultRequestUploadIqProtocolEntity.isDuplicate():
+            logger.info("Server no longer has cached media %s, uploading it again" % requestUploadEntity.b64Hash)
+            self.getMediaCache().remove(requestUploadEntity.b64Hash, requestUploadEntity.mediaType)
         if(resultRequestUploadIqProtocolEntity.isDuplicate()):
+            self.getUploadManager().release()
+            self.__cacheMediaUpload(builder, requestUploadEntity, resultRequestUploadIqProtocolEntity.getUrl(),
+                                    resultRequestUploadIqProtocolEntity.getIp())
             return success(builder.build(resultRequestUploadIqProtocolEntity.getUrl(), resultRequestUploadIqProtocolEntity.getIp()))
         else:
             def successFn(path, jid, url): return self.__onMediaUploadSuccess(
-                builder, url, resultRequestUploadIqProtocolEntity.getIp(), success)
+                builder, requestUploadEntity, url, resultRequestUploadIqProtocolEntity.getIp(), success)
 
             def errorFn(path, jid, errorText): return self.__onMediaUploadError(
                 builder, errorText, error)
@@ -134,14 +224,23 @@ class YowInterfaceLayer(YowLayer):
             mediaUploader = MediaUploader(builder.jid, self.getOwnJid(), builder.getFilepath(),
                                           resultRequestUploadIqProtocolEntity.getUrl(),
                                           resultRequestUploadIqProtocolEntity.getResumeOffset(),
-                                          successFn, errorFn, progress, asynchronous=True)
-            mediaUploader.start()
+                                          successFn, errorFn, progress)
+            self.getUploadManager().submit(mediaUploader, priority)
 
     def __onRequestUploadError(self, errorEntity, requestUploadEntity, builder, error=None):
+        self._uploadSlotIqs.pop(requestUploadEntity.getId(), None)
+        self.getUploadManager().release()
         if error:
             return error(errorEntity.code, errorEntity.text, errorEntity.backoff)
 
-    def __onMediaUploadSuccess(self, builder, url, ip, successClbk):
+    def __cacheMediaUpload(self, builder, requestUploadEntity, url, ip):
+        self.getMediaCache().put(
+            requestUploadEntity.b64Hash, requestUploadEntity.mediaType, url, ip,
+            *[getattr(builder, attribute, None) for attribute in self.__class__.MEDIA_CACHE_BUILDER_ATTRIBUTES]
+        )
+
+    def __onMediaUploadSuccess(self, builder, requestUploadEntity, url, ip, successClbk):
+        self.__cacheMediaUpload(builder, requestUploadEntity, url, ip)
         messageNode = builder.build(url, ip)
         return successClbk(messageNode)
 
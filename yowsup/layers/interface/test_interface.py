@@ -0,0 +1,99 @@
+from yowsup.layers.interface.interface import YowInterfaceLayer
+from yowsup.layers.protocol_iq.protocolentities import ErrorIqProtocolEntity
+from yowsup.layers.protocol_media.mediacache import MediaUploadCache
+from yowsup.layers.protocol_media.protocolentities import ResultRequestUploadIqProtocolEntity
+from yowsup.layers.protocol_media.uploadmanager import MediaUploadManager
+from yowsup.layers import YowLayerEvent
+from yowsup.layers.network.layer import YowNetworkLayer
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class StackStub(object):
+    def __init__(self, props):
+        self.props = props
+
+    def getProp(self, key, default=None):
+        return self.props.get(key, default)
+
+
+class MediaBuilderStub(object):
+    mediaType = "image"
+    jid = "123@s.whatsapp.net"
+
+    def __init__(self, path):
+        self.path = path
+
+    def getFilepath(self):
+        return self.path
+
+    def build(self, url, ip):
+        return url
+
+
+class YowInterfaceLayerMediaTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "image.jpg")
+        with open(self.path, "wb") as f:
+            f.write(os.urandom(1024))
+        self.manager = MediaUploadManager(max_pending=1)
+        self.cache = MediaUploadCache()
+        self.layer = YowInterfaceLayer()
+        self.layer.setStack(StackStub({
+            YowInterfaceLayer.PROP_UPLOAD_MANAGER: self.manager,
+            YowInterfaceLayer.PROP_MEDIA_CACHE: self.cache
+        }))
+        self.sent = []
+        self.layer.toLower = self.sent.append
+        self.layer.getOwnJid = lambda: "1@s.whatsapp.net"
+        self.results = []
+        self.errors = []
+
+    def tearDown(self):
+        self.manager.shutdown()
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def send(self):
+        self.layer._sendMediaMessage(MediaBuilderStub(self.path), self.results.append,
+                                     lambda code, text, backoff: self.errors.append((code, text)))
+
+    def test_queue_full_fails_without_blocking(self):
+        self.send()
+        self.send()
+        self.assertEqual(1, len(self.sent))
+        self.assertEqual([(0, "upload queue full")], self.errors)
+
+    def test_duplicate_releases_slot_and_is_cached(self):
+        self.send()
+        self.layer.receive(ResultRequestUploadIqProtocolEntity(self.sent[0].getId(), "https://mmg/1", duplicate=True))
+        self.assertEqual(["https://mmg/1"], self.results)
+        self.assertIsNotNone(self.cache.get(self.sent[0].b64Hash, "image"))
+        self.assertTrue(self.manager.reserve(blocking=False))
+
+    def test_cached_media_dropped_when_server_lost_it(self):
+        self.submitted = []
+        self.manager.submit = lambda uploader, priority: self.submitted.append(uploader)
+        self.cache.put(self.cache.get_file_hash(self.path), "image", "https://mmg/1")
+        self.send()
+        self.assertEqual(1, self.cache.get_metrics()["hits"])
+        self.layer.receive(ResultRequestUploadIqProtocolEntity(self.sent[0].getId(), "https://mmg/2"))
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(1, len(self.submitted))
+        self.assertEqual([], self.results)
+
+    def test_error_releases_slot(self):
+        self.send()
+        self.layer.receive(ErrorIqProtocolEntity(self.sent[0].getId(), "s.whatsapp.net", "406", "not-acceptable"))
+        self.assertEqual([("406", "not-acceptable")], self.errors)
+        self.assertTrue(self.manager.reserve(blocking=False))
+
+    def test_disconnect_releases_slot(self):
+        self.send()
+        self.layer.onDisconnected(YowLayerEvent(YowNetworkLayer.EVENT_STATE_DISCONNECTED))
+        self.assertEqual([(0, "disconnected")], self.errors)
+        self.assertEqual({}, self.layer.iqRegistry)
+        self.assertTrue(self.manager.reserve(blocking=False))
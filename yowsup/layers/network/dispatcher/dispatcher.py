@@ -16,9 +16,12 @@ class ConnectionCallbacks(object):
 
 
 class YowConnectionDispatcher(object):
-    def __init__(self, connectionCallbacks):
+    DEFAULT_READ_SIZE = 64 * 1024
+
+    def __init__(self, connectionCallbacks, readSize=None):
         assert isinstance(connectionCallbacks, ConnectionCallbacks)
         self.connectionCallbacks = connectionCallbacks
+        self.readSize = readSize or self.DEFAULT_READ_SIZE
 
     def connect(self, host):
         pass
@@ -0,0 +1,114 @@
+from yowsup.layers.network.dispatcher.dispatcher import YowConnectionDispatcher
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _ConnectionProtocol(asyncio.BufferedProtocol):
+    """
+    Receives into a buffer of the dispatcher's readSize, so that a read hands at most readSize bytes to onRecvData
+    """
+    def __init__(self, dispatcher):
+        self._dispatcher = dispatcher
+        self._buffer = bytearray(dispatcher.readSize)
+        self._view = memoryview(self._buffer)
+
+    def connection_made(self, transport):
+        self._dispatcher._on_connection_made(transport)
+
+    def get_buffer(self, sizehint):
+        return self._view
+
+    def buffer_updated(self, nbytes):
+        # the buffer is reused for the next read, pass on a copy
+        self._dispatcher.connectionCallbacks.onRecvData(bytes(self._view[:nbytes]))
+
+    def connection_lost(self, exc):
+        self._dispatcher._on_connection_lost(exc)
+
+
+class AsyncioConnectionDispatcher(YowConnectionDispatcher):
+    """
+    Connection dispatcher backed by an asyncio Protocol/Transport pair.
+
+    When given an event loop, connections are scheduled on it and connect returns immediately, which lets a single
+    loop running in one thread host the connections of many stacks. Without a loop, connect creates a private one and
+    runs it until the connection is closed, like the other dispatchers do.
+    """
+    def __init__(self, connectionCallbacks, readSize=None, loop=None):
+        super(AsyncioConnectionDispatcher, self).__init__(connectionCallbacks, readSize)
+        self._loop = loop  # type: asyncio.AbstractEventLoop
+        self._loop_thread = None
+        self._transport = None  # type: asyncio.Transport
+        self._closed = None  # type: asyncio.Future
+
+    def connect(self, host):
+        logger.debug("connect(%s)" % str(host))
+        self.connectionCallbacks.onConnecting()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._create_connection, host)
+            return
+
+        self._loop = asyncio.new_event_loop()
+        self._closed = self._loop.create_future()
+        try:
+            self._loop.call_soon(self._create_connection, host)
+            self._loop.run_until_complete(self._closed)
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    def disconnect(self):
+        logger.debug("disconnect")
+        if self._transport is not None:
+            self._call_in_loop(self._transport.close)
+        else:
+            logger.error("Not connected?")
+
+    def sendData(self, data):
+        if self._transport is not None:
+            self._call_in_loop(self._write, data)
+        else:
+            logger.warn("Attempted to send %d bytes while still not connected" % len(data))
+
+    def _write(self, data):
+        if self._transport is not None:
+            self._transport.write(data)
+
+    def _call_in_loop(self, fn, *args):
+        if threading.current_thread() is self._loop_thread:
+            fn(*args)
+        else:
+            self._loop.call_soon_threadsafe(fn, *args)
+
+    def _create_connection(self, host):
+        self._loop_thread = threading.current_thread()
+        task = asyncio.ensure_future(
+            self._loop.create_connection(lambda: _ConnectionProtocol(self), host[0], host[1]), loop=self._loop
+        )
+        task.add_done_callback(self._on_connection_created)
+
+    def _on_connection_created(self, task):
+        if task.cancelled():
+            self._set_closed()
+        elif task.exception() is not None:
+            logger.error(task.exception())
+            self.connectionCallbacks.onConnectionError(task.exception())
+            self._set_closed()
+
+    def _on_connection_made(self, transport):
+        logger.debug("connection_made")
+        self._transport = transport
+        self.connectionCallbacks.onConnected()
+
+    def _on_connection_lost(self, exc):
+        logger.debug("connection_lost(%s)" % exc)
+        self._transport = None
+        self.connectionCallbacks.onDisconnected()
+        self._set_closed()
+
+    def _set_closed(self):
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
@@ -1,30 +1,107 @@
 from yowsup.layers.network.dispatcher.dispatcher import YowConnectionDispatcher
+from collections import deque
 import asyncore
+import errno
+import itertools
 import logging
 import socket
+import threading
 import traceback
 
 logger = logging.getLogger(__name__)
 
 
-class AsyncoreConnectionDispatcher(YowConnectionDispatcher, asyncore.dispatcher_with_send):
-    def __init__(self, connectionCallbacks):
-        super(AsyncoreConnectionDispatcher, self).__init__(connectionCallbacks)
-        asyncore.dispatcher_with_send.__init__(self)
+class AsyncoreConnectionDispatcher(YowConnectionDispatcher, asyncore.dispatcher):
+    # max number of buffers handed to a single sendmsg call, stays below IOV_MAX on common platforms
+    MAX_SEND_BUFFERS = 512
+
+    def __init__(self, connectionCallbacks, readSize=None):
+        super(AsyncoreConnectionDispatcher, self).__init__(connectionCallbacks, readSize)
+        asyncore.dispatcher.__init__(self)
         self._connected = False
+        self._out_buffers = deque()
+        self._out_lock = threading.Lock()
 
     def sendData(self, data):
         if self._connected:
-            self.out_buffer = self.out_buffer + data
-            self.initiate_send()
+            sent = 0
+            with self._out_lock:
+                if not self._out_buffers:
+                    # nothing queued, try writing directly
+                    sent = self._send(data)
+                    if sent == len(data):
+                        return
+                    if sent is not None:
+                        self._out_buffers.append(memoryview(data)[sent:])
+                else:
+                    self._out_buffers.append(memoryview(data))
+            if sent is None:
+                self.handle_close()
+            else:
+                self.initiate_send()
         else:
             logger.warn("Attempted to send %d bytes while still not connected" % len(data))
 
+    def initiate_send(self):
+        """
+        Writes as much of the queued outgoing data as the socket accepts. When more than one buffer is queued they are
+        all handed to a single scatter-gather sendmsg call where supported; partially sent buffers are advanced by
+        slicing their memoryview rather than copying them.
+        """
+        sent = 0
+        with self._out_lock:
+            while self._out_buffers:
+                if len(self._out_buffers) > 1 and hasattr(self.socket, "sendmsg"):
+                    sent = self._sendmsg(list(itertools.islice(self._out_buffers, self.MAX_SEND_BUFFERS)))
+                else:
+                    sent = self._send(self._out_buffers[0])
+                if not sent:
+                    break
+                while sent:
+                    head = self._out_buffers[0]
+                    if sent >= len(head):
+                        sent -= len(head)
+                        self._out_buffers.popleft()
+                    else:
+                        self._out_buffers[0] = head[sent:]
+                        sent = 0
+        # closing calls back into the layers above, which may send, so it happens once _out_lock is released
+        if sent is None:
+            self.handle_close()
+
+    def _send(self, data):
+        """
+        Like asyncore.dispatcher.send, but leaves closing the connection to the caller, which holds _out_lock
+        :return: number of bytes sent, None if the connection is gone
+        :rtype: int | None
+        """
+        return self._send_with(self.socket.send, data)
+
+    def _sendmsg(self, buffers):
+        return self._send_with(self.socket.sendmsg, buffers)
+
+    @staticmethod
+    def _send_with(send, data):
+        try:
+            return send(data)
+        except socket.error as e:
+            if e.args[0] == errno.EWOULDBLOCK:
+                return 0
+            elif e.args[0] in asyncore._DISCONNECTED:
+                return None
+            raise
+
+    def writable(self):
+        return not self.connected or len(self._out_buffers) > 0
+
+    def handle_write(self):
+        self.initiate_send()
+
     def connect(self, host):
         logger.debug("connect(%s)" % str(host))
         self.connectionCallbacks.onConnecting()
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        asyncore.dispatcher_with_send.connect(self, host)
+        asyncore.dispatcher.connect(self, host)
         asyncore.loop(timeout=1)
 
     def handle_connect(self):
@@ -35,8 +112,10 @@ class AsyncoreConnectionDispatcher(YowConnectionDispatcher, asyncore.dispatcher_
 
     def handle_close(self):
         logger.debug("handle_close")
-        self.close()
         self._connected = False
+        with self._out_lock:
+            self._out_buffers = deque()
+        self.close()
         self.connectionCallbacks.onDisconnected()
 
     def handle_error(self):
@@ -44,7 +123,7 @@ class AsyncoreConnectionDispatcher(YowConnectionDispatcher, asyncore.dispatcher_
         self.handle_close()
 
     def handle_read(self):
-        data = self.recv(1024)
+        data = self.recv(self.readSize)
         self.connectionCallbacks.onRecvData(data)
 
     def disconnect(self):
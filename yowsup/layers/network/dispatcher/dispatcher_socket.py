@@ -6,8 +6,8 @@ logger = logging.getLogger(__name__)
 
 
 class SocketConnectionDispatcher(YowConnectionDispatcher):
-    def __init__(self, connectionCallbacks):
-        super(SocketConnectionDispatcher, self).__init__(connectionCallbacks)
+    def __init__(self, connectionCallbacks, readSize=None):
+        super(SocketConnectionDispatcher, self).__init__(connectionCallbacks, readSize)
         self.socket = None
 
     def connect(self, host):
@@ -36,7 +36,7 @@ class SocketConnectionDispatcher(YowConnectionDispatcher):
             socket.connect(host)
             self.connectionCallbacks.onConnected()
             while True:
-                data = socket.recv(1024)
+                data = socket.recv(self.readSize)
                 if len(data):
                     self.connectionCallbacks.onRecvData(data)
                 else:
@@ -51,7 +51,7 @@ class SocketConnectionDispatcher(YowConnectionDispatcher):
 
     def sendData(self, data):
         try:
-            self.socket.send(data)
+            self.socket.sendall(data)
         except socket.error as e:
             logger.error(e)
             self.disconnect()
@@ -0,0 +1,134 @@
+import asyncio
+import socket
+import threading
+import unittest
+from yowsup.layers.network.dispatcher.dispatcher import ConnectionCallbacks
+from yowsup.layers.network.dispatcher.dispatcher_asyncio import AsyncioConnectionDispatcher
+
+
+class EchoServer(object):
+    def __init__(self):
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(8)
+        self.address = self.socket.getsockname()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.socket.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self._echo, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _echo(self, conn):
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                conn.sendall(data)
+
+    def close(self):
+        self.socket.close()
+
+
+class Callbacks(ConnectionCallbacks):
+    def __init__(self, expected):
+        self.expected = expected
+        self.received = bytearray()
+        self.reads = []
+        self.connected = threading.Event()
+        self.done = threading.Event()
+        self.disconnected = threading.Event()
+        self.error = None
+
+    def onConnected(self):
+        self.connected.set()
+
+    def onRecvData(self, data):
+        self.reads.append(len(data))
+        self.received.extend(data)
+        if len(self.received) >= self.expected:
+            self.done.set()
+
+    def onDisconnected(self):
+        self.disconnected.set()
+
+    def onConnectionError(self, error):
+        self.error = error
+        self.disconnected.set()
+
+
+class AsyncioConnectionDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = EchoServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_private_loop(self):
+        callbacks = Callbacks(4)
+        dispatcher = AsyncioConnectionDispatcher(callbacks)
+        thread = threading.Thread(target=dispatcher.connect, args=(self.server.address,))
+        thread.start()
+        self.assertTrue(callbacks.connected.wait(5))
+        dispatcher.sendData(b"ab")
+        dispatcher.sendData(bytearray(b"cd"))
+        self.assertTrue(callbacks.done.wait(5))
+        dispatcher.disconnect()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(callbacks.disconnected.is_set())
+        self.assertEqual(b"abcd", callbacks.received)
+
+    def test_read_size(self):
+        callbacks = Callbacks(10)
+        dispatcher = AsyncioConnectionDispatcher(callbacks, readSize=3)
+        thread = threading.Thread(target=dispatcher.connect, args=(self.server.address,))
+        thread.start()
+        self.assertTrue(callbacks.connected.wait(5))
+        dispatcher.sendData(b"0123456789")
+        self.assertTrue(callbacks.done.wait(5))
+        dispatcher.disconnect()
+        thread.join(5)
+        self.assertEqual(b"0123456789", callbacks.received)
+        self.assertEqual(3, max(callbacks.reads))
+
+    def test_shared_loop(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            connections = [Callbacks(1000) for _ in range(0, 10)]
+            dispatchers = [AsyncioConnectionDispatcher(callbacks, loop=loop) for callbacks in connections]
+            for dispatcher in dispatchers:
+                dispatcher.connect(self.server.address)
+            for i, (dispatcher, callbacks) in enumerate(zip(dispatchers, connections)):
+                self.assertTrue(callbacks.connected.wait(5))
+                dispatcher.sendData(bytes(bytearray([i])) * 1000)
+            for i, (dispatcher, callbacks) in enumerate(zip(dispatchers, connections)):
+                self.assertTrue(callbacks.done.wait(5))
+                self.assertEqual(bytes(bytearray([i])) * 1000, callbacks.received)
+                dispatcher.disconnect()
+                self.assertTrue(callbacks.disconnected.wait(5))
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+            loop.close()
+
+    def test_connection_error(self):
+        # closing the server does not stop a thread blocked in accept from completing connections, use a port nobody
+        # listens on
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        address = sock.getsockname()
+        sock.close()
+        callbacks = Callbacks(0)
+        AsyncioConnectionDispatcher(callbacks).connect(address)
+        self.assertIsNotNone(callbacks.error)
@@ -0,0 +1,100 @@
+import errno
+import socket
+import unittest
+from yowsup.layers.network.dispatcher.dispatcher import ConnectionCallbacks
+try:
+    from yowsup.layers.network.dispatcher.dispatcher_asyncore import AsyncoreConnectionDispatcher
+except ImportError:
+    AsyncoreConnectionDispatcher = None
+
+
+class ThrottledSocket(object):
+    """Accepts at most `limit` bytes per call, then blocks until drained"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.written = bytearray()
+        self.blocked = False
+        self.reset = False
+        self.sendmsg_calls = 0
+
+    def send(self, data):
+        if self.reset:
+            raise socket.error(errno.ECONNRESET, "connection reset")
+        if self.blocked:
+            raise socket.error(errno.EWOULDBLOCK, "would block")
+        data = bytes(data[:self.limit])
+        self.written.extend(data)
+        self.blocked = len(data) == self.limit
+        return len(data)
+
+    def sendmsg(self, buffers):
+        self.sendmsg_calls += 1
+        return self.send(b"".join(buffers))
+
+    def drain(self):
+        self.blocked = False
+
+    def close(self):
+        pass
+
+
+class ReentrantCallbacks(ConnectionCallbacks):
+    """Sends from onDisconnected, as layers reacting to a disconnect may"""
+    def __init__(self):
+        self.dispatcher = None
+        self.disconnected = 0
+
+    def onDisconnected(self):
+        self.disconnected += 1
+        with self.dispatcher._out_lock:
+            pass
+
+
+@unittest.skipIf(AsyncoreConnectionDispatcher is None, "asyncore is not available")
+class AsyncoreConnectionDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = AsyncoreConnectionDispatcher(ConnectionCallbacks(), 4096)
+        self.socket = ThrottledSocket(5)
+        self.dispatcher.socket = self.socket
+        self.dispatcher.connected = self.dispatcher._connected = True
+
+    def test_read_size(self):
+        self.assertEqual(4096, self.dispatcher.readSize)
+        self.assertEqual(AsyncoreConnectionDispatcher.DEFAULT_READ_SIZE,
+                         AsyncoreConnectionDispatcher(ConnectionCallbacks()).readSize)
+
+    def test_send_direct(self):
+        self.dispatcher.sendData(b"abc")
+        self.assertEqual(b"abc", self.socket.written)
+        self.assertFalse(self.dispatcher.writable())
+
+    def test_send_queued(self):
+        chunks = [b"header", b"payload", b"x", b"", b"more payload"]
+        for chunk in chunks:
+            self.dispatcher.sendData(chunk)
+        self.assertTrue(self.dispatcher.writable())
+        while self.dispatcher.writable():
+            self.socket.drain()
+            self.dispatcher.handle_write()
+        self.assertEqual(b"".join(chunks), self.socket.written)
+        self.assertTrue(self.socket.sendmsg_calls > 0)
+
+    def test_reset_closes_outside_lock(self):
+        callbacks = ReentrantCallbacks()
+        callbacks.dispatcher = self.dispatcher
+        self.dispatcher.connectionCallbacks = callbacks
+        self.dispatcher.sendData(b"header")
+        self.dispatcher.sendData(b"payload")
+        self.socket.drain()
+        self.socket.reset = True
+        self.dispatcher.handle_write()
+        self.assertEqual(1, callbacks.disconnected)
+        self.assertEqual(0, len(self.dispatcher._out_buffers))
+
+    def test_reset_on_direct_send(self):
+        callbacks = ReentrantCallbacks()
+        callbacks.dispatcher = self.dispatcher
+        self.dispatcher.connectionCallbacks = callbacks
+        self.socket.reset = True
+        self.dispatcher.sendData(b"abc")
+        self.assertEqual(1, callbacks.disconnected)
@@ -3,7 +3,12 @@ from yowsup.layers.network.layer_interface import YowNetworkLayerInterface
 from yowsup.layers.network.dispatcher.dispatcher import ConnectionCallbacks
 from yowsup.layers.network.dispatcher.dispatcher import YowConnectionDispatcher
 from yowsup.layers.network.dispatcher.dispatcher_socket import SocketConnectionDispatcher
-from yowsup.layers.network.dispatcher.dispatcher_asyncore import AsyncoreConnectionDispatcher
+from yowsup.layers.network.dispatcher.dispatcher_asyncio import AsyncioConnectionDispatcher
+try:
+    from yowsup.layers.network.dispatcher.dispatcher_asyncore import AsyncoreConnectionDispatcher
+except ImportError:
+    # asyncore was removed in python 3.12
+    AsyncoreConnectionDispatcher = None
 import logging
 logger = logging.getLogger(__name__)
 
@@ -20,6 +25,7 @@ class YowNetworkLayer(YowLayer, ConnectionCallbacks):
     PROP_ENDPOINT               = "org.openwhatsapp.yowsup.prop.endpoint"
     PROP_NET_READSIZE           = "org.openwhatsapp.yowsup.prop.net.readSize"
     PROP_DISPATCHER             = "org.openwhatsapp.yowsup.prop.net.dispatcher"
+    PROP_EVENT_LOOP             = "org.openwhatsapp.yowsup.prop.net.eventLoop"
 
     STATE_DISCONNECTED          = 0
     STATE_CONNECTING            = 1
@@ -28,7 +34,8 @@ class YowNetworkLayer(YowLayer, ConnectionCallbacks):
 
     DISPATCHER_SOCKET = 0
     DISPATCHER_ASYNCORE = 1
-    DISPATCHER_DEFAULT = DISPATCHER_ASYNCORE
+    DISPATCHER_ASYNCIO = 2
+    DISPATCHER_DEFAULT = DISPATCHER_ASYNCORE if AsyncoreConnectionDispatcher is not None else DISPATCHER_ASYNCIO
 
     def __init__(self):
         self.state = self.__class__.STATE_DISCONNECTED
@@ -40,12 +47,16 @@ class YowNetworkLayer(YowLayer, ConnectionCallbacks):
         self._disconnect_reason = None
 
     def __create_dispatcher(self, dispatcher_type):
-        if dispatcher_type == self.DISPATCHER_ASYNCORE:
+        read_size = self.getProp(self.PROP_NET_READSIZE, YowConnectionDispatcher.DEFAULT_READ_SIZE)
+        if dispatcher_type == self.DISPATCHER_ASYNCORE and AsyncoreConnectionDispatcher is not None:
             logger.debug("Created asyncore dispatcher")
-            return AsyncoreConnectionDispatcher(self)
+            return AsyncoreConnectionDispatcher(self, read_size)
+        elif dispatcher_type == self.DISPATCHER_ASYNCIO:
+            logger.debug("Created asyncio dispatcher")
+            return AsyncioConnectionDispatcher(self, read_size, self.getProp(self.PROP_EVENT_LOOP))
         else:
             logger.debug("Created socket dispatcher")
-            return SocketConnectionDispatcher(self)
+            return SocketConnectionDispatcher(self, read_size)
 
     def onConnected(self):
         logger.debug("Connected")
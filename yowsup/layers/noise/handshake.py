@@ -0,0 +1,172 @@
+from dissononce.processing.impl.handshakestate import HandshakeState
+from dissononce.extras.processing.handshakestate_guarded import GuardedHandshakeState
+from dissononce.extras.processing.handshakestate_switchable import SwitchableHandshakeState
+from dissononce.processing.handshakepatterns.interactive.IK import IKHandshakePattern
+from dissononce.processing.handshakepatterns.interactive.XX import XXHandshakePattern
+from dissononce.processing.modifiers.fallback import FallbackPatternModifier
+from dissononce.processing.impl.cipherstate import CipherState
+from dissononce.cipher.aesgcm import AESGCMCipher
+from dissononce.hash.sha256 import SHA256Hash
+from dissononce.dh.keypair import KeyPair as DHKeyPair
+from dissononce.dh.x25519.public import PublicKey as DHPublicKey
+from dissononce.dh.private import PrivateKey as DHPrivateKey
+from dissononce.dh.x25519.x25519 import X25519DH
+from dissononce.exceptions.decrypt import DecryptFailedException
+from google.protobuf.message import DecodeError
+
+from consonance.handshake import WAHandshake
+from consonance.dissononce_extras.processing.symmetricstate_wa import WASymmetricState
+from consonance.proto import wa20_pb2
+from consonance.certman.certman import CertMan
+from consonance.exceptions.handshake_failed_exception import HandshakeFailedException
+from consonance.util.byte import ByteUtil
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# consonance release whose WAHandshake.perform, _start_handshake_xx, _start_handshake_ik and
+# _switch_handshake_xxfallback are mirrored by WANoiseHandshake, test_layer_noise fails once another one is installed
+CONSONANCE_VERSION = "0.1.3-1"
+
+
+class WANoiseHandshake(WAHandshake):
+    """
+    The client side of consonance's WAHandshake, split at the point where it waits for the server hello so that it is
+    driven by incoming segments instead of blocking on a stream. start returns the client hello, the server hello is
+    then passed to receive, which returns the client finish if one has to be sent. Once receive returns, cipherstates
+    holds the (send, receive) pair for the transport phase and rs the server's static public key.
+
+    The message handling is a copy of WAHandshake's of consonance CONSONANCE_VERSION, it also relies on WAHandshake's
+    _prologue and _create_full_payload. Compare it against WAHandshake when upgrading consonance.
+    """
+
+    PATTERN_XX = "XX"
+    PATTERN_IK = "IK"
+
+    def __init__(self, version_major, version_minor):
+        super(WANoiseHandshake, self).__init__(version_major, version_minor)
+        self._pattern = None
+        self._s = None
+        self._client_payload = None
+        self.cipherstates = None
+
+    @property
+    def pattern(self):
+        """
+        :return: the pattern the handshake was started with, or None before start
+        :rtype: str | None
+        """
+        return self._pattern
+
+    def start(self, client_config, s, rs=None):
+        """
+        :param client_config:
+        :type client_config: consonance.config.client.ClientConfig
+        :param s:
+        :type s: consonance.structs.keypair.KeyPair
+        :param rs: the server's static public key, starts an IK handshake when known and XX otherwise
+        :type rs: consonance.structs.publickey.PublicKey | None
+        :return: serialized client hello
+        :rtype: bytes
+        """
+        self._handshakestate = SwitchableHandshakeState(
+            GuardedHandshakeState(
+                HandshakeState(
+                    WASymmetricState(
+                        CipherState(
+                            AESGCMCipher()
+                        ),
+                        SHA256Hash()
+                    ),
+                    X25519DH()
+                )
+            )
+        )  # type: SwitchableHandshakeState
+        self._s = DHKeyPair(DHPublicKey(s.public.data), DHPrivateKey(s.private.data))
+        self._client_payload = self._create_full_payload(client_config)
+        self.cipherstates = None
+
+        client_hello = wa20_pb2.HandshakeMessage.ClientHello()
+        if rs is not None:
+            self._pattern = self.PATTERN_IK
+            self._handshakestate.initialize(
+                handshake_pattern=IKHandshakePattern(),
+                initiator=True,
+                prologue=self._prologue,
+                s=self._s,
+                rs=DHPublicKey(rs.data)
+            )
+            message_buffer = bytearray()
+            self._handshakestate.write_message(self._client_payload.SerializeToString(), message_buffer)
+            client_hello.ephemeral, client_hello.static, client_hello.payload = ByteUtil.split(
+                bytes(message_buffer), 32, 48, len(message_buffer) - 32 - 48
+            )
+        else:
+            self._pattern = self.PATTERN_XX
+            self._handshakestate.initialize(
+                handshake_pattern=XXHandshakePattern(),
+                initiator=True,
+                prologue=self._prologue,
+                s=self._s
+            )
+            ephemeral_public = bytearray()
+            self._handshakestate.write_message(b'', ephemeral_public)
+            client_hello.ephemeral = bytes(ephemeral_public)
+
+        handshakemessage = wa20_pb2.HandshakeMessage()
+        handshakemessage.client_hello.MergeFrom(client_hello)
+        return handshakemessage.SerializeToString()
+
+    def receive(self, segment):
+        """
+        :param segment: serialized server hello
+        :type segment: bytes
+        :return: serialized client finish, or None when the handshake completed without one
+        :rtype: bytes | None
+        """
+        if self._pattern is None or self.cipherstates is not None:
+            raise HandshakeFailedException("Handshake is not awaiting a server hello")
+        try:
+            incoming_handshakemessage = wa20_pb2.HandshakeMessage()
+            incoming_handshakemessage.ParseFromString(bytes(segment))
+            if not incoming_handshakemessage.HasField("server_hello"):
+                raise HandshakeFailedException("Handshake message does not contain server hello!")
+            server_hello = incoming_handshakemessage.server_hello
+
+            if self._pattern == self.PATTERN_IK:
+                if not server_hello.HasField("static"):
+                    self.cipherstates = self._handshakestate.read_message(
+                        server_hello.ephemeral + server_hello.static + server_hello.payload, bytearray()
+                    )
+                    return None
+                # the server has a new static key and didn't accept ours for it, continue with XX fallback
+                self._handshakestate.switch(
+                    handshake_pattern=FallbackPatternModifier().modify(XXHandshakePattern()),
+                    initiator=True,
+                    prologue=self._prologue,
+                    s=self._s
+                )
+
+            payload_buffer = bytearray()
+            self._handshakestate.read_message(
+                server_hello.ephemeral + server_hello.static + server_hello.payload, payload_buffer
+            )
+            if CertMan().is_valid(self._handshakestate.rs, bytes(payload_buffer)):
+                logger.debug("cert is valid")
+            else:
+                logger.error("cert is not valid")
+
+            message_buffer = bytearray()
+            cipherstates = self._handshakestate.write_message(self._client_payload.SerializeToString(), message_buffer)
+            client_finish = wa20_pb2.HandshakeMessage.ClientFinish()
+            client_finish.static, client_finish.payload = ByteUtil.split(
+                bytes(message_buffer), 48, len(message_buffer) - 48
+            )
+            outgoing_handshakemessage = wa20_pb2.HandshakeMessage()
+            outgoing_handshakemessage.client_finish.MergeFrom(client_finish)
+            self.cipherstates = cipherstates
+            return outgoing_handshakemessage.SerializeToString()
+        except (DecryptFailedException, DecodeError) as e:
+            logger.exception(e)
+            raise HandshakeFailedException(e)
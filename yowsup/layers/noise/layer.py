@@ -1,4 +1,5 @@
 from yowsup.layers.noise.workers.handshake import WANoiseProtocolHandshakeWorker
+from yowsup.layers.noise.handshake import WANoiseHandshake
 from yowsup.layers import YowLayer, EventCallback
 from yowsup.layers.auth.layer_authentication import YowAuthenticationProtocolLayer
 from yowsup.layers.network.layer import YowNetworkLayer
@@ -10,21 +11,19 @@ from yowsup.structs.protocoltreenode import ProtocolTreeNode
 from yowsup.layers.coder.encoder import WriteEncoder
 from yowsup.layers.coder.tokendictionary import TokenDictionary
 
-from consonance.protocol import WANoiseProtocol
+from consonance.handshake import WAHandshake
 from consonance.config.client import ClientConfig
 from consonance.config.useragent import UserAgentConfig
 from consonance.streams.segmented.blockingqueue import BlockingQueueSegmentedStream
 from consonance.structs.keypair import KeyPair
+from consonance.exceptions.handshake_failed_exception import HandshakeFailedException
 
 import threading
 import logging
+import queue
 
 
 logger = logging.getLogger(__name__)
-try:
-    import Queue
-except ImportError:
-    import queue as Queue
 
 
 class YowNoiseLayer(YowLayer):
@@ -32,27 +31,37 @@ class YowNoiseLayer(YowLayer):
     HEADER = b'WA\x03\x00'
     EDGE_HEADER = b'ED\x00\x01'
     EVENT_HANDSHAKE_FAILED = "org.whatsapp.yowsup.layer.noise.event.handshake_failed"
+    PROP_HANDSHAKE_MODE = "org.openwhatsapp.yowsup.prop.noise.handshake_mode"
+
+    # handshake runs on a worker thread reading server segments from a blocking queue
+    HANDSHAKE_MODE_WORKER = 0
+    # handshake and transport are driven by receive calls, in the thread delivering the data
+    HANDSHAKE_MODE_INLINE = 1
+    HANDSHAKE_MODE_DEFAULT = HANDSHAKE_MODE_WORKER
 
     def __init__(self):
         super(YowNoiseLayer, self).__init__()
-        self._wa_noiseprotocol = WANoiseProtocol(
-            3, 0, protocol_state_callbacks=self._on_protocol_state_changed
-        )  # type: WANoiseProtocol
-
-        self._handshake_worker = None
+        self._handshake_worker = None  # type: WANoiseProtocolHandshakeWorker | None
         self._stream = BlockingQueueSegmentedStream()  # type: BlockingQueueSegmentedStream
         self._read_buffer = bytearray()
         self._flush_lock = threading.Lock()
-        self._incoming_segments_queue = Queue.Queue()
+        self._incoming_segments_queue = queue.Queue()
         self._profile = None
         self._rs = None
+        # inline mode
+        self._handshake = None  # type: WANoiseHandshake | None
+        # transport, set by either handshake mode once it completes
+        self._send_cipherstate = None
+        self._recv_cipherstate = None
 
     def __str__(self):
         return "Noise Layer"
 
     @EventCallback(YowNetworkLayer.EVENT_STATE_DISCONNECTED)
     def on_disconnected(self, event):
-        self._wa_noiseprotocol.reset()
+        self._handshake_worker = None
+        self._handshake = None
+        self._send_cipherstate = self._recv_cipherstate = None
 
     @EventCallback(YowAuthenticationProtocolLayer.EVENT_AUTH)
     def on_auth(self, event):
@@ -111,11 +120,19 @@ class YowNoiseLayer(YowLayer):
                 pushname=config.pushname or self.DEFAULT_PUSHNAME,
                 short_connect=True
             )
-            if not self._in_handshake():
+            if self._in_handshake():
+                return
+            if self.getProp(self.PROP_HANDSHAKE_MODE, self.HANDSHAKE_MODE_DEFAULT) == self.HANDSHAKE_MODE_INLINE:
+                logger.debug("Performing inline handshake [username= %d, passive=%s]" % (username, passive))
+                self._send_cipherstate = self._recv_cipherstate = None
+                self._handshake = WANoiseHandshake(3, 0)
+                self.toLower(self._handshake.start(client_config, local_static, remote_static))
+            else:
                 logger.debug("Performing handshake [username= %d, passive=%s]" % (username, passive) )
+                self._send_cipherstate = self._recv_cipherstate = None
                 self._handshake_worker = WANoiseProtocolHandshakeWorker(
-                    self._wa_noiseprotocol, self._stream, client_config, local_static, remote_static,
-                    self.on_handshake_finished
+                    WAHandshake(3, 0), self._stream, client_config, local_static, remote_static,
+                    self._on_worker_handshake_finished
                 )
                 logger.debug("Starting handshake worker")
                 self._stream.set_events_callback(self._handle_stream_event)
@@ -136,16 +153,59 @@ class YowNoiseLayer(YowLayer):
         :return:
         :rtype: bool
         """
-        return self._wa_noiseprotocol.state == WANoiseProtocol.STATE_HANDSHAKE
-
-    def _on_protocol_state_changed(self, state):
-        if state == WANoiseProtocol.STATE_TRANSPORT:
-            if self._rs != self._wa_noiseprotocol.rs:
-                config = self._profile.config
-                config.server_static_public = self._wa_noiseprotocol.rs
-                self._profile.write_config(config)
-                self._rs = self._wa_noiseprotocol.rs
-            self._flush_incoming_buffer()
+        return self._handshake is not None or self._handshake_worker is not None
+
+    def _on_worker_handshake_finished(self, worker, cipherstates, error):
+        """
+        :param worker:
+        :type worker: WANoiseProtocolHandshakeWorker
+        :param cipherstates: (send, receive) cipherstates of the transport, None if the handshake failed
+        :type cipherstates: tuple | None
+        :param error:
+        :type error: Exception | None
+        """
+        if worker is not self._handshake_worker:
+            # finished after a disconnect
+            return
+        if error is None:
+            self._update_remote_static(worker.handshake.rs)
+        with self._flush_lock:
+            send_cipherstate, recv_cipherstate = cipherstates if error is None else (None, None)
+            self._send_cipherstate = send_cipherstate
+            self._handshake_worker = None
+            # segments queued during the handshake, and those queued by receive while they are, are flushed before
+            # the receive cipherstate is published. From then on receive decrypts and dispatches in the calling
+            # thread without going through the queue, like in inline mode
+            self._flush_incoming_buffer_locked(recv_cipherstate)
+            self._recv_cipherstate = recv_cipherstate
+        self.on_handshake_finished(error)
+
+    def _update_remote_static(self, rs):
+        if self._rs != rs:
+            config = self._profile.config
+            config.server_static_public = rs
+            self._profile.write_config(config)
+            self._rs = rs
+
+    def _receive_handshake(self, data):
+        """
+        Advances the inline handshake with a server segment, switching to transport once it completes
+        :param data:
+        :type data: bytes
+        """
+        handshake = self._handshake
+        try:
+            client_finish = handshake.receive(data)
+        except HandshakeFailedException as e:
+            self._handshake = None
+            self.on_handshake_finished(e)
+            return
+        if client_finish is not None:
+            self.toLower(client_finish)
+        self._send_cipherstate, self._recv_cipherstate = handshake.cipherstates
+        self._handshake = None
+        self._update_remote_static(handshake.rs)
+        self.on_handshake_finished()
 
     def _handle_stream_event(self, event):
         if event == BlockingQueueSegmentedStream.EVENT_WRITE:
@@ -161,13 +221,26 @@ class YowNoiseLayer(YowLayer):
         :rtype:
         """
         data = bytes(data) if type(data) is not bytes else data
-        self._wa_noiseprotocol.send(data)
+        if self._send_cipherstate is None:
+            raise ValueError("Noise handshake has not completed")
+        self.toLower(self._send_cipherstate.encrypt_with_ad(b'', data))
 
     def _flush_incoming_buffer(self):
-        self._flush_lock.acquire()
+        with self._flush_lock:
+            self._flush_incoming_buffer_locked()
+
+    def _flush_incoming_buffer_locked(self, recv_cipherstate=None):
+        """
+        :param recv_cipherstate: decrypts the queued segments, the published one if None
+        :type recv_cipherstate: dissononce.processing.cipherstate.CipherState | None
+        """
+        recv_cipherstate = recv_cipherstate or self._recv_cipherstate
         while self._incoming_segments_queue.qsize():
-            self.toUpper(self._wa_noiseprotocol.receive())
-        self._flush_lock.release()
+            data = self._incoming_segments_queue.get()
+            if recv_cipherstate is None:
+                logger.warning("Dropping a segment received without a noise transport")
+                continue
+            self.toUpper(bytearray(recv_cipherstate.decrypt_with_ad(b'', data)))
 
     def receive(self, data):
         """
@@ -176,6 +249,13 @@ class YowNoiseLayer(YowLayer):
         :return:
         :rtype:
         """
+        # segments still queued have to be decrypted first, this one goes through the queue after them
+        if self._recv_cipherstate is not None and not self._incoming_segments_queue.qsize():
+            self.toUpper(bytearray(self._recv_cipherstate.decrypt_with_ad(b'', data)))
+            return
+        if self._handshake is not None:
+            self._receive_handshake(data)
+            return
         self._incoming_segments_queue.put(data)
         if not self._in_handshake():
             self._flush_incoming_buffer()
@@ -11,9 +11,14 @@ class YowNoiseSegmentsLayer(YowLayer):
 
     PROP_ENABLED = "org.openwhatsapp.yowsup.prop.noise.segmented_enabled"
 
+    # consumed bytes at the head of the read buffer are only discarded once they exceed this many bytes and half of
+    # the buffer, keeping compaction amortized linear
+    COMPACT_THRESHOLD = 64 * 1024
+
     def __init__(self):
         super(YowNoiseSegmentsLayer, self).__init__()
         self._read_buffer = bytearray()
+        self._read_offset = 0
 
     def __str__(self):
         return "Noise Segments Layer"
@@ -30,14 +35,38 @@ class YowNoiseSegmentsLayer(YowLayer):
     def receive(self, data):
         if self.getProp(self.PROP_ENABLED, False):
             self._read_buffer.extend(data)
-
-            while len(self._read_buffer) > 3:
-                read_size = struct.unpack('>I', b"\x00" + self._read_buffer[:3])[0] # type: int
-                if len(self._read_buffer) >= (3 + read_size):
-                    data = self._read_buffer[3:read_size+3]
-                    self._read_buffer = self._read_buffer[3 + read_size:]
-                    self.toUpper(bytes(data))
-                else:
-                    break
+            for frame in self._read_frames():
+                self.toUpper(frame)
         else:
             self.toUpper(data)
+
+    def _read_frames(self):
+        """
+        Extracts all complete frames from the read buffer. Frames are located by moving a read offset over the buffer
+        instead of reslicing it, so neither the buffered tail nor a partially received frame is copied.
+        :return:
+        :rtype: list[bytes]
+        """
+        buf = self._read_buffer
+        offset = self._read_offset
+        end = len(buf)
+        frames = []
+        view = memoryview(buf)
+        try:
+            while end - offset >= 3:
+                read_size = (buf[offset] << 16) | (buf[offset + 1] << 8) | buf[offset + 2]
+                if end - offset - 3 < read_size:
+                    break
+                frames.append(view[offset + 3:offset + 3 + read_size].tobytes())
+                offset += 3 + read_size
+        finally:
+            view.release()
+
+        if offset == end:
+            del buf[:]
+            offset = 0
+        elif offset > self.COMPACT_THRESHOLD and offset > end // 2:
+            del buf[:offset]
+            offset = 0
+        self._read_offset = offset
+        return frames
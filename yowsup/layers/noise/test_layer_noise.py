@@ -0,0 +1,329 @@
+from dissononce.processing.impl.handshakestate import HandshakeState
+from dissononce.extras.processing.handshakestate_switchable import SwitchableHandshakeState
+from dissononce.processing.handshakepatterns.interactive.IK import IKHandshakePattern
+from dissononce.processing.handshakepatterns.interactive.XX import XXHandshakePattern
+from dissononce.processing.modifiers.fallback import FallbackPatternModifier
+from dissononce.processing.impl.cipherstate import CipherState
+from dissononce.cipher.aesgcm import AESGCMCipher
+from dissononce.hash.sha256 import SHA256Hash
+from dissononce.dh.x25519.x25519 import X25519DH
+from dissononce.exceptions.decrypt import DecryptFailedException
+import consonance
+from consonance.dissononce_extras.processing.symmetricstate_wa import WASymmetricState
+from consonance.exceptions.handshake_failed_exception import HandshakeFailedException
+from consonance.proto import wa20_pb2
+from consonance.structs.keypair import KeyPair
+from yowsup.config.v1.config import Config
+from yowsup.layers import YowLayer, YowLayerEvent
+from yowsup.layers.auth.layer_authentication import YowAuthenticationProtocolLayer
+from yowsup.layers.network.layer import YowNetworkLayer
+from yowsup.layers.noise import handshake
+from yowsup.layers.noise.handshake import WANoiseHandshake
+from yowsup.layers.noise.layer import YowNoiseLayer
+from yowsup.layers.noise.layer_noise_segments import YowNoiseSegmentsLayer
+from yowsup.profile.profile import YowProfile
+from yowsup.stacks import YowStack
+import struct
+import threading
+import time
+import unittest
+import queue
+
+
+class ResponderSymmetricState(WASymmetricState):
+    """
+    Reading counterpart of WASymmetricState's quirk, the hash isn't mixed with payloads received before there is a key
+    """
+    def decrypt_and_hash(self, ciphertext):
+        if self._cipherstate.has_key():
+            return super(ResponderSymmetricState, self).decrypt_and_hash(ciphertext)
+        return self._cipherstate.decrypt_with_ad(self._h, ciphertext)
+
+
+class NoiseResponder(object):
+    """
+    Server side of the noise handshake for a single connection. Answers XX, IK and, when the client's idea of the
+    server's static key is outdated, IK with XX fallback, then echoes every transport segment back.
+    """
+    PROLOGUE = b"WA\x03\x00"
+
+    def __init__(self, s):
+        """
+        :param s: server static keypair
+        :type s: dissononce.dh.keypair.KeyPair
+        """
+        self._s = s
+        self._handshakestate = None
+        self._send_cipherstate = None
+        self._recv_cipherstate = None
+        self.pattern = None
+
+    @staticmethod
+    def _new_handshakestate():
+        return SwitchableHandshakeState(
+            HandshakeState(ResponderSymmetricState(CipherState(AESGCMCipher()), SHA256Hash()), X25519DH())
+        )
+
+    @staticmethod
+    def _server_hello(message_buffer, with_static):
+        server_hello = wa20_pb2.HandshakeMessage.ServerHello()
+        server_hello.ephemeral = bytes(message_buffer[:32])
+        if with_static:
+            server_hello.static = bytes(message_buffer[32:80])
+            server_hello.payload = bytes(message_buffer[80:])
+        else:
+            server_hello.payload = bytes(message_buffer[32:])
+        handshakemessage = wa20_pb2.HandshakeMessage()
+        handshakemessage.server_hello.MergeFrom(server_hello)
+        return handshakemessage.SerializeToString()
+
+    def receive(self, segment):
+        """
+        :param segment:
+        :type segment: bytes
+        :return: segments to send back
+        :rtype: list[bytes]
+        """
+        if self._recv_cipherstate is not None:
+            plaintext = self._recv_cipherstate.decrypt_with_ad(b'', segment)
+            return [self._send_cipherstate.encrypt_with_ad(b'', plaintext)]
+
+        handshakemessage = wa20_pb2.HandshakeMessage()
+        handshakemessage.ParseFromString(segment)
+        if handshakemessage.HasField("client_hello"):
+            client_hello = handshakemessage.client_hello
+            self._handshakestate = self._new_handshakestate()
+            if client_hello.static:
+                self._handshakestate.initialize(IKHandshakePattern(), False, self.PROLOGUE, s=self._s)
+                try:
+                    self._handshakestate.read_message(
+                        client_hello.ephemeral + client_hello.static + client_hello.payload, bytearray()
+                    )
+                except DecryptFailedException:
+                    self.pattern = "XXfallback"
+                    self._handshakestate.switch(
+                        FallbackPatternModifier().modify(XXHandshakePattern()), False, self.PROLOGUE, s=self._s
+                    )
+                    message_buffer = bytearray()
+                    self._handshakestate.write_message(b"", message_buffer)
+                    return [self._server_hello(message_buffer, True)]
+                self.pattern = "IK"
+                message_buffer = bytearray()
+                cipherstates = self._handshakestate.write_message(b"", message_buffer)
+                self._recv_cipherstate, self._send_cipherstate = cipherstates
+                return [self._server_hello(message_buffer, False)]
+
+            self.pattern = "XX"
+            self._handshakestate.initialize(XXHandshakePattern(), False, self.PROLOGUE, s=self._s)
+            self._handshakestate.read_message(client_hello.ephemeral, bytearray())
+            message_buffer = bytearray()
+            self._handshakestate.write_message(b"", message_buffer)
+            return [self._server_hello(message_buffer, True)]
+
+        client_finish = handshakemessage.client_finish
+        cipherstates = self._handshakestate.read_message(client_finish.static + client_finish.payload, bytearray())
+        self._recv_cipherstate, self._send_cipherstate = cipherstates
+        return []
+
+
+class NoiseResponderLinkLayer(YowLayer):
+    """
+    Bottom layer connecting the stack to a NoiseResponder. Data written by the stack is answered right away, the
+    answers are queued until pump delivers them up the stack.
+    """
+    def __init__(self):
+        super(NoiseResponderLinkLayer, self).__init__()
+        self.responder = None  # type: NoiseResponder
+        self.answers = queue.Queue()
+        self._buffer = bytearray()
+
+    def connect(self, responder):
+        self.responder = responder
+        self._buffer = bytearray()
+
+    def send(self, data):
+        self._buffer.extend(data)
+        if self._buffer[:4] == NoiseResponder.PROLOGUE:
+            del self._buffer[:4]
+        while len(self._buffer) >= 3:
+            size = struct.unpack('>I', b"\x00" + bytes(self._buffer[:3]))[0]
+            if len(self._buffer) < size + 3:
+                break
+            segment = bytes(self._buffer[3:size + 3])
+            del self._buffer[:size + 3]
+            for answer in self.responder.receive(segment):
+                self.answers.put(struct.pack('>I', len(answer))[1:] + answer)
+
+    def pump(self, timeout=5):
+        self.toUpper(self.answers.get(timeout=timeout))
+
+
+class SinkLayer(YowLayer):
+    def __init__(self):
+        super(SinkLayer, self).__init__()
+        self.received = []
+
+    def receive(self, data):
+        self.received.append(bytes(data))
+
+
+class ProfileStub(YowProfile):
+    def __init__(self, config):
+        super(ProfileStub, self).__init__("test", config)
+        self.written = []
+
+    def write_config(self, config):
+        self.written.append(config.server_static_public)
+
+
+def noise_stack(mode, config):
+    stack = YowStack((SinkLayer, YowNoiseLayer, YowNoiseSegmentsLayer, NoiseResponderLinkLayer))
+    stack.setProp(YowNoiseLayer.PROP_HANDSHAKE_MODE, mode)
+    stack.setProfile(ProfileStub(config))
+    return stack
+
+
+def connect(stack, responder):
+    """
+    Runs the handshake against responder and a first transport round trip
+    """
+    link = stack.getLayer(0)
+    sink = stack.getLayer(3)
+    link.connect(responder)
+    stack.broadcastEvent(YowLayerEvent(YowAuthenticationProtocolLayer.EVENT_AUTH, passive=False))
+    link.pump()
+    # with HANDSHAKE_MODE_WORKER the handshake completes on the worker thread
+    deadline = time.time() + 5
+    while stack.getLayer(2)._in_handshake() and time.time() < deadline:
+        time.sleep(0)
+    stack.send(b"ping")
+    link.pump()
+    return sink.received.pop()
+
+
+def disconnect(stack):
+    stack.emitEvent(YowLayerEvent(YowNetworkLayer.EVENT_STATE_DISCONNECTED))
+
+
+class YowNoiseLayerHandshakeTest(object):
+    """
+    Tests shared by both handshake modes, subclasses set MODE
+    """
+    MODE = None
+
+    def setUp(self):
+        self.server_static = X25519DH().generate_keypair()
+        self.config = Config(phone="123", client_static_keypair=KeyPair.generate())
+        self.stack = noise_stack(self.MODE, self.config)
+
+    def test_xx_then_ik(self):
+        responder = NoiseResponder(self.server_static)
+        self.assertEqual(b"ping", connect(self.stack, responder))
+        self.assertEqual("XX", responder.pattern)
+        self.assertEqual(self.server_static.public.data, self.config.server_static_public.data)
+        self.assertEqual(1, len(self.stack.getProp("profile").written))
+
+        disconnect(self.stack)
+        responder = NoiseResponder(self.server_static)
+        self.assertEqual(b"ping", connect(self.stack, responder))
+        self.assertEqual("IK", responder.pattern)
+        self.assertEqual(1, len(self.stack.getProp("profile").written))
+
+    def test_ik_fallback(self):
+        self.config.server_static_public = KeyPair.generate().public
+        responder = NoiseResponder(self.server_static)
+        self.assertEqual(b"ping", connect(self.stack, responder))
+        self.assertEqual("XXfallback", responder.pattern)
+        self.assertEqual(self.server_static.public.data, self.config.server_static_public.data)
+
+
+
+class YowNoiseLayerInlineHandshakeTest(YowNoiseLayerHandshakeTest, unittest.TestCase):
+    MODE = YowNoiseLayer.HANDSHAKE_MODE_INLINE
+
+    def test_no_handshake_thread(self):
+        threads = threading.active_count()
+        connect(self.stack, NoiseResponder(self.server_static))
+        self.assertEqual(threads, threading.active_count())
+
+
+class YowNoiseLayerWorkerHandshakeTest(YowNoiseLayerHandshakeTest, unittest.TestCase):
+    MODE = YowNoiseLayer.HANDSHAKE_MODE_WORKER
+
+    def test_transport_bypasses_queue(self):
+        connect(self.stack, NoiseResponder(self.server_static))
+        noise_layer = self.stack.getLayer(2)
+        queued = []
+        noise_layer._incoming_segments_queue.put = queued.append
+        self.stack.send(b"pong")
+        self.stack.getLayer(0).pump()
+        self.assertEqual([b"pong"], self.stack.getLayer(3).received)
+        self.assertEqual([], queued)
+
+    def test_segment_received_while_flushing(self):
+        link = self.stack.getLayer(0)
+        noise_layer = self.stack.getLayer(2)
+        sink = self.stack.getLayer(3)
+        responder = NoiseResponder(self.server_static)
+        finished = []
+        noise_layer._on_worker_handshake_finished = lambda *args: finished.append(args)
+        link.connect(responder)
+        self.stack.broadcastEvent(YowLayerEvent(YowAuthenticationProtocolLayer.EVENT_AUTH, passive=False))
+        worker = noise_layer._handshake_worker
+        link.pump()
+        worker.join(5)
+        first, second, third = [responder._send_cipherstate.encrypt_with_ad(b'', data)
+                                for data in (b"first", b"second", b"third")]
+        noise_layer._incoming_segments_queue.put(first)
+        noise_layer._incoming_segments_queue.put(second)
+
+        receiving = []
+
+        def receive(data):
+            sink.received.append(bytes(data))
+            if not receiving:
+                # the network thread delivers the next segment while the worker is flushing the queue
+                receiving.append(threading.Thread(target=noise_layer.receive, args=(third,)))
+                receiving[0].start()
+                receiving[0].join(0.2)
+        sink.receive = receive
+        YowNoiseLayer._on_worker_handshake_finished(noise_layer, *finished[0])
+        receiving[0].join(5)
+        self.assertEqual([b"first", b"second", b"third"], sink.received)
+
+    def test_worker_finishing_after_disconnect_ignored(self):
+        link = self.stack.getLayer(0)
+        noise_layer = self.stack.getLayer(2)
+        link.connect(NoiseResponder(self.server_static))
+        self.stack.broadcastEvent(YowLayerEvent(YowAuthenticationProtocolLayer.EVENT_AUTH, passive=False))
+        worker = noise_layer._handshake_worker
+        disconnect(self.stack)
+        # the server hello reaches the worker only after the disconnect
+        noise_layer._incoming_segments_queue.put(link.answers.get(timeout=5)[3:])
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertIsNone(noise_layer._send_cipherstate)
+        self.assertFalse(noise_layer._in_handshake())
+
+
+class WANoiseHandshakeTest(unittest.TestCase):
+    def test_mirrored_consonance_version(self):
+        self.assertEqual(handshake.CONSONANCE_VERSION, consonance.__version__,
+                         "WANoiseHandshake mirrors consonance %s's WAHandshake, compare them and update "
+                         "CONSONANCE_VERSION" % handshake.CONSONANCE_VERSION)
+
+    def test_not_started(self):
+        self.assertRaises(HandshakeFailedException, WANoiseHandshake(3, 0).receive, b"")
+
+    def test_no_server_hello(self):
+        stack = noise_stack(YowNoiseLayer.HANDSHAKE_MODE_INLINE,
+                            Config(phone="123", client_static_keypair=KeyPair.generate()))
+        noise_layer = stack.getLayer(2)
+        errors = []
+        noise_layer.on_handshake_finished = errors.append
+        stack.getLayer(0).connect(NoiseResponder(X25519DH().generate_keypair()))
+        stack.broadcastEvent(YowLayerEvent(YowAuthenticationProtocolLayer.EVENT_AUTH, passive=False))
+        noise_layer.receive(b"")
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0], HandshakeFailedException)
+        self.assertFalse(noise_layer._in_handshake())
@@ -0,0 +1,49 @@
+import os
+import random
+import struct
+from yowsup.layers import YowLayerTest
+from yowsup.layers.noise.layer_noise_segments import YowNoiseSegmentsLayer
+
+
+class YowNoiseSegmentsLayerTest(YowLayerTest, YowNoiseSegmentsLayer):
+    def setUp(self):
+        YowNoiseSegmentsLayer.__init__(self)
+        self.getProp = lambda key, default=None: key == YowNoiseSegmentsLayer.PROP_ENABLED or default
+        self.random = random.Random(1)
+
+    def _frame(self, payload):
+        return struct.pack('>I', len(payload))[1:] + payload
+
+    def _feed(self, stream, max_chunk):
+        offset = 0
+        while offset < len(stream):
+            size = self.random.randint(1, max_chunk)
+            self.receive(stream[offset:offset + size])
+            offset += size
+
+    def test_send(self):
+        self.send(b"abc")
+        self.assertEqual([b"\x00\x00\x03", b"abc"], self.lowerSink)
+
+    def test_receive_many_small_frames(self):
+        payloads = [os.urandom(self.random.randint(0, 40)) for _ in range(0, 500)]
+        self.receive(b"".join(map(self._frame, payloads)))
+        self.assertEqual(payloads, self.upperSink)
+
+    def test_receive_random_chunks(self):
+        for max_chunk in (1, 2, 3, 7, 64, 4096):
+            del self.upperSink[:]
+            payloads = [os.urandom(self.random.randint(0, 300)) for _ in range(0, 200)]
+            self._feed(b"".join(map(self._frame, payloads)), max_chunk)
+            self.assertEqual(payloads, self.upperSink)
+            self.assertEqual(0, len(self._read_buffer) - self._read_offset)
+
+    def test_receive_large_frame(self):
+        payloads = [os.urandom(self.random.randint(0, 100)), os.urandom(3 * 1024 * 1024), b""]
+        self._feed(b"".join(map(self._frame, payloads)), 8192)
+        self.assertEqual(payloads, self.upperSink)
+
+    def test_receive_disabled(self):
+        self.getProp = lambda key, default=None: default
+        self.receive(b"\x00\x00\x01a")
+        self.assertEqual([b"\x00\x00\x01a"], self.upperSink)
@@ -1,4 +1,4 @@
-from consonance.protocol import WANoiseProtocol
+from consonance.handshake import WAHandshake
 from consonance.streams.segmented.segmented import SegmentedStream
 from consonance.exceptions.handshake_failed_exception import HandshakeFailedException
 from consonance.config.client import ClientConfig
@@ -12,10 +12,10 @@ logger = logging.getLogger(__name__)
 
 
 class WANoiseProtocolHandshakeWorker(threading.Thread):
-    def __init__(self, wanoiseprotocol, stream, client_config, s, rs=None, finish_callback=None):
+    def __init__(self, handshake, stream, client_config, s, rs=None, finish_callback=None):
         """
-        :param wanoiseprotocol:
-        :type wanoiseprotocol: WANoiseProtocol
+        :param handshake:
+        :type handshake: WAHandshake
         :param stream:
         :type stream: SegmentedStream
         :param client_config:
@@ -24,11 +24,14 @@ class WANoiseProtocolHandshakeWorker(threading.Thread):
         :type s: KeyPair
         :param rs:
         :type rs: PublicKey | None
+        :param finish_callback: called with the worker, the (send, receive) cipherstates and the error the handshake
+        failed with, if any
+        :type finish_callback: (WANoiseProtocolHandshakeWorker, tuple | None, Exception | None) -> None
         """
         super(WANoiseProtocolHandshakeWorker, self).__init__()
         self.daemon = True
 
-        self._protocol = wanoiseprotocol # type: WANoiseProtocol
+        self.handshake = handshake # type: WAHandshake
         self._stream = stream # type: SegmentedStream
         self._client_config = client_config # type: ClientConfig
         self._s = s # type: KeyPair
@@ -36,12 +39,13 @@ class WANoiseProtocolHandshakeWorker(threading.Thread):
         self._finish_callback = finish_callback
 
     def run(self):
-        self._protocol.reset()
-        error = None
+        cipherstates = error = None
         try:
-            self._protocol.start(self._stream, self._client_config, self._s, self._rs)
+            cipherstates = self.handshake.perform(self._client_config, self._stream, self._s, self._rs)
+            if cipherstates is None:
+                raise HandshakeFailedException("No cipherstates")
         except HandshakeFailedException as e:
             error = e
 
         if self._finish_callback is not None:
-            self._finish_callback(error)
+            self._finish_callback(self, cipherstates, error)
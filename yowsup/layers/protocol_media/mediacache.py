@@ -0,0 +1,247 @@
+from yowsup.common.tools import WATools, FileMemo
+import sqlite3
+import threading
+import time
+
+
+class MediaUploadEntry(object):
+    __slots__ = ("file_hash", "media_type", "url", "ip", "media_key", "file_enc_sha256", "file_length", "timestamp")
+
+    def __init__(self, file_hash, media_type, url, ip=None, media_key=None, file_enc_sha256=None, file_length=None,
+                 timestamp=None):
+        self.file_hash = file_hash
+        self.media_type = media_type
+        self.url = url
+        self.ip = ip
+        self.media_key = media_key  # type: bytes | None
+        self.file_enc_sha256 = file_enc_sha256  # type: bytes | None
+        self.file_length = file_length  # type: int | None
+        self.timestamp = timestamp
+
+
+class MediaUploadCache(object):
+    """
+    Where media was uploaded to, by the upload hash of the file and media type, so that media sent again is not
+    encrypted and uploaded again. Entries keep the url and ip the server returned and, for encrypted media, the media
+    key and the sha256 and length of the uploaded blob a message needs to reference it.
+
+    The hash of a file is remembered along with its size, mtime and inode, it is only computed again when one of these
+    changes. Entries older than max_age are dropped, as the server stops serving them at some point, and once there
+    are more than max_entries, the least recently used ones are dropped. The cache is kept in a sqlite database at
+    path, in memory if it is None.
+
+    Lookups don't write: when entries were last used is kept in memory and written along with the next change, once
+    MAX_TOUCHED entries were used, or on close.
+    """
+    DEFAULT_MAX_ENTRIES = 10000
+    DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+    MAX_TOUCHED = 1000
+
+    def __init__(self, path=None, max_entries=None, max_age=None, clock=time.time,
+                 hasher=WATools.getFileHashForUpload):
+        """
+        :param path: sqlite database to keep the cache in
+        :type path: str | None
+        :param max_entries: number of uploads and of file hashes kept
+        :type max_entries: int | None
+        :param max_age: seconds after which an upload is dropped
+        :type max_age: float | None
+        :param clock:
+        :type clock: () -> float
+        :param hasher: computes the upload hash of a file
+        :type hasher: (str) -> str
+        """
+        self._max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+        self._max_age = max_age or self.DEFAULT_MAX_AGE
+        self._clock = clock
+        self._hasher = hasher
+        self._lock = threading.Lock()
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "hashed": 0,
+            "hashes_reused": 0,
+            "evicted_size": 0,
+            "evicted_age": 0
+        }
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path is not None:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER,"
+                         "inode INTEGER, hash TEXT, used REAL);")
+        self._db.execute("CREATE INDEX IF NOT EXISTS file_hashes_used ON file_hashes(used);")
+        self._db.execute("CREATE TABLE IF NOT EXISTS uploads (hash TEXT, media_type TEXT, url TEXT, ip TEXT,"
+                         "media_key BLOB, file_enc_sha256 BLOB, file_length INTEGER, timestamp REAL, used REAL,"
+                         "PRIMARY KEY(hash, media_type));")
+        self._db.execute("CREATE INDEX IF NOT EXISTS uploads_used ON uploads(used);")
+        self._db.commit()
+        self._counts = dict(
+            (table, self._db.execute("SELECT count(*) FROM %s" % table).fetchone()[0])
+            for table in ("file_hashes", "uploads")
+        )
+        # last use of entries found by lookups, not written yet
+        self._touched_file_hashes = {}  # type: dict[str, float]
+        self._touched_uploads = {}  # type: dict[tuple[str, str], float]
+
+    def __len__(self):
+        return self._counts["uploads"]
+
+    def close(self):
+        with self._lock:
+            with self._db:
+                self._write_touched()
+            self._db.close()
+
+    def get_metrics(self):
+        """
+        :return: lookup hits and misses, files hashed and file hashes reused, and counts of uploads dropped for lack
+        of space and for their age
+        :rtype: dict[str, int]
+        """
+        metrics = dict(self._metrics)
+        metrics["entries"] = len(self)
+        return metrics
+
+    def get_file_hash(self, path):
+        """
+        :param path:
+        :type path: str
+        :return: the upload hash of the file, computed again only if the file changed since it was last asked for
+        :rtype: str
+        """
+        fingerprint = FileMemo.fingerprint(path)
+        path, fingerprint = fingerprint[0], fingerprint[1:]
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime, inode, hash FROM file_hashes WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and tuple(row[:3]) == fingerprint:
+                self._touch(self._touched_file_hashes, path)
+                self._metrics["hashes_reused"] += 1
+                return row[3]
+        file_hash = self._hasher(path)
+        with self._lock:
+            with self._db:
+                self._insert("file_hashes", "path = ?", (path,),
+                             "INSERT OR REPLACE INTO file_hashes(path, size, mtime, inode, hash, used) "
+                             "VALUES(?,?,?,?,?,?)", (path,) + fingerprint + (file_hash, self._clock()))
+                self._evict("file_hashes")
+            self._metrics["hashed"] += 1
+        return file_hash
+
+    def get(self, file_hash, media_type):
+        """
+        :type file_hash: str
+        :type media_type: str
+        :rtype: MediaUploadEntry | None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, ip, media_key, file_enc_sha256, file_length, timestamp FROM uploads "
+                "WHERE hash = ? AND media_type = ?", (file_hash, media_type)
+            ).fetchone()
+            now = self._clock()
+            if row is not None and row[5] < now - self._max_age:
+                with self._db:
+                    self._delete_upload(file_hash, media_type)
+                self._metrics["evicted_age"] += 1
+                row = None
+            if row is None:
+                self._metrics["misses"] += 1
+                return None
+            self._touch(self._touched_uploads, (file_hash, media_type))
+            self._metrics["hits"] += 1
+        url, ip, media_key, file_enc_sha256, file_length, timestamp = row
+        return MediaUploadEntry(
+            file_hash, media_type, url, ip,
+            bytes(media_key) if media_key is not None else None,
+            bytes(file_enc_sha256) if file_enc_sha256 is not None else None,
+            file_length, timestamp
+        )
+
+    def put(self, file_hash, media_type, url, ip=None, media_key=None, file_enc_sha256=None, file_length=None):
+        """
+        :param file_hash: upload hash of the file
+        :type file_hash: str
+        :type media_type: str
+        :param url: where the media was uploaded to
+        :type url: str
+        :type ip: str | None
+        :param media_key: key the media was encrypted with
+        :type media_key: bytes | None
+        :param file_enc_sha256: sha256 of the uploaded, encrypted media
+        :type file_enc_sha256: bytes | None
+        :param file_length: length of the media
+        :type file_length: int | None
+        """
+        with self._lock:
+            now = self._clock()
+            with self._db:
+                self._insert(
+                    "uploads", "hash = ? AND media_type = ?", (file_hash, media_type),
+                    "INSERT OR REPLACE INTO uploads(hash, media_type, url, ip, media_key, file_enc_sha256, file_length,"
+                    "timestamp, used) VALUES(?,?,?,?,?,?,?,?,?)", (
+                        file_hash, media_type, url, ip,
+                        sqlite3.Binary(media_key) if media_key is not None else None,
+                        sqlite3.Binary(file_enc_sha256) if file_enc_sha256 is not None else None,
+                        file_length, now, now
+                    )
+                )
+                expired = self._db.execute("DELETE FROM uploads WHERE timestamp < ?", (now - self._max_age,)).rowcount
+                self._counts["uploads"] -= expired
+                self._metrics["evicted_age"] += expired
+                self._metrics["evicted_size"] += self._evict("uploads")
+
+    def remove(self, file_hash, media_type):
+        """
+        Forgets an upload, for instance when its url no longer works
+        :type file_hash: str
+        :type media_type: str
+        """
+        with self._lock:
+            with self._db:
+                self._delete_upload(file_hash, media_type)
+
+    def _touch(self, touched, key):
+        touched[key] = self._clock()
+        if len(self._touched_file_hashes) + len(self._touched_uploads) >= self.MAX_TOUCHED:
+            with self._db:
+                self._write_touched()
+
+    def _write_touched(self):
+        self._db.executemany("UPDATE file_hashes SET used = ? WHERE path = ?",
+                             [(used, path) for path, used in self._touched_file_hashes.items()])
+        self._db.executemany("UPDATE uploads SET used = ? WHERE hash = ? AND media_type = ?",
+                             [(used,) + key for key, used in self._touched_uploads.items()])
+        self._touched_file_hashes.clear()
+        self._touched_uploads.clear()
+
+    def _insert(self, table, where, key, sql, values):
+        """
+        Inserts or replaces the row of table matching where and key, keeping count of the rows
+        """
+        if self._db.execute("SELECT 1 FROM %s WHERE %s" % (table, where), key).fetchone() is None:
+            self._counts[table] += 1
+        self._db.execute(sql, values)
+
+    def _delete_upload(self, file_hash, media_type):
+        self._counts["uploads"] -= self._db.execute(
+            "DELETE FROM uploads WHERE hash = ? AND media_type = ?", (file_hash, media_type)
+        ).rowcount
+
+    def _evict(self, table):
+        """
+        Drops the least recently used rows of table beyond max_entries
+        :return: number of rows dropped
+        :rtype: int
+        """
+        excess = self._counts[table] - self._max_entries
+        if excess <= 0:
+            return 0
+        self._write_touched()
+        evicted = self._db.execute(
+            "DELETE FROM %s WHERE rowid IN (SELECT rowid FROM %s ORDER BY used LIMIT ?)" % (table, table), (excess,)
+        ).rowcount
+        self._counts[table] -= evicted
+        return evicted
@@ -14,6 +14,9 @@ class MediaCipher(object):
     INFO_VIDEO = b"WhatsApp Video Keys"
     INFO_DOCUM = b"WhatsApp Document Keys"
 
+    MAC_SIZE = 10
+    DEFAULT_CHUNK_SIZE = 1024 * 1024
+
     def encrypt_image(self, plaintext, ref_key):
         return self.encrypt(plaintext, ref_key, self.INFO_IMAGE)
 
@@ -39,11 +42,7 @@ class MediaCipher(object):
         return self.decrypt(ciphertext, ref_key, self.INFO_DOCUM)
 
     def encrypt(self, plaintext, ref_key, media_info):
-        derived = HKDFv3().deriveSecrets(ref_key, media_info, 112)
-        parts = ByteUtil.split(derived, 16, 32)
-        iv = parts[0]
-        key = parts[1]
-        mac_key = derived[48:80]
+        iv, key, mac_key = self._derive_keys(ref_key, media_info)
 
         cipher_encryptor = Cipher(
             algorithms.AES(key), modes.CBC(iv), backend=default_backend()
@@ -59,22 +58,18 @@ class MediaCipher(object):
         mac.update(iv)
         mac.update(ciphertext)
 
-        return ciphertext + mac.digest()[:10]
+        return ciphertext + mac.digest()[:self.MAC_SIZE]
 
     def decrypt(self, ciphertext, ref_key, media_info):
-        derived = HKDFv3().deriveSecrets(ref_key, media_info, 112)
-        parts = ByteUtil.split(derived, 16, 32)
-        iv = parts[0]
-        key = parts[1]
-        mac_key = derived[48:80]
-        media_ciphertext = ciphertext[:-10]
-        mac_value = ciphertext[-10:]
+        iv, key, mac_key = self._derive_keys(ref_key, media_info)
+        media_ciphertext = ciphertext[:-self.MAC_SIZE]
+        mac_value = ciphertext[-self.MAC_SIZE:]
 
         mac = hmac.new(mac_key, digestmod=hashlib.sha256)
         mac.update(iv)
         mac.update(media_ciphertext)
 
-        if mac_value != mac.digest()[:10]:
+        if mac_value != mac.digest()[:self.MAC_SIZE]:
             raise ValueError("Invalid MAC")
 
         cipher_decryptor = Cipher(
@@ -84,3 +79,110 @@ class MediaCipher(object):
         decrypted = cipher_decryptor.update(media_ciphertext) + cipher_decryptor.finalize()
         unpadder = padding.PKCS7(128).unpadder()
         return unpadder.update(decrypted) + unpadder.finalize()
+
+    def encrypt_stream(self, source, ref_key, media_info, chunk_size=None):
+        """
+        Encrypts like encrypt without holding the plaintext or ciphertext in memory
+        :param source: plaintext, a file-like object opened for reading in binary mode or an iterable of bytes chunks
+        :type source: file | collections.Iterable[bytes]
+        :param ref_key:
+        :type ref_key: bytes
+        :param media_info: one of the INFO_ constants
+        :type media_info: bytes
+        :param chunk_size: size of the reads from a file-like source
+        :type chunk_size: int | None
+        :return: ciphertext chunks, the last one being the MAC
+        :rtype: collections.Iterator[bytes]
+        """
+        iv, key, mac_key = self._derive_keys(ref_key, media_info)
+        cipher_encryptor = Cipher(
+            algorithms.AES(key), modes.CBC(iv), backend=default_backend()
+        ).encryptor()
+        mac = hmac.new(mac_key, iv, digestmod=hashlib.sha256)
+        size = 0
+        for chunk in self._read_chunks(source, chunk_size or self.DEFAULT_CHUNK_SIZE):
+            size += len(chunk)
+            encrypted = cipher_encryptor.update(chunk)
+            if encrypted:
+                mac.update(encrypted)
+                yield encrypted
+
+        # like encrypt, only pad when the plaintext is not block aligned. The encryptor holds the unaligned rest of
+        # the plaintext, it only needs the PKCS7 padding bytes
+        if size % 16 != 0:
+            pad = 16 - size % 16
+            encrypted = cipher_encryptor.update(bytes(bytearray([pad]) * pad)) + cipher_encryptor.finalize()
+            mac.update(encrypted)
+            yield encrypted
+        else:
+            cipher_encryptor.finalize()
+        yield mac.digest()[:self.MAC_SIZE]
+
+    def decrypt_stream(self, source, ref_key, media_info, chunk_size=None):
+        """
+        Decrypts like decrypt without holding the ciphertext or plaintext in memory. The last plaintext block is only
+        emitted after the MAC was verified, a ValueError is raised instead if it doesn't match, in which case
+        everything emitted before has to be discarded.
+        :param source: ciphertext followed by its MAC, a file-like object opened for reading in binary mode or an
+        iterable of bytes chunks
+        :type source: file | collections.Iterable[bytes]
+        :param ref_key:
+        :type ref_key: bytes
+        :param media_info: one of the INFO_ constants
+        :type media_info: bytes
+        :param chunk_size: size of the reads from a file-like source
+        :type chunk_size: int | None
+        :return: plaintext chunks
+        :rtype: collections.Iterator[bytes]
+        """
+        iv, key, mac_key = self._derive_keys(ref_key, media_info)
+        cipher_decryptor = Cipher(
+            algorithms.AES(key), modes.CBC(iv), backend=default_backend()
+        ).decryptor()
+        # holds back the last block, which carries the padding
+        unpadder = padding.PKCS7(128).unpadder()
+        mac = hmac.new(mac_key, iv, digestmod=hashlib.sha256)
+        # the last MAC_SIZE bytes seen so far, which might be the MAC
+        tail = b""
+        for chunk in self._read_chunks(source, chunk_size or self.DEFAULT_CHUNK_SIZE):
+            if len(chunk) >= self.MAC_SIZE:
+                view = memoryview(chunk)
+                ciphertexts = (tail, view[:-self.MAC_SIZE])
+                tail = bytes(view[-self.MAC_SIZE:])
+            else:
+                tail += chunk
+                ciphertexts = (tail[:-self.MAC_SIZE],)
+                tail = tail[-self.MAC_SIZE:]
+            for ciphertext in ciphertexts:
+                if len(ciphertext):
+                    mac.update(ciphertext)
+                    decrypted = unpadder.update(cipher_decryptor.update(ciphertext))
+                    if decrypted:
+                        yield decrypted
+
+        if len(tail) < self.MAC_SIZE or not hmac.compare_digest(tail, mac.digest()[:self.MAC_SIZE]):
+            raise ValueError("Invalid MAC")
+        decrypted = unpadder.update(cipher_decryptor.finalize()) + unpadder.finalize()
+        if decrypted:
+            yield decrypted
+
+    @staticmethod
+    def _derive_keys(ref_key, media_info):
+        """
+        :return: iv, cipher key and mac key
+        :rtype: tuple[bytes, bytes, bytes]
+        """
+        derived = HKDFv3().deriveSecrets(ref_key, media_info, 112)
+        parts = ByteUtil.split(derived, 16, 32)
+        return parts[0], parts[1], derived[48:80]
+
+    @staticmethod
+    def _read_chunks(source, chunk_size):
+        if hasattr(source, "read"):
+            chunk = source.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = source.read(chunk_size)
+        else:
+            for chunk in source:
+                yield chunk
@@ -1,28 +1,50 @@
-from yowsup.common.http.warequest import WARequest
 from yowsup.common.http.waresponseparser import JSONResponseParser
-import socket
+from yowsup.common.tools import MimeTools
+from yowsup.env import YowsupEnv
 import ssl
 import os
 import hashlib
 import sys
-from time import sleep
 import threading
 import logging
-from yowsup.common.tools import MimeTools
+
+try:
+    import httplib
+    from urlparse import urlparse
+except ImportError:
+    from http import client as httplib
+    from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
 
-class MediaUploader(WARequest, threading.Thread):
-    def __init__(self, jid, accountJid, sourcePath, uploadUrl, resumeOffset=0, successClbk=None, errorClbk=None, progressCallback=None, asynchronous=True):
-        WARequest.__init__(self)
+class MediaUploader(threading.Thread):
+    """
+    Uploads a file as a multipart/form-data POST to the url returned for a request upload iq. The file is streamed
+    from disk in CHUNK_SIZE reads into one reused buffer, starting at resumeOffset when the server already has the
+    beginning of it, and the JSON result is read from the HTTP response.
+    """
+    CHUNK_SIZE = 256 * 1024
+    BOUNDARY = "zzXXzzYYzzXXzzQQ"
+    # progress is only reported for files larger than this
+    PROGRESS_MIN_SIZE = 12288
+
+    def __init__(self, jid, accountJid, sourcePath, uploadUrl, resumeOffset=0, successClbk=None, errorClbk=None,
+                 progressCallback=None, asynchronous=True, sslContext=None):
+        """
+        :param sslContext: context for the TLS connection to the upload host, a default verifying one if None
+        :type sslContext: ssl.SSLContext | None
+        """
+        super(MediaUploader, self).__init__()
+        self.daemon = True
 
         self.asynchronous = asynchronous
         self.jid = jid
         self.accountJid = accountJid
         self.sourcePath = sourcePath
         self.uploadUrl = uploadUrl
-        self.resumeOffset = resumeOffset
+        self.resumeOffset = resumeOffset or 0
+        self.sslContext = sslContext
 
         self.successCallback = successClbk
         self.errorCallback = errorClbk
@@ -31,119 +53,128 @@ class MediaUploader(WARequest, threading.Thread):
         self.pvars = ["name", "type", "size", "url", "error",
                       "mimetype", "filehash", "width", "height"]
 
-        self.setParser(JSONResponseParser())
-
-        self.sock = socket.socket()
+        self.parser = JSONResponseParser()
 
     def start(self):
         if self.asynchronous:
-            threading.Thread.__init__(self)
             super(MediaUploader, self).start()
         else:
             self.run()
 
-    def run(self):
-
-        sourcePath = self.sourcePath
-        uploadUrl = self.uploadUrl
-        _host = uploadUrl.replace("https://", "")
+    def getUserAgent(self):
+        return YowsupEnv.getCurrent().getUserAgent()
 
-        self.url = _host[:_host.index('/')]
+    def createConnection(self):
+        """
+        :return: a new connection to the upload host
+        :rtype: httplib.HTTPSConnection
+        """
+        url = urlparse(self.uploadUrl)
+        return httplib.HTTPSConnection(url.hostname, url.port or 443,
+                                       context=self.sslContext or ssl.create_default_context())
 
+    def run(self):
         try:
-            filename = os.path.basename(sourcePath)
-            filetype = MimeTools.getMIME(filename)
-            filesize = os.path.getsize(sourcePath)
-
-            self.sock.connect((self.url, self.port))
-            ssl_sock = ssl.wrap_socket(self.sock)
-
-            m = hashlib.md5()
-            m.update(filename.encode())
-            crypto = m.hexdigest() + os.path.splitext(filename)[1]
-
-            boundary = "zzXXzzYYzzXXzzQQ"  # "-------" + m.hexdigest() #"zzXXzzYYzzXXzzQQ"
-            contentLength = 0
-
-            hBAOS = "--" + boundary + "\r\n"
-            hBAOS += "Content-Disposition: form-data; name=\"to\"\r\n\r\n"
-            hBAOS += self.jid + "\r\n"
-            hBAOS += "--" + boundary + "\r\n"
-            hBAOS += "Content-Disposition: form-data; name=\"from\"\r\n\r\n"
-            hBAOS += self.accountJid.replace("@whatsapp.net", "") + "\r\n"
-
-            hBAOS += "--" + boundary + "\r\n"
-            hBAOS += "Content-Disposition: form-data; name=\"file\"; filename=\"" + crypto + "\"\r\n"
-            hBAOS += "Content-Type: " + filetype + "\r\n\r\n"
-
-            fBAOS = "\r\n--" + boundary + "--\r\n"
-
-            contentLength += len(hBAOS)
-            contentLength += len(fBAOS)
-            contentLength += filesize
-
-            POST = "POST %s\r\n" % uploadUrl
-            POST += "Content-Type: multipart/form-data; boundary=" + boundary + "\r\n"
-            POST += "Host: %s\r\n" % self.url
-            POST += "User-Agent: %s\r\n" % self.getUserAgent()
-            POST += "Content-Length: " + str(contentLength) + "\r\n\r\n"
-
-            ssl_sock.write(bytearray(POST.encode()))
-            ssl_sock.write(bytearray(hBAOS.encode()))
-
-            totalsent = 0
-            buf = 1024
-            f = open(sourcePath, 'rb')
-            stream = f.read()
-            f.close()
-            status = 0
-            lastEmit = 0
-
-            while totalsent < int(filesize):
-                ssl_sock.write(stream[:buf])
-                status = totalsent * 100 / filesize
-                if lastEmit != status and status != 100 and filesize > 12288:
-                    if self.progressCallback:
-                        self.progressCallback(self.sourcePath, self.jid, uploadUrl, int(status))
-                lastEmit = status
-                stream = stream[buf:]
-                totalsent = totalsent + buf
-
-            ssl_sock.write(bytearray(fBAOS.encode()))
-
-            sleep(1)
-            data = ssl_sock.recv(8192)
-            data += ssl_sock.recv(8192)
-            data += ssl_sock.recv(8192)
-            data += ssl_sock.recv(8192)
-            data += ssl_sock.recv(8192)
-            data += ssl_sock.recv(8192)
-            data += ssl_sock.recv(8192)
-
-            if self.progressCallback:
-                self.progressCallback(self.sourcePath, self.jid, uploadUrl, 100)
-
-            lines = data.decode().splitlines()
-
-            result = None
-
-            for l in lines:
-                if l.startswith("{"):
-                    result = self.parser.parse(l, self.pvars)
-                    break
-
-            if not result:
-                raise Exception("json data not found")
-
-            if result["url"] is not None:
-                if self.successCallback:
-                    self.successCallback(sourcePath, self.jid, result["url"])
-            else:
-                logger.exception("uploadUrl: %s, result of uploading media has no url" % uploadUrl)
-                if self.errorCallback:
-                    self.errorCallback(sourcePath, self.jid, uploadUrl)
-
-        except:
-            logger.exception("Error occured at transfer %s" % sys.exc_info()[1])
+            connection = self.createConnection()
+            try:
+                result = self.upload(connection)
+            finally:
+                connection.close()
+            self.onResult(result)
+        except Exception:
+            self.onError()
+
+    def onResult(self, result):
+        """
+        :param result: parsed JSON response
+        :type result: dict
+        """
+        if result.get("url") is not None:
+            if self.successCallback:
+                self.successCallback(self.sourcePath, self.jid, result["url"])
+        else:
+            logger.error("uploadUrl: %s, result of uploading media has no url" % self.uploadUrl)
             if self.errorCallback:
-                self.errorCallback(sourcePath, self.jid, uploadUrl)
+                self.errorCallback(self.sourcePath, self.jid, self.uploadUrl)
+
+    def onError(self):
+        logger.exception("Error occured at transfer %s" % sys.exc_info()[1])
+        if self.errorCallback:
+            self.errorCallback(self.sourcePath, self.jid, self.uploadUrl)
+
+    def upload(self, connection):
+        """
+        Sends the file over connection and reads the response, leaving the connection open for another request when
+        the server allows it
+        :param connection:
+        :type connection: httplib.HTTPConnection
+        :return: parsed JSON response
+        :rtype: dict
+        """
+        url = urlparse(self.uploadUrl)
+        target = url.path + ("?" + url.query if url.query else "")
+        filename = os.path.basename(self.sourcePath)
+        filesize = os.path.getsize(self.sourcePath)
+        offset = min(self.resumeOffset, filesize)
+
+        header, footer = self._multipart(filename)
+        headers = {
+            "Content-Type": "multipart/form-data; boundary=" + self.BOUNDARY,
+            "User-Agent": self.getUserAgent(),
+            "Accept": self.parser.getMeta(),
+            "Content-Length": str(len(header) + filesize - offset + len(footer))
+        }
+        if offset:
+            headers["Content-Range"] = "bytes %d-%d/%d" % (offset, filesize - 1, filesize)
+
+        with open(self.sourcePath, "rb") as f:
+            f.seek(offset)
+            connection.request("POST", target, self._body(header, f, footer, offset, filesize), headers)
+        response = connection.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise ValueError("Upload failed with status %d %s" % (response.status, response.reason))
+
+        if self.progressCallback:
+            self.progressCallback(self.sourcePath, self.jid, self.uploadUrl, 100)
+        return self.parser.parse(data.decode(), self.pvars)
+
+    def _multipart(self, filename):
+        """
+        :return: the multipart body before and after the file's content
+        :rtype: tuple[bytes, bytes]
+        """
+        crypto = hashlib.md5(filename.encode()).hexdigest() + os.path.splitext(filename)[1]
+        header = "--" + self.BOUNDARY + "\r\n"
+        header += "Content-Disposition: form-data; name=\"to\"\r\n\r\n"
+        header += self.jid + "\r\n"
+        header += "--" + self.BOUNDARY + "\r\n"
+        header += "Content-Disposition: form-data; name=\"from\"\r\n\r\n"
+        header += self.accountJid.replace("@whatsapp.net", "") + "\r\n"
+        header += "--" + self.BOUNDARY + "\r\n"
+        header += "Content-Disposition: form-data; name=\"file\"; filename=\"" + crypto + "\"\r\n"
+        header += "Content-Type: " + MimeTools.getMIME(filename) + "\r\n\r\n"
+        footer = "\r\n--" + self.BOUNDARY + "--\r\n"
+        return header.encode(), footer.encode()
+
+    def _body(self, header, f, footer, offset, filesize):
+        """
+        Yields the request body, the file is read into a single buffer which is sent before it is reused
+        """
+        yield header
+        buf = bytearray(self.CHUNK_SIZE)
+        view = memoryview(buf)
+        sent = offset
+        lastProgress = -1
+        while True:
+            read = f.readinto(buf)
+            if not read:
+                break
+            yield view[:read]
+            sent += read
+            if self.progressCallback and filesize > self.PROGRESS_MIN_SIZE:
+                progress = sent * 100 // filesize
+                if progress != lastProgress and progress != 100:
+                    self.progressCallback(self.sourcePath, self.jid, self.uploadUrl, progress)
+                lastProgress = progress
+        yield footer
@@ -0,0 +1,131 @@
+from yowsup.common.tools import WATools
+from yowsup.layers.protocol_media.mediacache import MediaUploadCache
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class MediaUploadCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "image.jpg")
+        with open(self.path, "wb") as f:
+            f.write(os.urandom(1024))
+        self.now = 1000.0
+        self.hashed = []
+        self.cache = self.create_cache()
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def create_cache(self, path=None, **kwargs):
+        return MediaUploadCache(path, clock=lambda: self.now, hasher=self.hasher, **kwargs)
+
+    def hasher(self, path):
+        self.hashed.append(path)
+        return WATools.getFileHashForUpload(path)
+
+    def test_file_hash_is_reused(self):
+        file_hash = self.cache.get_file_hash(self.path)
+        self.assertEqual(WATools.getFileHashForUpload(self.path), file_hash)
+        self.assertEqual(file_hash, self.cache.get_file_hash(self.path))
+        self.assertEqual(1, len(self.hashed))
+        self.assertEqual(1, self.cache.get_metrics()["hashes_reused"])
+
+    def test_file_hash_after_change(self):
+        file_hash = self.cache.get_file_hash(self.path)
+        with open(self.path, "ab") as f:
+            f.write(b"x")
+        self.assertNotEqual(file_hash, self.cache.get_file_hash(self.path))
+        self.assertEqual(2, len(self.hashed))
+
+    def test_put_get(self):
+        self.assertIsNone(self.cache.get("hash", "image"))
+        self.cache.put("hash", "image", "https://mmg/1", "1.2.3.4", b"\x01" * 32, b"\x02" * 32, 1024)
+        entry = self.cache.get("hash", "image")
+        self.assertEqual(("https://mmg/1", "1.2.3.4", b"\x01" * 32, b"\x02" * 32, 1024), (
+            entry.url, entry.ip, entry.media_key, entry.file_enc_sha256, entry.file_length
+        ))
+        self.assertIsNone(self.cache.get("hash", "video"))
+        self.cache.remove("hash", "image")
+        self.assertIsNone(self.cache.get("hash", "image"))
+        metrics = self.cache.get_metrics()
+        self.assertEqual(1, metrics["hits"])
+        self.assertEqual(3, metrics["misses"])
+
+    def test_max_age(self):
+        self.cache = self.create_cache(max_age=60)
+        self.cache.put("old", "image", "https://mmg/1")
+        self.now += 30
+        self.cache.put("new", "image", "https://mmg/2")
+        self.now += 31
+        self.assertIsNone(self.cache.get("old", "image"))
+        self.assertIsNotNone(self.cache.get("new", "image"))
+        self.now += 30
+        self.cache.put("newer", "image", "https://mmg/3")
+        self.assertEqual(1, len(self.cache))
+        self.assertEqual(2, self.cache.get_metrics()["evicted_age"])
+
+    def test_least_recently_used_are_evicted(self):
+        self.cache = self.create_cache(max_entries=2)
+        self.cache.put("a", "image", "https://mmg/a")
+        self.now += 1
+        self.cache.put("b", "image", "https://mmg/b")
+        self.now += 1
+        self.cache.get("a", "image")
+        self.now += 1
+        self.cache.put("c", "image", "https://mmg/c")
+        self.assertIsNotNone(self.cache.get("a", "image"))
+        self.assertIsNone(self.cache.get("b", "image"))
+        self.assertIsNotNone(self.cache.get("c", "image"))
+        self.assertEqual(1, self.cache.get_metrics()["evicted_size"])
+
+    def test_persistence(self):
+        path = os.path.join(self.directory, "media.db")
+        self.cache = self.create_cache(path)
+        file_hash = self.cache.get_file_hash(self.path)
+        self.cache.put(file_hash, "image", "https://mmg/1", media_key=b"\x01" * 32)
+        self.cache.close()
+        self.cache = self.create_cache(path)
+        self.assertEqual(file_hash, self.cache.get_file_hash(self.path))
+        self.assertEqual(1, len(self.hashed))
+        self.assertEqual(b"\x01" * 32, self.cache.get(file_hash, "image").media_key)
+
+    def test_lookups_dont_write(self):
+        file_hash = self.cache.get_file_hash(self.path)
+        self.cache.put(file_hash, "image", "https://mmg/1")
+        changes = self.cache._db.total_changes
+        for _ in range(0, 3):
+            self.assertEqual(file_hash, self.cache.get_file_hash(self.path))
+            self.assertIsNotNone(self.cache.get(file_hash, "image"))
+        self.assertEqual(changes, self.cache._db.total_changes)
+
+    def test_last_use_written_on_close(self):
+        path = os.path.join(self.directory, "media.db")
+        self.cache = self.create_cache(path, max_entries=2)
+        self.cache.put("a", "image", "https://mmg/a")
+        self.now += 1
+        self.cache.put("b", "image", "https://mmg/b")
+        self.now += 1
+        self.cache.get("a", "image")
+        self.cache.close()
+        self.cache = self.create_cache(path, max_entries=2)
+        self.now += 1
+        self.cache.put("c", "image", "https://mmg/c")
+        self.assertIsNotNone(self.cache.get("a", "image"))
+        self.assertIsNone(self.cache.get("b", "image"))
+
+    def test_count(self):
+        path = os.path.join(self.directory, "media.db")
+        self.cache = self.create_cache(path)
+        self.cache.put("a", "image", "https://mmg/a")
+        self.cache.put("a", "image", "https://mmg/a2")
+        self.cache.put("a", "video", "https://mmg/a3")
+        self.cache.remove("a", "video")
+        self.cache.remove("a", "video")
+        self.assertEqual(1, len(self.cache))
+        self.cache.close()
+        self.cache = self.create_cache(path)
+        self.assertEqual(1, len(self.cache))
@@ -1,5 +1,7 @@
 from yowsup.layers.protocol_media.mediacipher import MediaCipher
 import base64
+import io
+import os
 import unittest
 
 
@@ -43,3 +45,38 @@ class MediaCipherTest(unittest.TestCase):
         media_key, media_plaintext, media_ciphertext = map(base64.b64decode, self.IMAGE)
         encrypted = self._cipher.encrypt(media_plaintext, media_key, MediaCipher.INFO_IMAGE)
         self.assertEqual(media_ciphertext, encrypted)
+
+    def test_streams(self):
+        media_key = base64.b64decode(self.IMAGE[0])
+        for size in (0, 1, 15, 16, 17, 1000, 4096, 100003):
+            plaintext = os.urandom(size)
+            ciphertext = self._cipher.encrypt(plaintext, media_key, MediaCipher.INFO_VIDEO)
+            for chunk_size in (1, 7, 16, 4096):
+                encrypted = b"".join(self._cipher.encrypt_stream(
+                    io.BytesIO(plaintext), media_key, MediaCipher.INFO_VIDEO, chunk_size
+                ))
+                self.assertEqual(ciphertext, encrypted)
+                if size % 16:
+                    decrypted = b"".join(self._cipher.decrypt_stream(
+                        io.BytesIO(ciphertext), media_key, MediaCipher.INFO_VIDEO, chunk_size
+                    ))
+                    self.assertEqual(plaintext, decrypted)
+
+    def test_decrypt_stream_chunks(self):
+        media_key, media_plaintext, media_ciphertext = map(base64.b64decode, self.IMAGE)
+        chunks = [media_ciphertext[i:i + 5] for i in range(0, len(media_ciphertext), 5)]
+        chunks.insert(3, b"")
+        self.assertEqual(media_plaintext, b"".join(self._cipher.decrypt_stream(chunks, media_key,
+                                                                                MediaCipher.INFO_IMAGE)))
+
+    def test_decrypt_stream_invalid_mac(self):
+        media_key, media_plaintext, media_ciphertext = map(base64.b64decode, self.IMAGE)
+        tampered = media_ciphertext[:-1] + bytes(bytearray([media_ciphertext[-1] ^ 1]))
+        decrypted = []
+        with self.assertRaises(ValueError):
+            for chunk in self._cipher.decrypt_stream(io.BytesIO(tampered), media_key, MediaCipher.INFO_IMAGE, 64):
+                decrypted.append(chunk)
+        # the final block is withheld
+        self.assertTrue(len(b"".join(decrypted)) < len(media_plaintext))
+        with self.assertRaises(ValueError):
+            list(self._cipher.decrypt_stream([media_ciphertext[:5]], media_key, MediaCipher.INFO_IMAGE))
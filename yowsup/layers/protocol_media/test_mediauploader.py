@@ -0,0 +1,176 @@
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from yowsup.layers.protocol_media.mediauploader import MediaUploader
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import ssl
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+def self_signed_certificate(directory):
+    """
+    :return: paths of a certificate for localhost and of its key
+    :rtype: tuple[str, str]
+    """
+    key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u"localhost")])
+    now = datetime.datetime.utcnow()
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(
+        key.public_key()
+    ).serial_number(x509.random_serial_number()).not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(
+        now + datetime.timedelta(days=1)
+    ).add_extension(
+        x509.SubjectAlternativeName([x509.DNSName(u"localhost")]), critical=False
+    ).sign(key, hashes.SHA256(), default_backend())
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class UploadRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        digest = hashlib.sha256()
+        body = bytearray() if self.server.keep_bodies else None
+        while length:
+            data = self.rfile.read(min(length, 256 * 1024))
+            if not data:
+                return
+            digest.update(data)
+            if body is not None:
+                body.extend(data)
+            length -= len(data)
+        self.server.uploads.append({
+            "path": self.path,
+            "content_range": self.headers.get("Content-Range"),
+            "sha256": digest.hexdigest(),
+            "body": body
+        })
+        if self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        response = json.dumps({"url": "https://localhost/m/%d" % len(self.server.uploads)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class UploadServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTPS stand-in for the media upload host, records what it receives and answers with a JSON url
+    """
+    daemon_threads = True
+
+    def __init__(self, directory, keep_bodies=True):
+        HTTPServer.__init__(self, ("localhost", 0), UploadRequestHandler)
+        self.uploads = []
+        self.keep_bodies = keep_bodies
+        # accepted connections, each one a TLS handshake
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.cert_path, key_path = self_signed_certificate(directory)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert_path, key_path)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def url(self, path="/upload/abc?x=1"):
+        return "https://localhost:%d%s" % (self.server_address[1], path)
+
+    def client_context(self):
+        return ssl.create_default_context(cafile=self.cert_path)
+
+
+class MediaUploaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = UploadServer(self.directory)
+        self.server.start()
+        self.path = os.path.join(self.directory, "image.jpg")
+        self.content = os.urandom(1024 * 1024 + 3)
+        with open(self.path, "wb") as f:
+            f.write(self.content)
+        self.results = []
+        self.errors = []
+        self.progress = []
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def upload(self, url, resumeOffset=0):
+        uploader = MediaUploader(
+            "123@s.whatsapp.net", "456@s.whatsapp.net", self.path, url, resumeOffset,
+            successClbk=lambda path, jid, url: self.results.append(url),
+            errorClbk=lambda path, jid, url: self.errors.append(url),
+            progressCallback=lambda path, jid, url, progress: self.progress.append(progress),
+            asynchronous=False, sslContext=self.server.client_context()
+        )
+        uploader.CHUNK_SIZE = 64 * 1024
+        uploader.start()
+
+    def test_upload(self):
+        self.upload(self.server.url())
+        self.assertEqual(["https://localhost/m/1"], self.results)
+        upload = self.server.uploads[0]
+        self.assertEqual("/upload/abc?x=1", upload["path"])
+        self.assertIsNone(upload["content_range"])
+        body = bytes(upload["body"])
+        self.assertTrue(body.startswith(b"--" + MediaUploader.BOUNDARY.encode()))
+        self.assertTrue(body.endswith(b"\r\n--" + MediaUploader.BOUNDARY.encode() + b"--\r\n"))
+        self.assertIn(b"name=\"to\"\r\n\r\n123@s.whatsapp.net\r\n", body)
+        self.assertIn(b"Content-Type: image/jpeg\r\n\r\n" + self.content + b"\r\n--", body)
+        self.assertEqual(sorted(set(self.progress)), self.progress)
+        self.assertEqual(100, self.progress[-1])
+        self.assertTrue(len(self.progress) > 10)
+
+    def test_resume(self):
+        self.upload(self.server.url(), resumeOffset=1000)
+        upload = self.server.uploads[0]
+        self.assertEqual("bytes 1000-%d/%d" % (len(self.content) - 1, len(self.content)), upload["content_range"])
+        self.assertIn(b"Content-Type: image/jpeg\r\n\r\n" + self.content[1000:] + b"\r\n--", bytes(upload["body"]))
+
+    def test_error(self):
+        self.upload(self.server.url().replace("localhost:", "localhost:1"))
+        self.upload(self.server.url("/missing"))
+        self.assertEqual(2, len(self.errors))
+        self.assertEqual([], self.results)
@@ -0,0 +1,152 @@
+from yowsup.layers.protocol_media.mediauploader import MediaUploader
+from yowsup.layers.protocol_media.test_mediauploader import UploadServer
+from yowsup.layers.protocol_media.uploadmanager import MediaUploadManager
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+
+class BlockingUploader(MediaUploader):
+    """
+    Waits for an event before uploading, to hold a worker
+    """
+    def __init__(self, *args, **kwargs):
+        super(BlockingUploader, self).__init__(*args, **kwargs)
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+
+    def upload(self, connection):
+        self.started.set()
+        self.proceed.wait(10)
+        return super(BlockingUploader, self).upload(connection)
+
+
+class MediaUploadManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = UploadServer(self.directory)
+        self.server.start()
+        self.path = os.path.join(self.directory, "image.jpg")
+        with open(self.path, "wb") as f:
+            f.write(os.urandom(64 * 1024))
+        self.results = []
+        self.errors = []
+        self.done = threading.Semaphore(0)
+        self.manager = None
+
+    def tearDown(self):
+        if self.manager:
+            self.manager.shutdown()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def create_manager(self, **kwargs):
+        self.manager = MediaUploadManager(ssl_context=self.server.client_context(), **kwargs)
+        return self.manager
+
+    def uploader(self, name, path="/upload", cls=MediaUploader):
+        def on_success(path, jid, url):
+            self.results.append(name)
+            self.done.release()
+
+        def on_error(path, jid, url):
+            self.errors.append(name)
+            self.done.release()
+
+        return cls("123@s.whatsapp.net", "456@s.whatsapp.net", self.path, self.server.url(path),
+                   successClbk=on_success, errorClbk=on_error)
+
+    def submit(self, uploader, priority=MediaUploadManager.PRIORITY_NORMAL):
+        self.assertTrue(self.manager.reserve(blocking=False))
+        self.manager.submit(uploader, priority)
+
+    def wait(self, count):
+        for _ in range(count):
+            self.assertTrue(self.done.acquire(timeout=10))
+
+    def test_connections_are_reused(self):
+        self.create_manager(workers=1)
+        for i in range(5):
+            self.submit(self.uploader(i))
+        self.wait(5)
+        self.assertEqual([0, 1, 2, 3, 4], self.results)
+        self.assertEqual(1, self.server.connections)
+        metrics = self.manager.get_metrics()
+        self.assertEqual(5, metrics["uploads"])
+        self.assertEqual(1, metrics["connections"])
+        self.assertEqual(4, metrics["reused_connections"])
+
+    def test_concurrency_limit(self):
+        self.create_manager(workers=2)
+        uploaders = [self.uploader(i, cls=BlockingUploader) for i in range(4)]
+        for uploader in uploaders:
+            self.submit(uploader)
+        self.assertTrue(uploaders[0].started.wait(10))
+        self.assertTrue(uploaders[1].started.wait(10))
+        self.assertFalse(uploaders[2].started.is_set())
+        self.assertEqual(2, self.manager.get_metrics()["queued"])
+        for uploader in uploaders:
+            uploader.proceed.set()
+        self.wait(4)
+        self.assertEqual(2, self.manager.get_metrics()["peak_running"])
+        self.assertEqual(2, len(self.manager._threads))
+
+    def test_priority(self):
+        self.create_manager(workers=1)
+        blocker = self.uploader("blocker", cls=BlockingUploader)
+        self.submit(blocker)
+        self.assertTrue(blocker.started.wait(10))
+        self.submit(self.uploader("low"), MediaUploadManager.PRIORITY_LOW)
+        self.submit(self.uploader("normal"))
+        self.submit(self.uploader("high"), MediaUploadManager.PRIORITY_HIGH)
+        blocker.proceed.set()
+        self.wait(4)
+        self.assertEqual(["blocker", "high", "normal", "low"], self.results)
+
+    def test_backpressure(self):
+        self.create_manager(workers=1, max_pending=2)
+        blocker = self.uploader("blocker", cls=BlockingUploader)
+        self.submit(blocker)
+        self.assertTrue(self.manager.reserve(blocking=False))
+        self.assertFalse(self.manager.reserve(blocking=False))
+        self.assertFalse(self.manager.reserve(timeout=0.01))
+        self.manager.release()
+        blocker.proceed.set()
+        self.wait(1)
+        self.assertTrue(self.manager.reserve(timeout=10))
+        self.assertTrue(self.manager.reserve(timeout=10))
+
+    def test_error(self):
+        self.create_manager(workers=1)
+        self.submit(self.uploader("missing", "/missing"))
+        self.submit(self.uploader("found"))
+        self.wait(2)
+        self.assertEqual(["missing"], self.errors)
+        self.assertEqual(["found"], self.results)
+        metrics = self.manager.get_metrics()
+        self.assertEqual(1, metrics["failed"])
+        self.assertEqual(2, metrics["connections"])
+
+    def test_closed_idle_connection_is_replaced(self):
+        self.create_manager(workers=1)
+        self.submit(self.uploader(0))
+        self.wait(1)
+        for connections in self.manager._idle.values():
+            for connection in connections:
+                connection.sock.close()
+        self.submit(self.uploader(1))
+        self.wait(1)
+        self.assertEqual([0, 1], self.results)
+        self.assertEqual([], self.errors)
+        self.assertEqual(2, self.manager.get_metrics()["connections"])
+
+    def test_shutdown(self):
+        self.create_manager(workers=2)
+        for i in range(3):
+            self.submit(self.uploader(i))
+        self.manager.shutdown()
+        self.assertEqual(3, len(self.results))
+        self.assertEqual({}, self.manager._idle)
+        self.assertRaises(RuntimeError, self.manager.submit, self.uploader(3))
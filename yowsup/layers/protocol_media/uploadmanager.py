@@ -0,0 +1,208 @@
+from yowsup.layers.protocol_media.mediauploader import MediaUploader
+import heapq
+import itertools
+import socket
+import ssl
+import threading
+
+try:
+    import httplib
+    from urlparse import urlparse
+except ImportError:
+    from http import client as httplib
+    from urllib.parse import urlparse
+
+
+class MediaUploadManager(object):
+    """
+    Runs MediaUploaders on a bounded pool of worker threads instead of a thread each, in priority order, keeping the
+    connections to upload hosts open between uploads.
+
+    Submitters take a slot with reserve before requesting an upload url and the slot is given back once the upload
+    is done, so at most max_pending uploads are requested, queued or running at any time and reserve blocks or fails
+    when they are all taken.
+    """
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 10
+    PRIORITY_LOW = 20
+
+    DEFAULT_WORKERS = 4
+    DEFAULT_MAX_PENDING = 64
+
+    def __init__(self, workers=None, max_pending=None, max_idle_connections=None, ssl_context=None):
+        """
+        :param workers: number of uploads running at once
+        :type workers: int | None
+        :param max_pending: number of uploads reserved, queued or running at once
+        :type max_pending: int | None
+        :param max_idle_connections: connections kept open per upload host while not in use, workers if None
+        :type max_idle_connections: int | None
+        :param ssl_context: context for uploaders that don't have their own, a default verifying one if None
+        :type ssl_context: ssl.SSLContext | None
+        """
+        self._workers = workers or self.DEFAULT_WORKERS
+        self._max_idle_connections = max_idle_connections or self._workers
+        self._ssl_context = ssl_context
+        self._slots = threading.BoundedSemaphore(max_pending or self.DEFAULT_MAX_PENDING)
+        self._lock = threading.Condition(threading.Lock())
+        self._queue = []  # heap of (priority, sequence, uploader)
+        self._sequence = itertools.count()
+        self._threads = []
+        self._idle = {}  # type: dict[tuple[str, int], list[httplib.HTTPSConnection]]
+        self._running = 0
+        self._stopped = False
+        self._metrics = {
+            "uploads": 0,
+            "failed": 0,
+            "connections": 0,
+            "reused_connections": 0,
+            "peak_running": 0
+        }
+
+    def get_metrics(self):
+        """
+        :return: counts of finished and failed uploads, connections (TCP+TLS handshakes) opened and reused, the
+        highest number of uploads that ran at once, and the current number of queued and running uploads
+        :rtype: dict[str, int]
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["queued"] = len(self._queue)
+            metrics["running"] = self._running
+        return metrics
+
+    def reserve(self, blocking=True, timeout=None):
+        """
+        Takes a slot for an upload that is about to be submitted
+        :param blocking: whether to wait for a slot when all are taken
+        :type blocking: bool
+        :param timeout: seconds to wait at most when blocking
+        :type timeout: float | None
+        :return: whether a slot was taken
+        :rtype: bool
+        """
+        if not blocking:
+            return self._slots.acquire(False)
+        if timeout is None:
+            return self._slots.acquire()
+        return self._slots.acquire(True, timeout)
+
+    def release(self):
+        """
+        Gives back a reserved slot which won't be used for an upload
+        """
+        self._slots.release()
+
+    def submit(self, uploader, priority=PRIORITY_NORMAL):
+        """
+        Queues an upload for a slot taken with reserve. The uploader's callbacks are called from a worker thread.
+        :param uploader:
+        :type uploader: MediaUploader
+        :param priority: lower runs first, uploads of the same priority run in submission order
+        :type priority: int
+        """
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("MediaUploadManager was shut down")
+            heapq.heappush(self._queue, (priority, next(self._sequence), uploader))
+            if len(self._threads) < self._workers and len(self._queue) > len(self._threads) - self._running:
+                thread = threading.Thread(target=self._work, name="MediaUploadWorker-%d" % len(self._threads))
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+            self._lock.notify()
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once the queued uploads are done and closes idle connections
+        :param wait: whether to wait for the workers to finish
+        :type wait: bool
+        """
+        with self._lock:
+            self._stopped = True
+            self._lock.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopped:
+                    self._lock.wait()
+                if not self._queue:
+                    return
+                _, _, uploader = heapq.heappop(self._queue)
+                self._running += 1
+                self._metrics["peak_running"] = max(self._metrics["peak_running"], self._running)
+            try:
+                self._run(uploader)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._slots.release()
+
+    def _run(self, uploader):
+        url = urlparse(uploader.uploadUrl)
+        host = (url.hostname, url.port or 443)
+        connection = None
+        try:
+            connection, reused = self._get_connection(host, uploader)
+            try:
+                result = uploader.upload(connection)
+            except (httplib.HTTPException, socket.error):
+                if not reused:
+                    raise
+                # the host closed the idle connection in the meantime
+                connection.close()
+                connection = self._new_connection(host, uploader)
+                result = uploader.upload(connection)
+        except Exception:
+            if connection is not None:
+                connection.close()
+            with self._lock:
+                self._metrics["failed"] += 1
+            uploader.onError()
+            return
+        self._put_connection(host, connection)
+        with self._lock:
+            self._metrics["uploads"] += 1
+        uploader.onResult(result)
+
+    def _get_connection(self, host, uploader):
+        """
+        :return: an idle connection to host if there is one, a new one otherwise, and whether it was idle
+        :rtype: tuple[httplib.HTTPSConnection, bool]
+        """
+        with self._lock:
+            connections = self._idle.get(host)
+            if connections:
+                self._metrics["reused_connections"] += 1
+                return connections.pop(), True
+        return self._new_connection(host, uploader), False
+
+    def _new_connection(self, host, uploader):
+        with self._lock:
+            if self._ssl_context is None and uploader.sslContext is None:
+                self._ssl_context = ssl.create_default_context()
+            self._metrics["connections"] += 1
+        connection = httplib.HTTPSConnection(host[0], host[1], context=uploader.sslContext or self._ssl_context)
+        connection.connect()
+        return connection
+
+    def _put_connection(self, host, connection):
+        # http.client drops the socket when the response asked to close the connection
+        if connection.sock is None:
+            return
+        with self._lock:
+            connections = self._idle.setdefault(host, [])
+            if len(connections) < self._max_idle_connections and not self._stopped:
+                connections.append(connection)
+                return
+        connection.close()
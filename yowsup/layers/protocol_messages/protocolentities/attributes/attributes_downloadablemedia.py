@@ -1,7 +1,6 @@
 from yowsup.layers.protocol_messages.protocolentities.attributes.attributes_media import MediaAttributes
-from yowsup.common.tools import MimeTools
+from yowsup.common.tools import MimeTools, WATools
 import base64
-import hashlib
 import os
 
 
@@ -68,8 +67,7 @@ class DownloadableMediaMessageAttributes(MediaAttributes):
         mimetype = MimeTools.getMIME(filepath) if mimetype is None else mimetype
         file_length = os.path.getsize(filepath) if file_length is None else file_length
         if file_sha256 is None:
-            with open(filepath, 'rb') as f:
-                file_sha256 = hashlib.sha256(f.read()).digest()
+            file_sha256 = WATools.getFileDigests(filepath)["sha256"]
         return DownloadableMediaMessageAttributes(
             mimetype, file_length, file_sha256, url, media_key, context_info
         )
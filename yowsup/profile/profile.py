@@ -31,7 +31,7 @@ class YowProfile(object):
 
     def _load_axolotl_manager(self):
         # type: () -> AxolotlManager
-        return AxolotlManagerFactory().get_manager(self._profile_name, self.username)
+        return AxolotlManagerFactory().get_manager(self._profile_name, self.username, self.config.axolotl_store)
 
     def write_config(self, config):
         # type: (Config) -> None
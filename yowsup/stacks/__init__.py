@@ -1,4 +1,5 @@
 from .yowstack import YowStack, YowStackBuilder
+from .host import YowStackHost, YowStackUsage
 
 from yowsup.layers.auth                        import YowAuthenticationProtocolLayer
 from yowsup.layers.coder                       import YowCoderLayer
@@ -0,0 +1,242 @@
+from yowsup.layers import YowLayerEvent
+from yowsup.layers.network import YowNetworkLayer
+from yowsup.layers.noise.layer import YowNoiseLayer
+from yowsup.stacks.yowstack import YowStack, YowStackBuilder
+import asyncio
+import gc
+import inspect
+import logging
+import sys
+import threading
+import time
+import types
+
+logger = logging.getLogger(__name__)
+
+
+class YowStackUsage(object):
+    def __init__(self, name, cpu_time, callbacks, memory):
+        """
+        :param name: name the stack was added with
+        :type name: str
+        :param cpu_time: seconds of CPU time spent on the host loop on behalf of the stack
+        :type cpu_time: float
+        :param callbacks: number of callbacks run on behalf of the stack
+        :type callbacks: int
+        :param memory: approximate number of bytes of python objects only reachable through the stack
+        :type memory: int
+        """
+        self.name = name
+        self.cpu_time = cpu_time
+        self.callbacks = callbacks
+        self.memory = memory
+
+    def __str__(self):
+        return "YowStackUsage(name=%s, cpu_time=%.3fs, callbacks=%d, memory=%dKiB)" % (
+            self.name, self.cpu_time, self.callbacks, self.memory // 1024
+        )
+
+
+class _HostedStack(object):
+    def __init__(self, name, stack, loop):
+        self.name = name
+        self.stack = stack  # type: YowStack
+        self.cpu_time = 0.0
+        self.callbacks = 0
+        self._loop = loop
+
+    def run(self, fn, *args):
+        start = time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            self.cpu_time += time.thread_time() - start
+            self.callbacks += 1
+
+    def wrap(self, fn):
+        return lambda *args: self.run(fn, *args)
+
+    def execDetached(self, fn, delay=0):
+        if delay > 0:
+            self._loop.call_soon_threadsafe(self._loop.call_later, delay, self.run, fn)
+        else:
+            self._loop.call_soon_threadsafe(self.run, fn)
+
+
+class YowStackHost(object):
+    """
+    Runs many YowStack instances in one process on a single asyncio event loop.
+
+    Every added stack uses the asyncio connection dispatcher on the host's loop, and its detached callbacks are run
+    by the same loop instead of by YowStack.loop, so hosting N accounts takes one thread rather than a socket loop and
+    a polling loop per account. Stacks keep their own props and detached queues. CPU time spent on the loop is
+    accounted to the stack it was spent for, see getUsage.
+    """
+    def __init__(self, loop=None):
+        """
+        :param loop: event loop to host the stacks on, a new one is created if not supplied
+        :type loop: asyncio.AbstractEventLoop | None
+        """
+        self._loop = loop or asyncio.new_event_loop()
+        self._stacks = {}  # type: dict[str, _HostedStack]
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def getEventLoop(self):
+        return self._loop
+
+    def createStack(self, name, profile, layers=(), props=None):
+        """
+        Builds a default stack with the given layers on top, for the given profile, and adds it to the host
+        :param name:
+        :type name: str
+        :param profile:
+        :type profile: str | YowProfile
+        :param layers: layers to push on top of the default layers
+        :type layers: tuple
+        :param props:
+        :type props: dict | None
+        :return:
+        :rtype: YowStack
+        """
+        builder = YowStackBuilder().pushDefaultLayers()
+        for layer in layers:
+            builder.push(layer)
+        for key, value in (props or {}).items():
+            builder.setProp(key, value)
+        stack = builder.build()
+        stack.setProfile(profile)
+        return self.addStack(name, stack)
+
+    def addStack(self, name, stack):
+        """
+        :param name: unique name of the stack within this host, e.g. the account's phone number
+        :type name: str
+        :param stack:
+        :type stack: YowStack
+        :return:
+        :rtype: YowStack
+        """
+        with self._lock:
+            if name in self._stacks:
+                raise ValueError("A stack named %s is already hosted" % name)
+            hosted = _HostedStack(name, stack, self._loop)
+            self._stacks[name] = hosted
+
+        stack.setProp(YowNetworkLayer.PROP_DISPATCHER, YowNetworkLayer.DISPATCHER_ASYNCIO)
+        stack.setProp(YowNetworkLayer.PROP_EVENT_LOOP, self._loop)
+        # no handshake worker thread per account, handshakes run on the loop as server segments arrive
+        stack.setProp(YowNoiseLayer.PROP_HANDSHAKE_MODE, YowNoiseLayer.HANDSHAKE_MODE_INLINE)
+        stack.setDetachedExecutor(hosted.execDetached)
+
+        network_layer = stack.getLayer(0)
+        if isinstance(network_layer, YowNetworkLayer):
+            # account received data and the work it triggers up the stack to this stack
+            network_layer.onRecvData = hosted.wrap(network_layer.onRecvData)
+        return stack
+
+    def removeStack(self, name):
+        """
+        Stops hosting the stack, it must have been disconnected first
+        :param name:
+        :type name: str
+        :return: the removed stack
+        :rtype: YowStack
+        """
+        with self._lock:
+            hosted = self._stacks.pop(name)
+        hosted.stack.setDetachedExecutor(None)
+        return hosted.stack
+
+    def getStack(self, name):
+        return self._stacks[name].stack
+
+    def getStackNames(self):
+        return list(self._stacks.keys())
+
+    def connect(self, name=None):
+        """
+        :param name: stack to connect, all stacks are connected if not given
+        :type name: str | None
+        """
+        self._broadcast(name, YowLayerEvent(YowNetworkLayer.EVENT_STATE_CONNECT))
+
+    def disconnect(self, name=None, reason=None):
+        """
+        :param name: stack to disconnect, all stacks are disconnected if not given
+        :type name: str | None
+        """
+        self._broadcast(name, YowLayerEvent(YowNetworkLayer.EVENT_STATE_DISCONNECT, reason=reason))
+
+    def _broadcast(self, name, event):
+        with self._lock:
+            targets = [self._stacks[name]] if name is not None else list(self._stacks.values())
+        for hosted in targets:
+            self._loop.call_soon_threadsafe(hosted.run, hosted.stack.broadcastEvent, event)
+
+    def start(self):
+        """
+        Runs the host loop in a background thread
+        """
+        if self._thread is not None:
+            raise RuntimeError("Host is already started")
+        self._thread = threading.Thread(target=self.loop, name="YowStackHost")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def loop(self):
+        """
+        Runs the host loop in the current thread until stop is called
+        """
+        logger.debug("Running host loop for %d stacks" % len(self._stacks))
+        self._loop.run_forever()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def getUsage(self, name=None, memory=True):
+        """
+        :param name: stack to report, all stacks are reported if not given
+        :type name: str | None
+        :param memory: whether to measure memory, which walks every object reachable through each stack
+        :type memory: bool
+        :return:
+        :rtype: list[YowStackUsage]
+        """
+        with self._lock:
+            targets = [self._stacks[name]] if name is not None else list(self._stacks.values())
+            others = [hosted.stack for hosted in self._stacks.values()]
+
+        usage = []
+        for hosted in targets:
+            size = self._measure_memory(hosted.stack, [stack for stack in others if stack is not hosted.stack]) \
+                if memory else 0
+            usage.append(YowStackUsage(hosted.name, hosted.cpu_time, hosted.callbacks, size))
+        return usage
+
+    def _measure_memory(self, root, boundaries):
+        """
+        Sums the sizes of the objects reachable from root, without descending into other stacks, the host, its loop,
+        or shared definitions like modules, classes and functions. This approximates the memory a stack keeps alive;
+        memory held outside the python heap, e.g. by sqlite, is not included.
+        """
+        stop = set(id(o) for o in boundaries)
+        stop.update((id(self), id(self._loop), id(self._stacks)))
+        seen = set()
+        pending = [root]
+        total = 0
+        while pending:
+            obj = pending.pop()
+            if id(obj) in seen or id(obj) in stop:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                                types.CodeType, threading.Thread, asyncio.AbstractEventLoop)) \
+                    or inspect.isframe(obj):
+                continue
+            total += sys.getsizeof(obj, 0)
+            pending.extend(gc.get_referents(obj))
+        return total
@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+from yowsup.layers import YowLayer
+from yowsup.layers.network import YowNetworkLayer
+from yowsup.layers.noise.layer import YowNoiseLayer
+from yowsup.stacks import YowStack
+from yowsup.stacks.host import YowStackHost
+
+
+class RecordingLayer(YowLayer):
+    def __init__(self):
+        super(RecordingLayer, self).__init__()
+        self.received = []
+        self.threads = []
+
+    def receive(self, data):
+        self.received.append(data)
+        self.threads.append(threading.current_thread())
+
+
+class YowStackHostTest(unittest.TestCase):
+    def setUp(self):
+        self.host = YowStackHost()
+        self.stacks = [
+            self.host.addStack("account%d" % i, YowStack((RecordingLayer, YowNetworkLayer)))
+            for i in range(0, 3)
+        ]
+
+    def tearDown(self):
+        self.host.stop()
+        self.host.getEventLoop().close()
+
+    def test_props_isolated(self):
+        self.stacks[0].setProp("key", "value")
+        self.assertEqual("value", self.stacks[0].getProp("key"))
+        self.assertIsNone(self.stacks[1].getProp("key"))
+        for stack in self.stacks:
+            self.assertEqual(YowNetworkLayer.DISPATCHER_ASYNCIO, stack.getProp(YowNetworkLayer.PROP_DISPATCHER))
+            self.assertIs(self.host.getEventLoop(), stack.getProp(YowNetworkLayer.PROP_EVENT_LOOP))
+            self.assertEqual(YowNoiseLayer.HANDSHAKE_MODE_INLINE, stack.getProp(YowNoiseLayer.PROP_HANDSHAKE_MODE))
+
+    def test_detached_runs_on_host_loop(self):
+        done = threading.Event()
+        ran = []
+
+        def callback():
+            ran.append(threading.current_thread())
+            done.set()
+
+        self.host.start()
+        self.stacks[1].execDetached(callback)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(1, len(ran))
+        self.assertIsNot(threading.current_thread(), ran[0])
+        usage = dict((u.name, u) for u in self.host.getUsage(memory=False))
+        self.assertEqual(1, usage["account1"].callbacks)
+        self.assertEqual(0, usage["account0"].callbacks)
+
+    def test_detached_later(self):
+        done = threading.Event()
+        self.host.start()
+        start = time.monotonic()
+        self.stacks[0].execDetachedLater(0.05, done.set)
+        self.assertTrue(done.wait(5))
+        self.assertTrue(time.monotonic() - start >= 0.05)
+
+    def test_stack_detached_queues_isolated(self):
+        stack_a, stack_b = YowStack((RecordingLayer,)), YowStack((RecordingLayer,))
+        ran = []
+        stack_a.execDetached(lambda: ran.append("a"))
+        stack_b.execDetached(lambda: ran.append("b"))
+        self.assertEqual(1, stack_a._YowStack__detachedQueue.qsize())
+        self.assertEqual(1, stack_b._YowStack__detachedQueue.qsize())
+
+    def test_usage(self):
+        for i, stack in enumerate(self.stacks):
+            for _ in range(0, i + 1):
+                stack.getLayer(0).onRecvData(b"data")
+        self.stacks[2].getLayer(1).received.extend([bytearray(1024) for _ in range(0, 100)])
+        usage = dict((u.name, u) for u in self.host.getUsage())
+        self.assertEqual([1, 2, 3], [usage["account%d" % i].callbacks for i in range(0, 3)])
+        self.assertEqual([b"data"] * 3, self.stacks[2].getLayer(1).received[:3])
+        self.assertTrue(usage["account2"].memory > usage["account0"].memory + 100 * 1024)
+        self.assertTrue(usage["account0"].memory < 1024 * 1024)
+
+    def test_duplicate_and_remove(self):
+        self.assertRaises(ValueError, self.host.addStack, "account0", YowStack((RecordingLayer,)))
+        stack = self.host.removeStack("account0")
+        self.assertIs(self.stacks[0], stack)
+        self.assertEqual(["account1", "account2"], sorted(self.host.getStackNames()))
@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+from yowsup.layers import YowLayer, YowParallelLayer
+from yowsup.stacks import YowStack
+
+
+class YowStackLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.stack = YowStack((YowLayer,))
+
+    def start_loop(self):
+        thread = threading.Thread(target=self.stack.loop)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_timeout(self):
+        start = time.monotonic()
+        self.stack.loop(timeout=0.05)
+        self.assertTrue(0.05 <= time.monotonic() - start < 1)
+
+    def test_stop(self):
+        ran = []
+        self.stack.execDetached(lambda: ran.append(1))
+        self.stack.execDetached(lambda: ran.append(2))
+        self.stack.stop()
+        self.stack.execDetached(lambda: ran.append(3))
+        self.stack.loop(timeout=5)
+        self.assertEqual([1, 2], ran)
+
+    def test_scheduled(self):
+        ran = []
+        self.stack.execDetachedLater(0.06, lambda: ran.append(3))
+        self.stack.execDetachedLater(0.02, lambda: ran.append(2))
+        self.stack.execDetachedLater(0.2, self.stack.stop)
+        self.stack.execDetached(lambda: ran.append(1))
+        start = time.monotonic()
+        self.stack.loop(timeout=5)
+        self.assertTrue(time.monotonic() - start < 1)
+        self.assertEqual([1, 2, 3], ran)
+
+    def test_detached_latency(self):
+        thread = self.start_loop()
+        latencies = []
+        for _ in range(0, 200):
+            done = threading.Event()
+            sent = time.monotonic()
+            self.stack.execDetached(lambda: (latencies.append(time.monotonic() - sent), done.set()))
+            self.assertTrue(done.wait(1))
+        self.stack.stop()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        latencies.sort()
+        self.assertTrue(latencies[len(latencies) // 2] < 0.001, "median latency %.6fs" % latencies[100])
+
+
+class SinkLayer(YowLayer):
+    def __init__(self):
+        super(SinkLayer, self).__init__()
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+class RaisingLayer(YowLayer):
+    def send(self, data):
+        raise ValueError(data)
+
+
+class YowStackSingleThreadedTest(unittest.TestCase):
+    def test_single_threaded(self):
+        stack = YowStack((YowLayer, YowParallelLayer((YowLayer,)), YowLayer, SinkLayer))
+        stack.setSingleThreaded(True)
+        self.assertTrue(all(stack.getLayer(i).lock is None for i in range(0, 4)))
+        self.assertTrue(all(sublayer.lock is None for sublayer in stack.getLayer(2).sublayers))
+        stack.send(b"data")
+        self.assertEqual([b"data"], stack.getLayer(0).sent)
+
+        stack.setSingleThreaded(False)
+        stack.send(b"more")
+        self.assertEqual([b"data", b"more"], stack.getLayer(0).sent)
+        self.assertFalse(stack.getLayer(1).lock.locked())
+
+    def test_lock_released_on_error(self):
+        stack = YowStack((YowLayer, RaisingLayer))
+        self.assertRaises(ValueError, stack.send, b"data")
+        self.assertFalse(stack.getLayer(1).lock.locked())
@@ -25,10 +25,10 @@ from yowsup.common.constants import YowConstants
 from yowsup.layers.axolotl import AxolotlSendLayer, AxolotlControlLayer, AxolotlReceivelayer
 from yowsup.profile.profile import YowProfile
 import inspect
-try:
-    import Queue
-except ImportError:
-    import queue as Queue
+import heapq
+import itertools
+import threading
+import queue
 logger = logging.getLogger(__name__)
 
 YOWSUP_PROTOCOL_LAYERS_BASIC = (
@@ -63,7 +63,7 @@ class YowStackBuilder(object):
         return self
 
     def build(self):
-        return YowStack(self.layers, reversed = False, props = self._props)
+        return YowStack(self.layers, reversed = False, props = dict(self._props))
 
     @staticmethod
     def getDefaultLayers(groups = True, media = True, privacy = True, profiles = True):
@@ -123,11 +123,16 @@ class YowStackBuilder(object):
 class YowStack(object):
     __stack = []
     __stackInstances = []
-    __detachedQueue = Queue.Queue()
+    __STOP = object()
     def __init__(self, stackClassesArr = None, reversed = True, props = None):
         stackClassesArr = stackClassesArr or ()
         self.__stack = stackClassesArr[::-1] if reversed else stackClassesArr
         self.__stackInstances = []
+        self.__detachedQueue = queue.Queue()
+        self._detachedExecutor = None
+        self._scheduled = []  # heap of (due time, sequence, callback)
+        self._scheduledLock = threading.Lock()
+        self._scheduledSequence = itertools.count()
         self._props = props or {}
 
         self.setProp(YowNetworkLayer.PROP_ENDPOINT, YowConstants.ENDPOINTS[random.randint(0,len(YowConstants.ENDPOINTS)-1)])
@@ -187,17 +192,96 @@ class YowStack(object):
         if not self.__stackInstances[-1].onEvent(yowLayerEvent):
             self.__stackInstances[-1].broadcastEvent(yowLayerEvent)
 
+    def setSingleThreaded(self, singleThreaded):
+        """
+        Declares that the stack's data and events are only ever handled on one thread, e.g. the thread of YowStackHost's
+        loop with sends from other threads scheduled through execDetached. Layers then pass data down without taking
+        their locks.
+        :param singleThreaded:
+        :type singleThreaded: bool
+        """
+        for inst in self.__stackInstances:
+            inst.setSingleThreaded(singleThreaded)
+
+    def setDetachedExecutor(self, executor):
+        """
+        :param executor: callable taking a callback and a delay in seconds, used instead of this stack's own loop to
+        run detached callbacks
+        :type executor: callable | None
+        """
+        self._detachedExecutor = executor
+
     def execDetached(self, fn):
-        self.__class__.__detachedQueue.put(fn)
+        if self._detachedExecutor is not None:
+            self._detachedExecutor(fn, 0)
+        else:
+            self.__detachedQueue.put(fn)
 
-    def loop(self, *args, **kwargs):
+    def execDetachedLater(self, delay, fn):
+        """
+        Runs fn from the stack's loop once delay seconds have passed
+        :param delay:
+        :type delay: float
+        :param fn:
+        :type fn: callable
+        """
+        if self._detachedExecutor is not None:
+            self._detachedExecutor(fn, delay)
+        else:
+            with self._scheduledLock:
+                heapq.heappush(self._scheduled, (time.monotonic() + delay, next(self._scheduledSequence), fn))
+            # wakes up the loop so it waits for the new due time
+            self.__detachedQueue.put(None)
+
+    def stop(self):
+        """
+        Makes loop return once it is done with the callbacks queued before this call
+        """
+        self.__detachedQueue.put(self.__STOP)
+
+    def loop(self, timeout=None):
+        """
+        Runs detached and scheduled callbacks as they become due until stop is called
+        :param timeout: seconds after which to return if stop was not called, loops indefinitely if None
+        :type timeout: float | None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
         while True:
+            wait = self._runScheduled()
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                wait = remaining if wait is None else min(wait, remaining)
             try:
-                callback = self.__class__.__detachedQueue.get(False) #doesn't block
-                callback()
-            except Queue.Empty:
-                pass
-            time.sleep(0.1)
+                callback = self.__detachedQueue.get(True, wait)
+            except queue.Empty:
+                continue
+            while True:
+                if callback is self.__STOP:
+                    return
+                if callback is not None:
+                    callback()
+                try:
+                    callback = self.__detachedQueue.get(False)
+                except queue.Empty:
+                    break
+
+    def _runScheduled(self):
+        """
+        Runs the scheduled callbacks that are due
+        :return: seconds until the next scheduled callback is due, None if there is none
+        :rtype: float | None
+        """
+        while True:
+            with self._scheduledLock:
+                if not self._scheduled:
+                    return None
+                wait = self._scheduled[0][0] - time.monotonic()
+                if wait > 0:
+                    return wait
+                _, _, callback = heapq.heappop(self._scheduled)
+            callback()
 
     def _construct(self):
         logger.debug("Initializing stack")